@@ -12,6 +12,8 @@ from stacks.s3.bucket import S3Bucket
 from stacks.apigateway.apis import ApiGatewayApisStack
 from stacks.lambdas.image_processing import LambdaImageProcessingStack
 from stacks.cognito.userpool import CognitoUserPoolStack
+from stacks.layers.runtime_layer import LambdaRuntimeLayerStack
+from stacks.cloudfront.result_delivery_stack import ResultDeliveryStack
 
 app = cdk.App()
 
@@ -35,11 +37,22 @@ ddb_tables = DDBTables(app, "DDBTables")
 # S3 Stacks
 s3_stack = S3Bucket(app, "S3Bucket")
 
+# Create the shared Lambda runtime layer Stack
+lambda_runtime_layer_stack = LambdaRuntimeLayerStack(app, "AmazonBedrockGalleryLambdaRuntimeLayerStack")
+
+# Create the CloudFront Stack for signed result delivery (optional)
+result_delivery_stack = None
+if app.node.try_get_context("result_cdn_enabled"):
+    result_delivery_stack = ResultDeliveryStack(app, "AmazonBedrockGalleryResultDeliveryStack")
+
 # Create the ApiGateway Stack
-api_gateway_apis_stack = ApiGatewayApisStack(app, "AmazonBedrockGalleryApiGatewayStack")
+api_gateway_apis_stack = ApiGatewayApisStack(app, "AmazonBedrockGalleryApiGatewayStack",
+                                             runtime_layer=lambda_runtime_layer_stack.runtime_layer,
+                                             result_delivery=result_delivery_stack)
 
 # Create the ImageProcessing Lambda Stack
-lambda_image_processing_stack = LambdaImageProcessingStack(app, "AmazonBedrockGalleryLambdaImageProcessingStack")
+lambda_image_processing_stack = LambdaImageProcessingStack(app, "AmazonBedrockGalleryLambdaImageProcessingStack",
+                                                           runtime_layer=lambda_runtime_layer_stack.runtime_layer)
 
 # Create the Cognito UserPool Stack
 cognito_user_pool_stack = CognitoUserPoolStack(app, "AmazonBedrockGalleryCognitoUserPoolStack")
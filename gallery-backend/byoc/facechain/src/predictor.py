@@ -1,28 +1,72 @@
 from flask import Flask, request, jsonify
+import base64
 import boto3
 import subprocess
 import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import argparse
 from modelscope.outputs import OutputKeys
 from modelscope.pipelines import pipeline
+from modelscope.version import __version__ as modelscope_version
 
 app = Flask(__name__)
 s3_client = boto3.client('s3')
 
+# Templates (base images) downloaded and analysed ahead of the inference, on a prefetch hint from
+# put-image: the template's detected face is stored next to it (see cached_template_face), so the
+# inference skips the template-side detection. Template keys are never overwritten, so a cached
+# file stays valid; the least recently used templates are removed beyond TEMPLATE_CACHE_SIZE
+TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR', '/opt/program/workspace/template-cache')
+TEMPLATE_CACHE_SIZE = int(os.environ.get('TEMPLATE_CACHE_SIZE', '64'))
+template_prefetcher = ThreadPoolExecutor(max_workers=2)
+# Held while a template is downloaded, analysed or fused; eviction skips templates whose lock is held
+template_locks = {}
+template_locks_lock = threading.Lock()
+# The prefetch threads and the request threads share one model (and GPU): one of them uses it at a time
+model_lock = threading.Lock()
+
 IMAGE_FACE_FUSION = pipeline('face_fusion_torch',
                                 model='damo/cv_unet_face_fusion_torch', 
                                 model_revision='v1.0.3')
+# fuse_faces and analyse_template mirror the model internals of this modelscope release only
+MIRRORED_MODELSCOPE_VERSION = '1.9.5'
+
+def face_fusion(user_path, template_path, output_path, user_landmarks=None):
+    """Fuse the user's face into the template; returns the fields for the facechain_inference stage record.
 
-def face_fusion(user_path, template_path, output_path):               
-    result = IMAGE_FACE_FUSION(dict(template=template_path, user=user_path))
-    print(f"face_fusion result: {result}")
+    With the mirrored release the template's face comes from the template cache and the
+    user's from user_landmarks when given, so only what is missing is detected; otherwise,
+    or when the mirror fails, the stock pipeline detects both faces.
+    """
+    output_img = None
+    stage_fields = {'landmarks_used': False, 'template_face_cached': False}
+    if modelscope_version != MIRRORED_MODELSCOPE_VERSION:
+        stage_fields['fusion_fallback'] = f"modelscope {modelscope_version} is not {MIRRORED_MODELSCOPE_VERSION}"
+    else:
+        try:
+            template_face, stage_fields['template_face_cached'] = cached_template_face(template_path)
+            with model_lock:
+                output_img = fuse_faces(template_path, user_path, template_face, user_landmarks)
+            stage_fields['landmarks_used'] = bool(user_landmarks)
+        except Exception as e:
+            # Whatever broke in the mirror, the pipeline's own detection is always a valid fallback
+            stage_fields['fusion_fallback'] = f"{type(e).__name__}: {e}"
+            print(f"fusion with the cached template face or given landmarks failed, detecting them: {e}")
+    if output_img is None:
+        with model_lock:
+            result = IMAGE_FACE_FUSION(dict(template=template_path, user=user_path))
+        print(f"face_fusion result: {result}")
+        output_img = result[OutputKeys.OUTPUT_IMG]
     
     # 출력 디렉토리 생성
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     
     # 디버깅을 위한 추가 정보 출력
-    output_img = result[OutputKeys.OUTPUT_IMG]
     print(f"Output image shape: {output_img.shape}")
     print(f"Output image dtype: {output_img.dtype}")
     print(f"Output path permissions: {oct(os.stat(os.path.dirname(output_path)).st_mode)[-3:]}")
@@ -35,6 +79,121 @@ def face_fusion(user_path, template_path, output_path):
     if not os.path.exists(output_path):
         raise RuntimeError(f"Image file was not created at {output_path}")
     print(f"output_path size: {os.path.getsize(output_path)}")
+    return stage_fields
+
+def analyse_template(template_path):
+    """The template's face as ImageFaceFusion.inference detects it: {'f5p', 'fw', 'fh'}, or None without a face.
+
+    f5p are its five points in pixels, fw and fh the size of its box (used by the enhancement).
+    """
+    from modelscope.models.cv.image_face_fusion.facelib.align_trans import get_f5p
+
+    with model_lock:
+        template_img = IMAGE_FACE_FUSION.preprocess(template_path, template_path)['template']
+        landmark_template, fw, fh = IMAGE_FACE_FUSION.model.detect_face(template_img)
+    if landmark_template is None:
+        return None
+    f5p_template = get_f5p(landmark_template, template_img[:, :, ::-1])
+    return {
+        'f5p': [[float(x), float(y)] for x, y in f5p_template],
+        'fw': float(fw),
+        'fh': float(fh)
+    }
+
+def template_face_path(template_path):
+    return f"{template_path}.face.json"
+
+def cached_template_face(template_path):
+    """The template's analysed face, from next to the cached template or analysed now and stored there.
+
+    Returns (face, whether it came from the cache).
+    """
+    path = template_face_path(template_path)
+    if os.path.exists(path):
+        with open(path) as file:
+            return json.load(file)['face'], True
+
+    face = analyse_template(template_path)
+    temporary_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(temporary_path, "w") as file:
+        json.dump({'face': face}, file)
+    os.replace(temporary_path, path)
+    return face, False
+
+def fuse_faces(template_path, user_path, template_face, user_landmarks=None):
+    """IMAGE_FACE_FUSION's inference with the template's face analysed ahead and, optionally, the user's given.
+
+    template_face is what analyse_template returned. user_landmarks are [x, y] ratios of the
+    user image: the eye on the image's left, the other eye, the nose and the two mouth corners
+    from left to right (the order of get_f5p); without them the user's face is detected.
+    Mirrors ImageFaceFusion.inference of damo/cv_unet_face_fusion_torch in modelscope
+    MIRRORED_MODELSCOPE_VERSION; only the detections it is given are skipped. Called with
+    model_lock held.
+    """
+    import numpy as np
+    import torch
+    from modelscope.models.cv.image_face_fusion.facelib.align_trans import (get_f5p, get_reference_facial_points,
+                                                                            warp_and_crop_face)
+    from modelscope.models.cv.image_face_fusion.network.ops import warp_affine_torch
+
+    model = IMAGE_FACE_FUSION.model
+    images = IMAGE_FACE_FUSION.preprocess(template_path, user_path)
+    template_img, user_img = images['template'], images['user']
+    if template_face is None:
+        print('No face detected in template image!')
+        return template_img
+
+    if user_landmarks:
+        user_h, user_w, _ = user_img.shape
+        f5p_user = [[x * user_w, y * user_h] for x, y in user_landmarks]
+    else:
+        landmark_source, _, _ = model.detect_face(user_img)
+        if landmark_source is None:
+            print('No face detected in user image!')
+            return template_img
+        f5p_user = get_f5p(landmark_source, user_img[:, :, ::-1])
+
+    ori_h, ori_w, _ = template_img.shape
+    f5p_template, fw, fh = template_face['f5p'], template_face['fw'], template_face['fh']
+
+    with torch.no_grad():
+        Xs_embeds, Xs = model.extract_id(user_img, f5p_user)
+        Xt, trans_inv = warp_and_crop_face(
+            template_img,
+            f5p_template,
+            reference_pts=get_reference_facial_points(default_square=True),
+            crop_size=(256, 256),
+            return_trans_inv=True)
+        trans_inv = torch.from_numpy(trans_inv.astype(np.float32)).to(model.device)
+        Xt_raw = model.image_transform(template_img, is_norm=False)
+        Xt = model.image_transform(Xt)
+
+        kp_fuse, kp_t = model.compute_3d_params(Xs, Xt)
+        Yt, _, _ = model.netG(Xt, Xs_embeds, kp_fuse, kp_t)
+        Yt = torch.clamp(Yt * 0.5 + 0.5, 0, 1)
+
+        Yt_trans_inv = warp_affine_torch(Yt, trans_inv, (ori_h, ori_w))
+        mask_ = warp_affine_torch(model.mask, trans_inv, (ori_h, ori_w))
+        Yt_trans_inv = mask_ * Yt_trans_inv + (1 - mask_) * Xt_raw
+        Yt_trans_inv = Yt_trans_inv.squeeze().permute(1, 2, 0).cpu().numpy().astype(np.float32)
+        out_img = Yt_trans_inv[:, :, ::-1] * 255.
+        out_img = model.process_enhance(out_img, f5p_template, fh, fw)
+
+    return out_img.astype(np.uint8)
+
+def emit_stage(correlation_id, stage, started_at, **properties):
+    # Same record shape as gallery_runtime.metrics in the Lambdas, so the latency report can join on correlationId
+    finished_at = time.time()
+    record = {
+        'record': 'pipeline_stage',
+        'correlationId': correlation_id,
+        'Stage': stage,
+        'startedAt': started_at,
+        'finishedAt': finished_at,
+        'StageDuration': round((finished_at - started_at) * 1000, 3)
+    }
+    record.update(properties)
+    print(json.dumps(record), flush=True)
 
 @app.route('/ping', methods=['GET'])
 def ping():
@@ -45,36 +204,63 @@ def ping():
 
 @app.route('/invocations', methods=['POST'])
 def invocations():
+    started_at = time.time()
     input_data = request.get_json(force=True)
 
+    # SageMaker only routes /invocations, so the prefetch hint is a request type of its own
+    if input_data.get('action') == 'prefetch':
+        template_prefetcher.submit(prefetch_template, input_data['uuid'], input_data['bucket'], input_data['target'])
+        return jsonify({'action': 'prefetch', 'target': input_data['target']})
+
     uuid = input_data['uuid']
     bucket = input_data['bucket']
     source_object_key = input_data['source']
     target_object_key = input_data['target']
     output_object_key = input_data['output']
     source_path = f"/opt/program/workspace/source/{uuid}.png"
-    target_path = f"/opt/program/workspace/target/{uuid}.png"
     output_path = f"/opt/program/workspace/output/{uuid}.png"
 
-    fetch_images(bucket, source_object_key, source_path, target_object_key, target_path)
+    # Fused face-crop requests carry the source face inline (base64), so only the template is downloaded
+    source_bytes = base64.b64decode(input_data['source_bytes']) if input_data.get('source_bytes') else None
+    # The five points face-crop detected, relative to the source image; the face is detected here without them
+    source_landmarks = input_data.get('source_landmarks')
+    template_cached = os.path.exists(template_cache_path(bucket, target_object_key))
+    # The template stays in the cache until the fusion has read it
+    with template_lock(template_cache_path(bucket, target_object_key)):
+        target_path = fetch_images(bucket, source_object_key, source_path, target_object_key, source_bytes)
+        fetched_at = time.time()
 
-    process_images(source_path, target_path, output_path)
-    print("process_images finished")
+        fusion_fields = process_images(source_path, target_path, output_path, source_landmarks)
+        print("process_images finished")
+        processed_at = time.time()
 
-    s3_client.upload_file(output_path, bucket, output_object_key)
+    # The job metadata travels with the result, so face-swap-completion reads it from the object
+    s3_client.upload_file(output_path, bucket, output_object_key,
+                          ExtraArgs={'Metadata': input_data['metadata']} if input_data.get('metadata') else None)
     print("upload_file finished")
+    uploaded_at = time.time()
 
-    remove_all_files(source_path, target_path, output_path)
+    remove_all_files(source_path, output_path)
     print("remove_all_files finished")
 
+    emit_stage(uuid, 'facechain_inference', started_at,
+               fetch_ms=round((fetched_at - started_at) * 1000, 3),
+               inline_source=source_bytes is not None,
+               template_cached=template_cached,
+               source_landmarks=bool(source_landmarks),
+               **fusion_fields,
+               fusion_ms=round((processed_at - fetched_at) * 1000, 3),
+               upload_ms=round((uploaded_at - processed_at) * 1000, 3))
+
+    input_data.pop('source_bytes', None)
     return jsonify(input_data)
 
 
-def fetch_images(bucket, source_object_key, source_path, target_object_key, target_path):
+def fetch_images(bucket, source_object_key, source_path, target_object_key, source_bytes=None):
+    """Write the source face to source_path and return the local path of the template."""
     print(f"fetch_images called")
 
-    source_image = get_s3_image(bucket, source_object_key)
-    target_image = get_s3_image(bucket, target_object_key)
+    source_image = source_bytes if source_bytes is not None else get_s3_image(bucket, source_object_key)
 
     os.makedirs(os.path.dirname(source_path), exist_ok=True)
     with open(source_path, "wb") as file:
@@ -84,26 +270,92 @@ def fetch_images(bucket, source_object_key, source_path, target_object_key, targ
     if os.path.exists(source_path):
         print(f"source_path size: {os.path.getsize(source_path)}")
 
-    os.makedirs(os.path.dirname(target_path), exist_ok=True)
-    with open(target_path, "wb") as file:
-        file.write(target_image)
+    target_path = cached_template(bucket, target_object_key)
+    print(f"target_path size: {os.path.getsize(target_path)}")
+    return target_path
+
+
+def template_cache_path(bucket, object_key):
+    name = hashlib.sha1(f"{bucket}/{object_key}".encode('utf-8')).hexdigest()
+    return os.path.join(TEMPLATE_CACHE_DIR, name + os.path.splitext(object_key)[1])
+
+
+def template_lock(path):
+    """The lock of a cached template; reentrant, so a thread holding it can still call cached_template."""
+    with template_locks_lock:
+        return template_locks.setdefault(path, threading.RLock())
+
+
+def cached_template(bucket, object_key):
+    """The local copy of a template, downloaded and checked to decode on first use."""
+    path = template_cache_path(bucket, object_key)
+    # One download per template, even when the prefetch and the inference ask at the same time
+    with template_lock(path):
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+
+        os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(get_s3_image(bucket, object_key))
+        if cv2.imread(temporary_path) is None:
+            os.remove(temporary_path)
+            raise ValueError(f"Template {object_key} is not a readable image")
+        os.replace(temporary_path, path)
+
+    evict_templates(keep=path)
+    return path
+
+
+def prefetch_template(uuid, bucket, object_key):
+    started_at = time.time()
+    try:
+        path = template_cache_path(bucket, object_key)
+        template_face_found = None
+        with template_lock(path):
+            cached_template(bucket, object_key)
+            if modelscope_version == MIRRORED_MODELSCOPE_VERSION:
+                template_face, _ = cached_template_face(path)
+                template_face_found = template_face is not None
+        emit_stage(uuid, 'facechain_template_prefetch', started_at, template_face_found=template_face_found)
+    except Exception as e:
+        print(f"prefetch of {object_key} failed: {e}")
+
 
-    # if file is exists in target_path, then print file size
-    if os.path.exists(target_path):
-        print(f"target_path size: {os.path.getsize(target_path)}")
+def evict_templates(keep=None):
+    """Remove the least recently used templates beyond TEMPLATE_CACHE_SIZE, except keep and those in use."""
+    paths = [os.path.join(TEMPLATE_CACHE_DIR, name) for name in os.listdir(TEMPLATE_CACHE_DIR)
+             if not name.endswith(('.tmp', '.face.json'))]
+    if len(paths) <= TEMPLATE_CACHE_SIZE:
+        return
+    paths.sort(key=os.path.getmtime)
+    for path in paths[:len(paths) - TEMPLATE_CACHE_SIZE]:
+        lock = template_lock(path)
+        # A held lock means a prefetch or an inference is about to read the template; it goes next time
+        if path == keep or not lock.acquire(blocking=False):
+            continue
+        try:
+            for evicted_path in (path, template_face_path(path)):
+                try:
+                    os.remove(evicted_path)
+                except OSError:
+                    pass
+        finally:
+            lock.release()
 
 
-def process_images(source_path, target_path, output_path):
+def process_images(source_path, target_path, output_path, source_landmarks=None):
     print(f"process_images called")
     print(f"source_path: {source_path}")
     print(f"target_path: {target_path}")
     print(f"output_path: {output_path}")
-    face_fusion(source_path, target_path, output_path)
+    return face_fusion(source_path, target_path, output_path, source_landmarks)
 
 
-def remove_all_files(source_path, target_path, output_path):
+def remove_all_files(source_path, output_path):
+    # The template stays in the template cache
     os.remove(source_path)
-    os.remove(target_path)
     os.remove(output_path)
 
 
@@ -0,0 +1,93 @@
+import json
+import os
+import time
+from typing import Dict, Any, List
+from gallery_runtime.clients import get_client
+from gallery_runtime.ddb import unmarshall_item
+from gallery_runtime.delivery import image_url
+from gallery_runtime.display_images import image_object_key, parse_size
+from gallery_runtime.responses import create_response
+
+BUCKET_NAME = os.environ.get('BUCKET_NAME')
+DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_TABLE_NAME = os.environ.get('DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_TABLE_NAME')
+MAX_USER_IDS = 100  # BatchGetItem accepts at most 100 keys per request
+MAX_UNPROCESSED_RETRIES = 5
+
+def batch_get_display_items(user_ids: List[str]) -> List[Dict[str, Any]]:
+    request_items = {
+        DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_TABLE_NAME: {
+            'Keys': [{'PK': {'S': f'#USERID#{user_id}'}} for user_id in user_ids]
+        }
+    }
+    items = []
+
+    # BatchGetItem may return part of the keys as UnprocessedKeys when throttled; retry them with backoff
+    for attempt in range(MAX_UNPROCESSED_RETRIES + 1):
+        response = get_client('dynamodb').batch_get_item(RequestItems=request_items)
+        items.extend(response.get('Responses', {}).get(DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_TABLE_NAME, []))
+
+        request_items = response.get('UnprocessedKeys')
+        if not request_items:
+            return items
+        if attempt < MAX_UNPROCESSED_RETRIES:
+            time.sleep(0.05 * (2 ** attempt))
+
+    raise Exception(f"Could not resolve all display items after {MAX_UNPROCESSED_RETRIES} retries")
+
+def to_image_element(item: Dict[str, Any], size: str) -> Dict[str, Any]:
+    return {
+        'imageUrl': image_url(BUCKET_NAME, image_object_key(item, size)),
+        'story': item.get('base_story'),
+        'theme': item.get('theme'),
+        'gender': item.get('gender'),
+        'skin': item.get('skin'),
+        'uuid': item.get('uuid'),
+        'userId': item.get('userId')
+    }
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    if event['httpMethod'] == 'OPTIONS':
+        return create_response(200, {})
+
+    if event['httpMethod'] != 'POST':
+        return create_response(405, {'error': f"{event['httpMethod']} Methods are not allowed."})
+
+    try:
+        body = event.get('body')
+        if body is None:
+            return create_response(400, {'error': 'Bad Request: Body is required.'})
+
+        if isinstance(body, str):
+            body = json.loads(body)
+
+        user_ids = body.get('userIds')
+        if not isinstance(user_ids, list) or not user_ids or not all(isinstance(user_id, str) and user_id for user_id in user_ids):
+            return create_response(400, {'error': 'Bad Request: userIds must be a non-empty list of strings.'})
+
+        # full (default), display or thumbnail
+        try:
+            size = parse_size(body.get('size'))
+        except ValueError as e:
+            return create_response(400, {'error': f'Bad Request: {str(e)}'})
+
+        # BatchGetItem rejects duplicate keys, so keep the first occurrence of each userId
+        user_ids = list(dict.fromkeys(user_ids))
+        if len(user_ids) > MAX_USER_IDS:
+            return create_response(400, {'error': f'Bad Request: at most {MAX_USER_IDS} userIds are allowed.'})
+
+        items = batch_get_display_items(user_ids)
+
+        # The display table key is #USERID#{user_id}; older items may not carry the userId attribute
+        images_by_user_id = {}
+        for item in map(unmarshall_item, items):
+            user_id = item['PK'][len('#USERID#'):]
+            item.setdefault('userId', user_id)
+            images_by_user_id[user_id] = to_image_element(item, size)
+
+        return create_response(200, {
+            'images': [images_by_user_id[user_id] for user_id in user_ids if user_id in images_by_user_id],
+            'missing': [user_id for user_id in user_ids if user_id not in images_by_user_id]
+        })
+
+    except Exception as e:
+        return create_response(500, {'error': f'Internal server error: {str(e)}'})
@@ -0,0 +1,129 @@
+import base64
+import binascii
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+from gallery_runtime import feed
+from gallery_runtime.clients import get_client
+from gallery_runtime.ddb import unmarshall_item
+from gallery_runtime.delivery import image_url
+from gallery_runtime.display_images import image_object_key, parse_size
+from gallery_runtime.responses import create_response
+
+BUCKET_NAME = os.environ.get('BUCKET_NAME')
+DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_HISTORY_TABLE_NAME = os.environ.get('DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_HISTORY_TABLE_NAME')
+FEED_INDEX_NAME = 'feed-created_at-index'
+THEME_FEED_INDEX_NAME = 'theme-created_at-index'
+# Off until the theme index is deployed, see display_history_theme_index
+THEME_FEED_ENABLED = os.environ.get('THEME_FEED_ENABLED', 'false').lower() == 'true'
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+
+_shard_queries = ThreadPoolExecutor(max_workers=8)
+
+def encode_cursor(position: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not position:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """The position of a cursor: a theme feed's LastEvaluatedKey, or {'shards': ...} for the feed over all results."""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError('cursor is malformed.')
+    if not isinstance(position, dict) or ('PK' not in position and not isinstance(position.get('shards'), dict)):
+        raise ValueError('cursor is malformed.')
+    return position
+
+def query_feed(page_size: int, positions: Dict[str, Optional[Dict[str, Any]]]):
+    """The newest page_size items over the feed shards at positions, and the positions after them."""
+    def query_shard(feed_key):
+        query_params = {
+            'TableName': DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_HISTORY_TABLE_NAME,
+            'IndexName': FEED_INDEX_NAME,
+            'KeyConditionExpression': 'feed = :feed',
+            'ExpressionAttributeValues': {':feed': {'S': feed_key}},
+            'ScanIndexForward': False,
+            # Any one shard may hold the whole page
+            'Limit': page_size
+        }
+        if positions[feed_key]:
+            query_params['ExclusiveStartKey'] = positions[feed_key]
+        return feed_key, get_client('dynamodb').query(**query_params)
+
+    responses = dict(_shard_queries.map(query_shard, positions))
+    return feed.merge_pages(responses, positions, page_size)
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    if event['httpMethod'] == 'OPTIONS':
+        return create_response(200, {})
+
+    if event['httpMethod'] != 'GET':
+        return create_response(405, {'error': f"{event['httpMethod']} Methods are not allowed."})
+
+    try:
+        query_parameters = event.get('queryStringParameters') or {}
+        theme = query_parameters.get('theme')
+        cursor = query_parameters.get('cursor')
+        if theme and not THEME_FEED_ENABLED:
+            return create_response(400, {'error': 'Bad Request: the feed cannot be filtered by theme yet.'})
+        try:
+            size = parse_size(query_parameters.get('size'))
+        except ValueError as e:
+            return create_response(400, {'error': f'Bad Request: {str(e)}'})
+
+        try:
+            page_size = int(query_parameters.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return create_response(400, {'error': 'Bad Request: limit must be an integer.'})
+        if page_size < 1 or page_size > MAX_PAGE_SIZE:
+            return create_response(400, {'error': f'Bad Request: limit must be between 1 and {MAX_PAGE_SIZE}.'})
+
+        try:
+            position = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return create_response(400, {'error': f'Bad Request: {str(e)}'})
+        if position and (bool(theme) != ('PK' in position) or not set(position.get('shards', {})) <= set(feed.feed_keys())):
+            return create_response(400, {'error': 'Bad Request: cursor does not belong to this feed.'})
+
+        # Query the newest results first, either within a single theme or across every theme
+        if theme:
+            query_params = {
+                'TableName': DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_HISTORY_TABLE_NAME,
+                'IndexName': THEME_FEED_INDEX_NAME,
+                'KeyConditionExpression': 'theme = :theme',
+                'ExpressionAttributeValues': {':theme': {'S': theme}},
+                'ScanIndexForward': False,
+                'Limit': page_size
+            }
+            if position:
+                query_params['ExclusiveStartKey'] = position
+            response = get_client('dynamodb').query(**query_params)
+            page_items, next_position = response['Items'], response.get('LastEvaluatedKey')
+        else:
+            positions = position['shards'] if position else dict.fromkeys(feed.feed_keys())
+            page_items, next_positions = query_feed(page_size, positions)
+            next_position = {'shards': next_positions} if next_positions else None
+
+        items = []
+        for item in map(unmarshall_item, page_items):
+            items.append({
+                'imageUrl': image_url(BUCKET_NAME, image_object_key(item, size)),
+                'story': item.get('base_story'),
+                'theme': item.get('theme'),
+                'gender': item.get('gender'),
+                'skin': item.get('skin'),
+                'uuid': item.get('uuid'),
+                'userId': item.get('userId'),
+                'createdAt': item.get('created_at')
+            })
+
+        return create_response(200, {
+            'items': items,
+            'nextCursor': encode_cursor(next_position)
+        })
+
+    except Exception as e:
+        return create_response(500, {'error': f'Internal server error: {str(e)}'})
@@ -0,0 +1,55 @@
+import os
+from typing import Dict, Any
+from gallery_runtime.clients import get_client
+from gallery_runtime.ddb import unmarshall_item
+from gallery_runtime.job_status import USER_JOBS_INDEX_NAME, STAGE_ATTRIBUTES, current_stage, remaining_seconds
+from gallery_runtime.responses import create_response
+
+DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME = os.environ.get('DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME')
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    if event['httpMethod'] == 'OPTIONS':
+        return create_response(200, {})
+
+    if event['httpMethod'] != 'GET':
+        return create_response(405, {'error': f"{event['httpMethod']} Methods are not allowed."})
+
+    try:
+        path_parameters = event.get('pathParameters') or {}
+        user_id = path_parameters.get('userId')
+
+        if not user_id:
+            return create_response(400, {'error': 'Bad Request: userId is required.'})
+
+        # The user's latest job, from the index only (it projects the status and stage timestamps)
+        response = get_client('dynamodb').query(
+            TableName=DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME,
+            IndexName=USER_JOBS_INDEX_NAME,
+            KeyConditionExpression='userId = :user_id',
+            ExpressionAttributeValues={':user_id': {'S': user_id}},
+            ScanIndexForward=False,
+            Limit=1
+        )
+
+        if not response['Items']:
+            return create_response(404, {'error': 'Job not found'})
+
+        item = unmarshall_item(response['Items'][0])
+        stage, stage_started_at = current_stage(item)
+
+        return create_response(200, {
+            'userId': user_id,
+            'jobId': item['PK'].replace('#UUID#', '', 1),
+            'stage': stage,
+            'stageStartedAt': stage_started_at,
+            # Entries written before the quality gate existed have no status
+            'status': item.get('status', 'PENDING'),
+            'reason': item.get('status_reason'),
+            'stages': {name: item[attribute] for name, attribute in STAGE_ATTRIBUTES.items() if item.get(attribute)},
+            # None once the job is completed or rejected
+            'etaSeconds': remaining_seconds(stage, stage_started_at),
+            'updatedAt': item.get('updated_at')
+        })
+
+    except Exception as e:
+        return create_response(500, {'error': f'Internal server error: {str(e)}'})
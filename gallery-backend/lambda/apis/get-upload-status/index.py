@@ -0,0 +1,49 @@
+import os
+from typing import Dict, Any
+from gallery_runtime.clients import get_client
+from gallery_runtime.ddb import unmarshall_item
+from gallery_runtime.responses import create_response
+
+DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME = os.environ.get('DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME')
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    if event['httpMethod'] == 'OPTIONS':
+        return create_response(200, {})
+    
+    if event['httpMethod'] != 'GET':
+        return create_response(405, {'error': f"{event['httpMethod']} Methods are not allowed."})
+    
+    try:
+        # jobId is the image object name put-image returned with the upload URL
+        path_parameters = event.get('pathParameters') or {}
+        job_id = path_parameters.get('jobId')
+
+        if not job_id:
+            return create_response(400, {'error': 'Bad Request: jobId is required.'})
+        
+        # Strongly consistent, so a status face-crop has just written is never missed
+        response = get_client('dynamodb').get_item(
+            TableName=DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME,
+            Key={
+                'PK': {'S': f'#UUID#{job_id}'}
+            },
+            ProjectionExpression='#status, status_reason, updated_at',
+            ExpressionAttributeNames={'#status': 'status'},
+            ConsistentRead=True
+        )
+        
+        if not response.get('Item'):
+            return create_response(404, {'error': 'Job not found'})
+
+        item = unmarshall_item(response['Item'])
+
+        return create_response(200, {
+            'jobId': job_id,
+            # Entries written before the quality gate existed have no status
+            'status': item.get('status', 'PENDING'),
+            'reason': item.get('status_reason'),
+            'updatedAt': item.get('updated_at')
+        })
+
+    except Exception as e:
+        return create_response(500, {'error': f'Internal server error: {str(e)}'})
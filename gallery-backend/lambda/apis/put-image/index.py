@@ -1,45 +1,64 @@
-import boto3
 import json
+import time
 import uuid
 import os
 from datetime import datetime
 from typing import Dict, Any
 import random
+from concurrent.futures import ThreadPoolExecutor
+from gallery_runtime.clients import get_client
+from gallery_runtime.ddb import marshall_item, unmarshall_item
+from gallery_runtime.facechain import send_template_prefetch
+from gallery_runtime.job_metadata import presigned_post_metadata
+from gallery_runtime.metrics import emit_stage
+from gallery_runtime.responses import create_response
 
-s3_client = boto3.client('s3')
-ddb_client = boto3.client('dynamodb')
 BUCKET_NAME = os.environ['BUCKET_NAME']
 OBJECT_PATH = os.environ['OBJECT_PATH']
 DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME = os.environ['DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME']
 DDB_AMAZON_BEDROCK_GALLERY_BASE_RESOURCE_TABLE_NAME = os.environ['DDB_AMAZON_BEDROCK_GALLERY_BASE_RESOURCE_TABLE_NAME']
+MAX_UPLOAD_SIZE = 2 * 1024 * 1024  # 2MB
+MAX_UPLOAD_WIDTH = 1280
+MAX_UPLOAD_HEIGHT = 1280
+UPLOAD_CONTENT_TYPE = 'image/jpeg'
+# Template prefetch hint: the FaceChain endpoint downloads and analyses the base image while the user
+# takes the photo. The hint reaches whichever instance SageMaker picks; with several instances or
+# variants (face swaps are routed by load only when they start) it may warm another one than the job's
+FACECHAIN_TEMPLATE_PREFETCH = os.environ.get('FACECHAIN_TEMPLATE_PREFETCH', 'false').lower() == 'true'
+FACECHAIN_SAGEMAKER_ENDPOINT_NAME = os.environ.get('FACECHAIN_SAGEMAKER_ENDPOINT_NAME')
 
-def create_response(status_code: int, body: Dict[str, Any]) -> Dict[str, Any]:
-    return {
-        'statusCode': status_code,
-        'body': json.dumps(body),
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-            'Access-Control-Allow-Methods': 'OPTIONS,GET,POST'
-        }
-    }
+_prefetch_hints = ThreadPoolExecutor(max_workers=2)
 
 def generate_image_ojbect_name(uuid: str, user_id: str, theme: str, gender: str, skin: str) -> str:
     current_time = datetime.now().strftime("%Y%m%d%S")
     return f"{current_time}-{user_id}-{theme}-{gender}-{skin}-{uuid}"
 
-def generate_presigned_url(object_key: str) -> str:
-    return s3_client.generate_presigned_url(
-        'put_object',
-        Params={
-            'Bucket': BUCKET_NAME, 
-            'Key': object_key, 
-            'ContentType': 'image/jpeg'
+def generate_presigned_post(object_key: str, metadata_fields: Dict[str, str]) -> Dict[str, Any]:
+    # The POST policy lets S3 reject oversized or non-JPEG uploads before they reach the pipeline.
+    # It also pins the job metadata, which the pipeline stages read instead of the process table
+    return get_client('s3').generate_presigned_post(
+        Bucket=BUCKET_NAME,
+        Key=object_key,
+        Fields={
+            'Content-Type': UPLOAD_CONTENT_TYPE,
+            **metadata_fields
         },
-        ExpiresIn='300'
+        Conditions=[
+            {'Content-Type': UPLOAD_CONTENT_TYPE},
+            ['content-length-range', 1, MAX_UPLOAD_SIZE],
+            *({name: value} for name, value in metadata_fields.items())
+        ],
+        ExpiresIn=300
     )
 
+def send_prefetch_hint(image_object_name: str, base_image_object_key: str) -> None:
+    try:
+        send_template_prefetch(FACECHAIN_SAGEMAKER_ENDPOINT_NAME, image_object_name, BUCKET_NAME, base_image_object_key)
+    except Exception as e:
+        # Only an optimization: without it (or when the endpoint is busy and the call times out)
+        # the template is downloaded at inference time, as before
+        print(f"Template prefetch hint for {image_object_name} failed: {str(e)}")
+
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if event['httpMethod'] == 'OPTIONS':
         return create_response(200, {})
@@ -47,6 +66,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if event['httpMethod'] != 'POST':
         return create_response(405, {'error': f"{event['httpMethod']} Methods are not allowed."})
     
+    started_at = time.time()
     try:
         # request body parse (if body is string, decode json)
         body = event.get('body')
@@ -67,7 +87,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return create_response(400, {'error': 'Bad Request: userId, theme, gender and skin values are required.'})
         
         # get random base resource
-        ddb_response = ddb_client.query(
+        ddb_response = get_client('dynamodb').query(
             TableName=DDB_AMAZON_BEDROCK_GALLERY_BASE_RESOURCE_TABLE_NAME,
             KeyConditionExpression="#pk = :pk",
             ExpressionAttributeNames={
@@ -81,34 +101,55 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if not ddb_response['Items']:
             raise Exception(f"Could not find image with theme({theme}) and gender({gender}) and skin({skin})")
         
-        random_item = random.choice(ddb_response['Items'])
+        random_item = unmarshall_item(random.choice(ddb_response['Items']))
         
         # unique image name create
         unique_id = str(uuid.uuid4())[:8]
-        # uuid and userId and theme info to ddb with proper DynamoDB types
+        # uuid and userId and theme info to ddb
         image_object_name = generate_image_ojbect_name(unique_id, user_id, theme, gender, skin)
-        ddb_client.put_item(
+        # Sent alongside the table write and the presigning below. The prefetch client's timeouts bound
+        # the hint, so it is always finished before the response and never left in flight across a freeze
+        prefetch_hint = None
+        if FACECHAIN_TEMPLATE_PREFETCH:
+            prefetch_hint = _prefetch_hints.submit(send_prefetch_hint, image_object_name, random_item['base_image_object_key'])
+        job = {
+            'userId': user_id,
+            'theme': theme,
+            'gender': gender,
+            'skin': skin,
+            'base_image_object_key': random_item['base_image_object_key'],
+            'base_story': random_item['story']
+        }
+        get_client('dynamodb').put_item(
             TableName=DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME,
-            Item={
-                'PK': {'S': f'#UUID#{image_object_name}'},
-                'userId': {'S': user_id},
-                'theme': {'S': theme},
-                'gender': {'S': gender},
-                'skin': {'S': skin},
-                'base_image_object_key': {'S': random_item['base_image_object_key']['S']},
-                'base_story': {'S': random_item['story']['S']},
-                'updated_at': {"S": datetime.now().isoformat()},
-                'created_at': {"S": datetime.now().isoformat()}
-            }
+            Item=marshall_item({
+                'PK': f'#UUID#{image_object_name}',
+                **job,
+                # face-crop moves this to ACCEPTED or REJECTED_*, see get-upload-status
+                'status': 'PENDING',
+                'updated_at': datetime.now().isoformat(),
+                'created_at': datetime.now().isoformat()
+            })
         )
 
         # userId and theme info to path (OBJECT_PATH is the default path on S3)
         image_object_key = os.path.join(OBJECT_PATH, f'{image_object_name}.jpeg')
-        image_upload_presigned_url = generate_presigned_url(image_object_key)
+        image_upload_presigned_post = generate_presigned_post(image_object_key, presigned_post_metadata(job))
+
+        if prefetch_hint is not None:
+            prefetch_hint.result()
+
+        # The object name is the correlation ID every later stage recovers from its S3 key
+        emit_stage(image_object_name, 'upload_issued', started_at, user_id=user_id, theme=theme)
 
         return create_response(200, {
             'uuid': unique_id,
-            'uploadUrl': image_upload_presigned_url
+            'jobId': image_object_name,
+            'uploadUrl': image_upload_presigned_post['url'],
+            'uploadFields': image_upload_presigned_post['fields'],
+            'maxUploadSize': MAX_UPLOAD_SIZE,
+            'maxUploadWidth': MAX_UPLOAD_WIDTH,
+            'maxUploadHeight': MAX_UPLOAD_HEIGHT
         })
 
     except Exception as e:
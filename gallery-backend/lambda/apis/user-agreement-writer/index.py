@@ -0,0 +1,28 @@
+import json
+from gallery_runtime import agreements
+
+def lambda_handler(event, context):
+    """Write the agreements the user-agreement API queued, in batches.
+
+    Messages with the same idempotency key (a resubmitted agreement or a redelivered
+    message) become one write. Messages whose item stays unprocessed are returned as
+    batchItemFailures, so only they are retried.
+    """
+    items, message_ids, failed_message_ids = {}, {}, []
+    for message in event.get('Records', []):
+        try:
+            body = json.loads(message['body'])
+            key, item = body['idempotencyKey'], body['item']
+        except (ValueError, KeyError) as e:
+            print(f"Invalid agreement message {message['messageId']}: {type(e).__name__}")
+            failed_message_ids.append(message['messageId'])
+            continue
+        items[key] = item
+        message_ids.setdefault(key, []).append(message['messageId'])
+
+    unprocessed_keys = agreements.write_agreements(items)
+    for key in unprocessed_keys:
+        failed_message_ids += message_ids[key]
+
+    print(f'Wrote {len(items) - len(unprocessed_keys)} of {len(items)} agreements')
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failed_message_ids]}
@@ -0,0 +1,170 @@
+import os
+import threading
+from io import BytesIO
+from PIL import Image
+from gallery_runtime.clients import get_client
+
+MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5MB
+DETECTION_MAX_SIZE = 1280  # longest side of the proxy image sent to Rekognition
+EXIF_ORIENTATION_TAG = 0x0112
+
+# Face detection backends. detect() takes an UploadImage and returns Rekognition-style
+# FaceDetails: a BoundingBox with Left/Top/Width/Height ratios of the image, a Confidence
+# in percent and, when the backend provides them, Landmarks.
+
+def is_rekognition_ready(image, image_content):
+    """Whether the uploaded bytes can go to Rekognition unchanged as the detection proxy.
+
+    Rekognition applies the EXIF orientation before it computes bounding boxes, so
+    rotated uploads are re-encoded to keep the boxes in the pixel layout we crop.
+    """
+    return (
+        image.format == 'JPEG'
+        and image.mode in ('RGB', 'L')
+        and max(image.size) <= DETECTION_MAX_SIZE
+        and len(image_content) <= MAX_IMAGE_SIZE
+        and image.getexif().get(EXIF_ORIENTATION_TAG, 1) == 1
+    )
+
+def proxy_size(image, max_size):
+    """The size of at most max_size pixels per side with the aspect ratio of image."""
+    ratio = min(1.0, max_size / max(image.size))
+    return (max(1, round(image.width * ratio)), max(1, round(image.height * ratio)))
+
+def detection_proxy_image(image, image_content, max_size=DETECTION_MAX_SIZE):
+    """A reduced RGB/L copy of at most max_size pixels per side, with the original's aspect ratio."""
+    detection_size = proxy_size(image, max_size)
+    if image.format == 'JPEG':
+        # Draft mode decodes straight to 1/2, 1/4 or 1/8 scale in the JPEG decoder, leaving
+        # the full-resolution decode of `image` for the crop
+        detection_image = Image.open(BytesIO(image_content))
+        detection_image.draft('RGB', detection_size)
+    else:
+        detection_image = image
+    if detection_image.size != detection_size:
+        detection_image = detection_image.resize(detection_size)
+    if detection_image.mode not in ('RGB', 'L'):
+        detection_image = detection_image.convert('RGB')
+    return detection_image
+
+class UploadImage:
+    """An upload as face-crop reads it: the original (header parsed only), its bytes and a
+    proxy of at most DETECTION_MAX_SIZE pixels per side.
+
+    The proxy is decoded on first use and once only; the perceptual hash, the quality gate
+    and the detectors all take their reduced copies from it.
+    """
+
+    def __init__(self, image, image_content):
+        self.image = image
+        self.image_content = image_content
+        self._proxy = None
+
+    def proxy(self, max_size=DETECTION_MAX_SIZE):
+        """The proxy, or a downscale of it to at most max_size pixels per side."""
+        if self._proxy is None:
+            self._proxy = detection_proxy_image(self.image, self.image_content)
+        size = proxy_size(self.image, max_size)
+        if max(size) >= max(self._proxy.size):
+            return self._proxy
+        return self._proxy.resize(size)
+
+def detection_proxy_bytes(upload):
+    """A JPEG of at most DETECTION_MAX_SIZE pixels per side, so the Rekognition payload and
+    latency stay the same whatever camera the kiosk uses."""
+    if is_rekognition_ready(upload.image, upload.image_content):
+        return upload.image_content
+
+    buffer = BytesIO()
+    upload.proxy().save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+class RekognitionFaceDetector:
+    name = 'rekognition'
+
+    def detect(self, upload):
+        # The default attributes already include the bounding box
+        response = get_client('rekognition').detect_faces(
+            Image={'Bytes': detection_proxy_bytes(upload)},
+            Attributes=['DEFAULT']
+        )
+        return response['FaceDetails'], self.name
+
+class OpenCvFaceDetector:
+    """OpenCV's YuNet face detector (cv2.FaceDetectorYN), run on the Lambda's own CPU.
+
+    The ONNX model and opencv-python-headless come from the face detector layer,
+    see lambda/layers/face-detector.
+    """
+    name = 'opencv-yunet'
+    INPUT_SIZE = 320  # YuNet works well on small inputs; faces at a kiosk fill much of the frame
+    # YuNet landmark order, mapped to Rekognition landmark types
+    LANDMARK_TYPES = ['eyeRight', 'eyeLeft', 'nose', 'mouthRight', 'mouthLeft']
+
+    def __init__(self, model_path, score_threshold=0.5):
+        import cv2
+
+        self.detector = cv2.FaceDetectorYN.create(model_path, '', (self.INPUT_SIZE, self.INPUT_SIZE), score_threshold)
+        # The network keeps per-call state (input size, blobs), so records processed in parallel take turns
+        self.lock = threading.Lock()
+
+    def detect(self, upload):
+        import numpy as np
+
+        proxy = upload.proxy(self.INPUT_SIZE).convert('RGB')
+        width, height = proxy.size
+        # OpenCV expects BGR pixel order
+        pixels = np.ascontiguousarray(np.asarray(proxy)[:, :, ::-1])
+        with self.lock:
+            self.detector.setInputSize((width, height))
+            _, faces = self.detector.detect(pixels)
+
+        face_details = []
+        for face in faces if faces is not None else []:
+            x, y, w, h = (float(value) for value in face[:4])
+            left, top = max(0.0, x), max(0.0, y)
+            right, bottom = min(float(width), x + w), min(float(height), y + h)
+            face_details.append({
+                'BoundingBox': {
+                    'Left': left / width,
+                    'Top': top / height,
+                    'Width': (right - left) / width,
+                    'Height': (bottom - top) / height
+                },
+                'Confidence': float(face[14]) * 100,
+                'Landmarks': [
+                    {'Type': landmark_type, 'X': float(face[4 + 2 * index]) / width, 'Y': float(face[5 + 2 * index]) / height}
+                    for index, landmark_type in enumerate(self.LANDMARK_TYPES)
+                ]
+            })
+        return face_details, self.name
+
+class FallbackFaceDetector:
+    """Use the local detector first and ask Rekognition only when it is not confident."""
+
+    def __init__(self, primary, fallback, min_confidence):
+        self.primary = primary
+        self.fallback = fallback
+        self.min_confidence = min_confidence
+
+    def detect(self, upload):
+        face_details, detector_name = self.primary.detect(upload)
+        if face_details and max(face['Confidence'] for face in face_details) >= self.min_confidence:
+            return face_details, detector_name
+        return self.fallback.detect(upload)
+
+def create_detector(policy, model_path, min_confidence):
+    """Build the detector for FACE_DETECTOR_POLICY: 'rekognition', 'local' or 'local-fallback'."""
+    if policy == 'rekognition':
+        return RekognitionFaceDetector()
+
+    try:
+        local_detector = OpenCvFaceDetector(model_path)
+    except Exception as e:
+        # Without the layer (or with a broken model) keep serving through Rekognition
+        print(f"Local face detector unavailable, using Rekognition: {str(e)}")
+        return RekognitionFaceDetector()
+
+    if policy == 'local':
+        return local_detector
+    return FallbackFaceDetector(local_detector, RekognitionFaceDetector(), min_confidence)
@@ -0,0 +1,22 @@
+import hashlib
+from PIL import Image
+
+HASH_SAMPLE_SIZE = 256  # longest side of the downscaled proxy the perceptual hash is computed on
+
+def content_hash(image_content):
+    """SHA-256 of the uploaded bytes: the same for a re-sent upload."""
+    return hashlib.sha256(image_content).hexdigest()
+
+def perceptual_hash(upload):
+    """64-bit difference hash (dHash) as 16 hex digits: close for a retake of the same pose.
+
+    Each bit says whether a pixel of a 9x8 grayscale thumbnail is brighter than its right
+    neighbour, so small changes in exposure, noise or JPEG quality flip only a few bits.
+    """
+    sample = upload.proxy(HASH_SAMPLE_SIZE).convert('L').resize((9, 8), Image.LANCZOS)
+    pixels = list(sample.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f'{bits:016x}'
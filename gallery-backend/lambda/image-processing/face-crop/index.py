@@ -1,94 +1,285 @@
-import boto3
-import json
 import os
-import copy
+import threading
+import time
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from io import BytesIO
 from PIL import Image
-from datetime import datetime
-from typing import Dict, Any
+from gallery_runtime import dedup, job_status, routing
+from gallery_runtime.clients import get_client
+from gallery_runtime.ddb import unmarshall_item
+from gallery_runtime.face_landmarks import add_landmarks_metadata, crop_landmarks
+from gallery_runtime.facechain import build_face_swap_request, run_face_swap
+from gallery_runtime.job_metadata import build_metadata, parse_metadata
+from gallery_runtime.metrics import emit_stage, parse_event_time
+from gallery_runtime.records import handle_event
+from detectors import UploadImage, create_detector
+import image_hash
+import quality_gate
 
-s3_client = boto3.client('s3')
-rekognition_client = boto3.client('rekognition')
 BUCKET_NAME = os.environ.get('BUCKET_NAME')
 FACE_CROPPED_OBJECT_PATH = os.environ.get('FACE_CROPPED_OBJECT_PATH')
-MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5MB
+DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME = os.environ.get('DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME')
+# 'rekognition', 'local' (OpenCV only) or 'local-fallback' (OpenCV, then Rekognition when not confident)
+FACE_DETECTOR_POLICY = os.environ.get('FACE_DETECTOR_POLICY', 'rekognition')
+FACE_DETECTOR_MODEL_PATH = os.environ.get('FACE_DETECTOR_MODEL_PATH', '/opt/face-detector/face_detection_yunet_2023mar.onnx')
+FACE_DETECTOR_MIN_CONFIDENCE = float(os.environ.get('FACE_DETECTOR_MIN_CONFIDENCE', '90'))
+# Where face-swap writes results; a reused result is copied here
+RESULT_OBJECT_PATH = os.environ.get('RESULT_OBJECT_PATH')
+# Fused mode: run the face swap from here with the crop inline, instead of handing the crop to
+# face-swap through S3. The crop is still kept, under FACE_CROP_AUDIT_OBJECT_PATH, which
+# triggers nothing.
+FUSED_FACE_SWAP = os.environ.get('FUSED_FACE_SWAP', 'false').lower() == 'true'
+FACE_CROP_AUDIT_OBJECT_PATH = os.environ.get('FACE_CROP_AUDIT_OBJECT_PATH')
+FACECHAIN_SAGEMAKER_ENDPOINT_NAME = os.environ.get('FACECHAIN_SAGEMAKER_ENDPOINT_NAME')
+
+_audit_uploads = ThreadPoolExecutor(max_workers=4)
+
+_detector = None
+_detector_lock = threading.Lock()
+
+def get_detector():
+    # Loading the local model takes a moment, so build the detector once per container
+    global _detector
+    with _detector_lock:
+        if _detector is None:
+            _detector = create_detector(FACE_DETECTOR_POLICY, FACE_DETECTOR_MODEL_PATH, FACE_DETECTOR_MIN_CONFIDENCE)
+    return _detector
 
 def lambda_handler(event, context):
-    # S3 이벤트 처리
-    s3_event = event['Records'][0]['s3']
+    # S3 이벤트 처리: every record of the notification, delivered by S3 or through SQS
+    return handle_event(event, process_record)
+
+def process_record(s3_record):
+    started_at = time.time()
+    s3_event = s3_record['s3']
     bucket_name = s3_event['bucket']['name']
     encoded_object_key = s3_event['object']['key']
     source_object_key = urllib.parse.unquote_plus(encoded_object_key)
+    correlation_id = os.path.splitext(os.path.basename(source_object_key))[0]
+    uploaded_at = parse_event_time(s3_record.get('eventTime'))
     
-    # Load image file from S3
-    response = s3_client.get_object(Bucket=bucket_name, Key=source_object_key)
-    image_content = response['Body'].read()  
+    # Load image file from S3. Image.open only parses the header; pixels are decoded on first use
+    response = get_client('s3').get_object(Bucket=bucket_name, Key=source_object_key)
+    image_content = response['Body'].read()
     image = Image.open(BytesIO(image_content))
-    if image.mode == 'RGBA':
-        image = image.convert('RGB')
+    # The hash, the quality gate and the detector share one reduced decode of the upload
+    upload = UploadImage(image, image_content)
+    filename = os.path.basename(source_object_key)
+    # The job put-image bound to the upload (None for uploads without metadata)
+    job = parse_metadata(response.get('Metadata'))
+    
+    # A repeated upload of a recently completed photo reuses its result instead of the whole pipeline
+    hashes = None
+    if dedup.is_enabled():
+        hashes = {
+            'content_hash': image_hash.content_hash(image_content),
+            'perceptual_hash': image_hash.perceptual_hash(upload)
+        }
+        completed_job = find_completed_job(correlation_id, job, hashes)
+        if completed_job and completed_job['uuid'] == correlation_id:
+            # The same object was put again (e.g. a retried POST) after its job completed
+            emit_stage(correlation_id, 'face_crop', started_at, triggered_at=uploaded_at, outcome='duplicate_event')
+            return f"Image {correlation_id} was already processed"
+        if completed_job and reuse_result(bucket_name, filename, correlation_id, completed_job, hashes):
+            emit_stage(correlation_id, 'face_crop', started_at, triggered_at=uploaded_at, outcome='deduplicated', dedup_of=completed_job['uuid'])
+            return f"Reused the result of {completed_job['uuid']} for {correlation_id}"
     
     # Detect faces and find the largest face area (with padding)
-    ori_image, imgWidth, imgHeight, f_left, f_top, f_width, f_height, rekognition_response = show_faces(image, bucket_name, source_object_key)
+    face_box, detector_name, face_details, face_landmarks = show_faces(upload)
     
-    if f_left is not None:
-        # Crop the detected face area
-        cropped_image = ori_image.crop((f_left, f_top, f_left + f_width, f_top + f_height))
-        
-        # Extract the filename from source_object_key
-        filename = os.path.basename(source_object_key)
-        
-        # Create the key for the cropped image
-        face_cropped_object_key = os.path.join(FACE_CROPPED_OBJECT_PATH, filename)
+    # Reject uploads the face swap cannot use before they reach the SageMaker endpoint
+    status, reason = quality_gate.evaluate(upload, face_details)
+    process_item = update_process_status(correlation_id, status, reason, hashes)
+    
+    if status == quality_gate.STATUS_ACCEPTED:
+        # Crop the detected face area; this is the only full-resolution decode
+        cropped_image = image.crop(face_box)
+        if cropped_image.mode not in ('RGB', 'L'):
+            cropped_image = cropped_image.convert('RGB')
         
-        # Save the cropped image to a memory buffer in jpeg format and upload to S3
+        # Save the cropped image to a memory buffer in jpeg format
         buffered = BytesIO()
         cropped_image.save(buffered, format="JPEG")
         image_bytes = buffered.getvalue()
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=face_cropped_object_key,
-            Body=image_bytes,
-            ContentType="image/jpeg"
-        )
         
-        return {
-            'statusCode': 200,
-            'body': json.dumps(f"Cropped face image saved successfully at {face_cropped_object_key}!")
-        }
+        if FUSED_FACE_SWAP:
+            emit_stage(correlation_id, 'face_crop', started_at, triggered_at=uploaded_at, outcome='cropped', status=status,
+                       detector=detector_name, landmarks=face_landmarks is not None, fused=True)
+            return swap_face(s3_record, bucket_name, filename, correlation_id, image_bytes, process_item, face_landmarks)
+        
+        # Create the key for the cropped image and upload it; the notification on it starts face-swap,
+        # which reads the job and the face landmarks from the crop's metadata
+        face_cropped_object_key = os.path.join(FACE_CROPPED_OBJECT_PATH, filename)
+        put_crop(bucket_name, face_cropped_object_key, image_bytes,
+                 add_landmarks_metadata(build_metadata(process_item or {}), face_landmarks))
+        
+        emit_stage(correlation_id, 'face_crop', started_at, triggered_at=uploaded_at, outcome='cropped', status=status,
+                   detector=detector_name, landmarks=face_landmarks is not None)
+        return f"Cropped face image saved successfully at {face_cropped_object_key}!"
     else:
-        return {
-            'statusCode': 200,
-            'body': json.dumps("No faces detected in the image.")
-        }
+        outcome = 'no_face' if status == quality_gate.STATUS_REJECTED_NO_FACE else 'rejected'
+        emit_stage(correlation_id, 'face_crop', started_at, triggered_at=uploaded_at, outcome=outcome, status=status, detector=detector_name)
+        return f"Image rejected ({status}): {reason}"
 
-def show_faces(image, bucket_name, object_key, padding_ratio=0.5):
-    imgWidth, imgHeight = image.size
-    ori_image = copy.deepcopy(image)
-    
-    # Save image to a memory buffer in jpeg format
-    buffer = BytesIO()
-    image.save(buffer, format="JPEG")
-    image_bytes = buffer.getvalue()
-    
-    # If the image size exceeds MAX_IMAGE_SIZE, use S3 object reference for face detection
-    if len(image_bytes) > MAX_IMAGE_SIZE:
-        print(f"Image size exceeds {MAX_IMAGE_SIZE} bytes. Using S3 object reference.")
-        response = rekognition_client.detect_faces(
-            Image={'S3Object': {'Bucket': bucket_name, 'Name': object_key}},
-            Attributes=['ALL']
+def put_crop(bucket_name, object_key, image_bytes, metadata=None):
+    get_client('s3').put_object(
+        Bucket=bucket_name,
+        Key=object_key,
+        Body=image_bytes,
+        ContentType="image/jpeg",
+        Metadata=metadata or {}
+    )
+
+def swap_face(s3_record, bucket_name, filename, correlation_id, image_bytes, process_item, face_landmarks=None):
+    """Fused mode: invoke the FaceChain endpoint with the crop in the request, as face-swap would.
+
+    With routing, the inference takes a slot on the least loaded target like face-swap does;
+    when every target is full the upload's record is deferred to the retry queue, which
+    brings it back to face-crop.
+    """
+    started_at = time.time()
+    if process_item is None:
+        raise Exception(f"Could not find image with uuid({correlation_id})")
+
+    # Keep the crop for audit while the endpoint works; nothing downstream waits for it
+    audit_object_key = os.path.join(FACE_CROP_AUDIT_OBJECT_PATH, filename)
+    audit_upload = _audit_uploads.submit(put_crop, bucket_name, audit_object_key, image_bytes)
+
+    request_body = build_face_swap_request(
+        correlation_id, bucket_name,
+        target_object_key=process_item['base_image_object_key'],
+        output_object_key=os.path.join(RESULT_OBJECT_PATH, filename),
+        source_object_key=audit_object_key,
+        source_bytes=image_bytes,
+        source_landmarks=face_landmarks,
+        metadata=build_metadata(process_item)
+    )
+    try:
+        if not routing.is_enabled():
+            stage_fields = run_face_swap(FACECHAIN_SAGEMAKER_ENDPOINT_NAME, request_body)
+        else:
+            with routing.endpoint_slot(correlation_id) as target:
+                if target is None:
+                    stage_fields = dict(routing.defer_record(s3_record), outcome='deferred')
+                else:
+                    stage_fields = run_face_swap(target['endpoint'], request_body, target.get('variant'))
+                    stage_fields.update(endpoint=target['endpoint'], variant=target.get('variant'))
+    finally:
+        # The function may be frozen once it returns, so the upload has to finish first
+        audit_error = audit_upload.exception()
+    if audit_error:
+        print(f"Could not keep the face crop at {audit_object_key}: {str(audit_error)}")
+
+    emit_stage(correlation_id, 'face_swap', started_at, fused=True, **stage_fields)
+    if stage_fields.get('outcome') == 'deferred':
+        return f"Face swap deferred for {correlation_id} (retry {stage_fields['retry_attempt']} in {stage_fields['retry_delay_seconds']}s)"
+    if stage_fields.get('async_inference'):
+        return f"Face swap queued for {correlation_id}"
+    return f"Face swap complete for {correlation_id}"
+
+def find_completed_job(correlation_id, job, hashes):
+    if job:
+        user_id, theme, gender, skin = job['userId'], job['theme'], job['gender'], job['skin']
+    else:
+        # Uploads without metadata: correlation_id is {current_time}-{user_id}-{theme}-{gender}-{skin}-{unique_id}
+        name_parts = correlation_id.split('-')
+        if len(name_parts) < 6:
+            return None
+        user_id, theme, gender, skin = name_parts[1:5]
+    return dedup.find_completed_job(user_id, theme, gender, skin, hashes['content_hash'], hashes['perceptual_hash'])
+
+def reuse_result(bucket_name, filename, correlation_id, completed_job, hashes):
+    """Copy a completed job's result to this upload's result key, which triggers face-swap-completion.
+
+    Returns False when the upload has to go through the pipeline after all.
+    """
+    # The process entry first: get-upload-status and the fallback of face-swap-completion read it
+    process_item = update_process_status(correlation_id, quality_gate.STATUS_ACCEPTED, None, hashes, completed_job)
+    if process_item is None:
+        return False
+
+    try:
+        # The copy gets this job's metadata, with the completed job's base image and story
+        get_client('s3').copy_object(
+            Bucket=bucket_name,
+            Key=os.path.join(RESULT_OBJECT_PATH, filename),
+            CopySource={'Bucket': bucket_name, 'Key': completed_job['result_object_key']},
+            MetadataDirective='REPLACE',
+            Metadata=build_metadata(process_item),
+            ContentType='image/png'
         )
+    except get_client('s3').exceptions.NoSuchKey:
+        print(f"Result {completed_job['result_object_key']} of {completed_job['uuid']} is gone, processing {correlation_id}")
+        return False
+    return True
+
+def update_process_status(correlation_id, status, reason, hashes=None, completed_job=None):
+    """Record the quality gate result on the upload's process table entry for get-upload-status.
+
+    The upload's hashes are stored for face-swap-completion to record the job for
+    deduplication. With completed_job, the entry takes over that job's base image and story,
+    as its result is reused. The entry also gets the timestamp of the stage the job moves
+    to, for get-job-status.
+
+    Returns the updated entry, or None when put-image did not create one.
+    """
+    set_expressions = ['#status = :status', 'status_reason = :reason', 'updated_at = :updated_at']
+    values = {
+        ':status': {'S': status},
+        ':reason': {'S': reason} if reason else {'NULL': True},
+        ':updated_at': {'S': datetime.now().isoformat()}
+    }
+    if status == quality_gate.STATUS_ACCEPTED:
+        # In fused mode the face swap starts right after this update
+        stages = ['cropped', 'swapping'] if FUSED_FACE_SWAP and not completed_job else ['cropped']
+    else:
+        stages = ['rejected']
+    set_expressions += job_status.stage_set_expressions(stages, ':updated_at')
+    for name, value in (hashes or {}).items():
+        set_expressions.append(f'{name} = :{name}')
+        values[f':{name}'] = {'S': value}
+    if completed_job:
+        set_expressions += ['base_image_object_key = :base_image_object_key', 'base_story = :base_story', 'dedup_of = :dedup_of']
+        values[':base_image_object_key'] = {'S': completed_job['base_image_object_key']}
+        values[':base_story'] = {'S': completed_job['base_story']}
+        values[':dedup_of'] = {'S': completed_job['uuid']}
+        update_expression = 'SET ' + ', '.join(set_expressions)
     else:
-        response = rekognition_client.detect_faces(
-            Image={'Bytes': image_bytes},
-            Attributes=['ALL']
+        update_expression = 'SET ' + ', '.join(set_expressions) + ' REMOVE dedup_of'
+
+    try:
+        response = get_client('dynamodb').update_item(
+            TableName=DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME,
+            Key={'PK': {'S': f'#UUID#{correlation_id}'}},
+            UpdateExpression=update_expression,
+            # Never create entries for objects put-image did not issue
+            ConditionExpression='attribute_exists(PK)',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues=values,
+            # Fused mode needs the base image of the entry; this saves face-swap's separate read
+            ReturnValues='ALL_NEW'
         )
+        return unmarshall_item(response['Attributes'])
+    except get_client('dynamodb').exceptions.ConditionalCheckFailedException:
+        print(f"No process entry for {correlation_id}, status {status} not recorded")
+        return None
+
+def show_faces(upload, padding_ratio=0.5, detector=None):
+    """The padded crop box of the largest face, the detector name, all detected faces and
+    the largest face's landmarks relative to the crop box (None when unavailable).
+    """
+    imgWidth, imgHeight = upload.image.size
+    face_details, detector_name = (detector or get_detector()).detect(upload)
         
     largest_area = 0
     largest_face_box = None
+    largest_face_detail = None
     
-    # Select the largest face area from each face area
-    for faceDetail in response['FaceDetails']:
+    # Select the largest face area from each face area. The box ratios were measured on a
+    # proxy with the original's aspect ratio, so they map straight onto the original
+    for faceDetail in face_details:
         box = faceDetail['BoundingBox']
         left = imgWidth * box['Left']
         top = imgHeight * box['Top']
@@ -99,6 +290,7 @@ def show_faces(image, bucket_name, object_key, padding_ratio=0.5):
         if current_area > largest_area:
             largest_area = current_area
             largest_face_box = (left, top, width, height)
+            largest_face_detail = faceDetail
     
     if largest_face_box:
         left, top, width, height = largest_face_box
@@ -110,6 +302,8 @@ def show_faces(image, bucket_name, object_key, padding_ratio=0.5):
         padded_right = min(imgWidth, left + width + padding_width)
         padded_bottom = min(imgHeight, top + height + padding_height)
         
-        return ori_image, imgWidth, imgHeight, int(padded_left), int(padded_top), int(padded_right - padded_left), int(padded_bottom - padded_top), response
+        face_box = (int(padded_left), int(padded_top), int(padded_right), int(padded_bottom))
+        # FaceChain aligns the user's face with these instead of detecting it again in the crop
+        return face_box, detector_name, face_details, crop_landmarks(largest_face_detail, upload.image.size, face_box)
     else:
-        return None, None, None, None, None, None, None, None
+        return None, detector_name, face_details, None
@@ -0,0 +1,77 @@
+import os
+from PIL import ImageFilter, ImageStat
+
+# Processing statuses written to the process table entry of an upload
+STATUS_PENDING = 'PENDING'
+STATUS_ACCEPTED = 'ACCEPTED'
+STATUS_REJECTED_NO_FACE = 'REJECTED_NO_FACE'
+STATUS_REJECTED_MULTIPLE_FACES = 'REJECTED_MULTIPLE_FACES'
+STATUS_REJECTED_FACE_TOO_SMALL = 'REJECTED_FACE_TOO_SMALL'
+STATUS_REJECTED_BLURRY = 'REJECTED_BLURRY'
+STATUS_REJECTED_POSE = 'REJECTED_POSE'
+
+# A second face at least this large relative to the largest one makes the upload ambiguous
+SECONDARY_FACE_AREA_RATIO = float(os.environ.get('QUALITY_SECONDARY_FACE_AREA_RATIO', '0.5'))
+# Shorter side of the face box in original pixels
+MIN_FACE_SIZE = int(os.environ.get('QUALITY_MIN_FACE_SIZE', '96'))
+# Rekognition Quality.Sharpness (0-100)
+MIN_SHARPNESS = float(os.environ.get('QUALITY_MIN_SHARPNESS', '10'))
+# Variance of the Laplacian of the face, for detectors that report no sharpness
+MIN_LAPLACIAN_VARIANCE = float(os.environ.get('QUALITY_MIN_LAPLACIAN_VARIANCE', '20'))
+MAX_YAW = float(os.environ.get('QUALITY_MAX_YAW', '45'))
+MAX_PITCH = float(os.environ.get('QUALITY_MAX_PITCH', '35'))
+
+SHARPNESS_SAMPLE_SIZE = 640
+LAPLACIAN_KERNEL = ImageFilter.Kernel((3, 3), [0, 1, 0, 1, -4, 1, 0, 1, 0], scale=1, offset=128)
+
+def face_area(face):
+    return face['BoundingBox']['Width'] * face['BoundingBox']['Height']
+
+def laplacian_variance(upload, box):
+    """Sharpness of the face region: variance of its Laplacian on a reduced grayscale copy."""
+    sample = upload.proxy(SHARPNESS_SAMPLE_SIZE)
+    width, height = sample.size
+    face = sample.convert('L').crop((
+        int(box['Left'] * width),
+        int(box['Top'] * height),
+        int((box['Left'] + box['Width']) * width),
+        int((box['Top'] + box['Height']) * height)
+    ))
+    if face.width < 3 or face.height < 3:
+        return 0.0
+    # The filter leaves the outermost pixels unfiltered, which would count as edges
+    laplacian = face.filter(LAPLACIAN_KERNEL).crop((1, 1, face.width - 1, face.height - 1))
+    return ImageStat.Stat(laplacian).var[0]
+
+def evaluate(upload, face_details):
+    """Check face count, size, sharpness and pose on the detection result.
+
+    Returns (status, reason). Only ACCEPTED uploads are cropped and sent on to the face swap.
+    """
+    if not face_details:
+        return STATUS_REJECTED_NO_FACE, 'No face was detected.'
+
+    faces = sorted(face_details, key=face_area, reverse=True)
+    face = faces[0]
+    if len(faces) > 1 and face_area(faces[1]) >= face_area(face) * SECONDARY_FACE_AREA_RATIO:
+        return STATUS_REJECTED_MULTIPLE_FACES, f'{len(faces)} faces were detected.'
+
+    box = face['BoundingBox']
+    face_size = min(box['Width'] * upload.image.width, box['Height'] * upload.image.height)
+    if face_size < MIN_FACE_SIZE:
+        return STATUS_REJECTED_FACE_TOO_SMALL, f'The face is {face_size:.0f}px, at least {MIN_FACE_SIZE}px is needed.'
+
+    quality = face.get('Quality') or {}
+    if 'Sharpness' in quality:
+        if quality['Sharpness'] < MIN_SHARPNESS:
+            return STATUS_REJECTED_BLURRY, f"Sharpness {quality['Sharpness']:.1f} is below {MIN_SHARPNESS:g}."
+    else:
+        variance = laplacian_variance(upload, box)
+        if variance < MIN_LAPLACIAN_VARIANCE:
+            return STATUS_REJECTED_BLURRY, f'Laplacian variance {variance:.1f} is below {MIN_LAPLACIAN_VARIANCE:g}.'
+
+    pose = face.get('Pose') or {}
+    if abs(pose.get('Yaw', 0.0)) > MAX_YAW or abs(pose.get('Pitch', 0.0)) > MAX_PITCH:
+        return STATUS_REJECTED_POSE, f"The face is turned away (yaw {pose.get('Yaw', 0.0):.0f}, pitch {pose.get('Pitch', 0.0):.0f})."
+
+    return STATUS_ACCEPTED, None
@@ -0,0 +1,44 @@
+import io
+import os
+from PIL import Image
+
+# Display-ready renditions of each result, written under DISPLAY_OBJECT_PATH (unset disables them)
+DISPLAY_OBJECT_PATH = os.environ.get('DISPLAY_OBJECT_PATH')
+DISPLAY_MAX_SIZE = int(os.environ.get('DISPLAY_MAX_SIZE', '1080'))  # longest side in pixels
+THUMBNAIL_MAX_SIZE = int(os.environ.get('THUMBNAIL_MAX_SIZE', '320'))
+DISPLAY_IMAGE_FORMAT = os.environ.get('DISPLAY_IMAGE_FORMAT', 'JPEG').upper()  # JPEG or WEBP
+# Extension, content type and encoder options per format
+IMAGE_FORMATS = {
+    'JPEG': ('.jpg', 'image/jpeg', {'quality': 82, 'progressive': True, 'optimize': True}),
+    'WEBP': ('.webp', 'image/webp', {'quality': 80, 'method': 4})
+}
+# Keyed by uuid, so a derivative never changes once written
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+def is_enabled():
+    return bool(DISPLAY_OBJECT_PATH)
+
+def encode(image, image_format):
+    _, _, options = IMAGE_FORMATS[image_format]
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+def render_derivatives(image_content, uuid):
+    """{size: (object key, bytes, content type)} for the display rendition and the thumbnail.
+
+    The thumbnail is scaled from the display rendition rather than the full result,
+    which is cheaper and looks the same at that size.
+    """
+    extension, content_type, _ = IMAGE_FORMATS[DISPLAY_IMAGE_FORMAT]
+    image = Image.open(io.BytesIO(image_content))
+    # Neither format needs the alpha channel of the PNG result
+    display = image.convert('RGB')
+    display.thumbnail((DISPLAY_MAX_SIZE, DISPLAY_MAX_SIZE), Image.LANCZOS)
+    thumbnail = display.copy()
+    thumbnail.thumbnail((THUMBNAIL_MAX_SIZE, THUMBNAIL_MAX_SIZE), Image.LANCZOS)
+
+    return {
+        size: (os.path.join(DISPLAY_OBJECT_PATH, size, f'{uuid}{extension}'), encode(rendition, DISPLAY_IMAGE_FORMAT), content_type)
+        for size, rendition in [('display', display), ('thumbnail', thumbnail)]
+    }
@@ -1,29 +1,187 @@
-import json
-import boto3
 import os
-import urllib.request
-import urllib.error
-import io
-from datetime import datetime
+import time
+import urllib.parse
+from datetime import datetime, timezone
+from gallery_runtime import dedup, feed, job_status
+from gallery_runtime.clients import get_client
+from gallery_runtime.ddb import marshall_item, unmarshall_item
+from gallery_runtime.job_metadata import parse_metadata
+from gallery_runtime.metrics import emit_stage, parse_event_time
+from gallery_runtime.records import handle_event
+import derivatives
 
 DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME = os.environ['DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME']
 DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_TABLE_NAME = os.environ['DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_TABLE_NAME']
-
-ddb_client = boto3.client('dynamodb')
+DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_HISTORY_TABLE_NAME = os.environ['DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_HISTORY_TABLE_NAME']
+# Write the display row and the history entry in one transaction (twice the write capacity),
+# so the feed never shows a result the display row does not, or the other way round
+COMPLETION_HISTORY_TRANSACTION = os.environ.get('COMPLETION_HISTORY_TRANSACTION', 'false').lower() == 'true'
 
 def lambda_handler(event, context):
-    s3_event = event['Records'][0]['s3']
+    return handle_event(event, process_record)
+
+def process_record(s3_record):
+    started_at = time.time()
+    s3_event = s3_record['s3']
     encoded_object_key = s3_event['object']['key']
     result_object_key = urllib.parse.unquote_plus(encoded_object_key) # user's result image
     result_object_filename = os.path.basename(result_object_key) # result_object_filename: {current_time}-{user_id}-{theme}-{gender}-{skin}-{unique_id}.jpeg
     uuid = os.path.splitext(result_object_filename)[0]
-    userId = uuid.split('-')[1]
-    theme = uuid.split('-')[2]
-    gender = uuid.split('-')[3]
-    skin = uuid.split('-')[4]
 
-    # get process image info
-    ddb_response = ddb_client.query(
+    # The job travels in the result's metadata. Results written without it, or whose story did not
+    # fit in the metadata, fall back to the process table
+    if derivatives.is_enabled():
+        # The derivatives are rendered from the result, so read it whole instead of only its metadata
+        result_object = get_client('s3').get_object(Bucket=s3_event['bucket']['name'], Key=result_object_key)
+        result_content = result_object['Body'].read()
+    else:
+        result_object = get_client('s3').head_object(Bucket=s3_event['bucket']['name'], Key=result_object_key)
+    process_image_info = parse_metadata(result_object.get('Metadata'))
+    if process_image_info is None or 'base_story' not in process_image_info:
+        process_image_info = get_process_item(uuid)
+
+    userId = process_image_info['userId']
+    base_image_object_key = process_image_info['base_image_object_key']
+    base_story = process_image_info['base_story']
+    theme = process_image_info['theme']
+    gender = process_image_info['gender']
+    skin = process_image_info['skin']
+    
+    derivative_keys, derivatives_ms = {}, None
+    if derivatives.is_enabled():
+        derivatives_started_at = time.time()
+        derivative_keys = write_derivatives(s3_event['bucket']['name'], result_content, uuid)
+        derivatives_ms = round((time.time() - derivatives_started_at) * 1000, 3)
+
+    # S3 event times order the results of a user, unlike uuids (whose timestamp is not sortable);
+    # a repeated event carries the time of the original one
+    event_time = s3_record.get('eventTime') or datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+    current_time = datetime.now().isoformat()
+    result = {
+        'uuid': uuid,
+        'userId': userId,
+        'gender': gender,
+        'skin': skin,
+        'base_image_object_key': base_image_object_key,
+        'result_object_key': result_object_key,
+        'base_story': base_story,
+        'theme': theme,
+        # None clears the derivatives of the user's previous result when these could not be rendered
+        'display_object_key': derivative_keys.get('display'),
+        'thumbnail_object_key': derivative_keys.get('thumbnail')
+    }
+
+    try:
+        display_update = display_update_request(userId, result, event_time, current_time)
+        history_update = history_update_request(uuid, result, current_time)
+        if COMPLETION_HISTORY_TRANSACTION:
+            outcome = write_display_and_history(display_update, history_update)
+        else:
+            outcome = write_display(display_update)
+            # a repeated S3 event rewrites the same history entry (#UUID#{uuid}) and keeps its created_at
+            get_client('dynamodb').update_item(**history_update)
+    except Exception as e:
+        print(f"error: {str(e)}")
+        raise e
+
+    job_status.record_stage(uuid, 'completed')
+
+    # Let a repeated upload of this photo reuse the result; a reused result is not recorded again,
+    # so it cannot outlive the job that made it
+    if dedup.is_enabled() and process_image_info.get('content_hash') and not process_image_info.get('dedup_of'):
+        try:
+            dedup.record_completed_job(process_image_info, uuid, result_object_key)
+        except Exception as e:
+            print(f"Could not record {uuid} for deduplication: {str(e)}")
+
+    # The display row is now updated, so this is the end of the user's wait
+    emit_stage(uuid, 'face_swap_completion', started_at, triggered_at=parse_event_time(s3_record.get('eventTime')),
+               outcome=outcome, derivatives_ms=derivatives_ms)
+    
+    return f'Face swap complete for {uuid}'
+
+def write_derivatives(bucket_name, result_content, uuid):
+    """Render and store the display derivatives; {size: object key}, or {} when rendering failed.
+
+    The full result stays usable without them, so a failure does not fail the completion.
+    """
+    try:
+        renditions = derivatives.render_derivatives(result_content, uuid)
+        for object_key, content, content_type in renditions.values():
+            get_client('s3').put_object(
+                Bucket=bucket_name,
+                Key=object_key,
+                Body=content,
+                ContentType=content_type,
+                CacheControl=derivatives.CACHE_CONTROL
+            )
+        return {size: object_key for size, (object_key, _, _) in renditions.items()}
+    except Exception as e:
+        print(f"Could not render the display derivatives of {uuid}: {str(e)}")
+        return {}
+
+def update_expression(fields, created_at):
+    """SET for every field, plus created_at only when the item does not have one yet."""
+    names = {f'#{name}': name for name in fields}
+    names['#created_at'] = 'created_at'
+    values = {f':{name}': value for name, value in marshall_item(fields).items()}
+    values[':created_at'] = {'S': created_at}
+    assignments = [f'#{name} = :{name}' for name in fields] + ['#created_at = if_not_exists(#created_at, :created_at)']
+    return 'SET ' + ', '.join(assignments), names, values
+
+def display_update_request(userId, result, event_time, current_time):
+    """Upsert of the user's display row (#USERID#{user_id}), skipped for repeated or older S3 events."""
+    expression, names, values = update_expression(dict(result, updated_at=current_time, result_event_time=event_time), current_time)
+    return {
+        'TableName': DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_TABLE_NAME,
+        'Key': {'PK': {'S': f'#USERID#{userId}'}},
+        'UpdateExpression': expression,
+        'ConditionExpression': 'attribute_not_exists(#result_event_time) OR #result_event_time < :result_event_time',
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values
+    }
+
+def history_update_request(uuid, result, current_time):
+    """Upsert of the result's history feed entry (#UUID#{uuid})."""
+    expression, names, values = update_expression(dict(result, feed=feed.feed_key(uuid)), current_time)
+    return {
+        'TableName': DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_HISTORY_TABLE_NAME,
+        'Key': {'PK': {'S': f'#UUID#{uuid}'}},
+        'UpdateExpression': expression,
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values
+    }
+
+def skipped_outcome(old_item, uuid):
+    # The display row already shows this result (a repeated event) or a later one
+    if old_item and old_item.get('uuid', {}).get('S') == uuid:
+        return 'duplicate_event'
+    return 'superseded'
+
+def write_display(display_update):
+    try:
+        get_client('dynamodb').update_item(**display_update, ReturnValuesOnConditionCheckFailure='ALL_OLD')
+        return 'updated'
+    except get_client('dynamodb').exceptions.ConditionalCheckFailedException as e:
+        return skipped_outcome(e.response.get('Item'), display_update['ExpressionAttributeValues'][':uuid']['S'])
+
+def write_display_and_history(display_update, history_update):
+    try:
+        get_client('dynamodb').transact_write_items(TransactItems=[
+            {'Update': dict(display_update, ReturnValuesOnConditionCheckFailure='ALL_OLD')},
+            {'Update': history_update}
+        ])
+        return 'updated'
+    except get_client('dynamodb').exceptions.TransactionCanceledException as e:
+        display_reason = e.response.get('CancellationReasons', [{}])[0]
+        if display_reason.get('Code') != 'ConditionalCheckFailed':
+            raise
+        # Only the display row is out of date; the result still belongs in the feed
+        get_client('dynamodb').update_item(**history_update)
+        return skipped_outcome(display_reason.get('Item'), display_update['ExpressionAttributeValues'][':uuid']['S'])
+
+def get_process_item(uuid):
+    ddb_response = get_client('dynamodb').query(
         TableName=DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME,
         KeyConditionExpression='#pk = :pk',
         ExpressionAttributeNames={
@@ -37,68 +195,4 @@ def lambda_handler(event, context):
     if not ddb_response['Items']:
         raise Exception(f"Could not find image with uuid({uuid})")
 
-    process_image_info = ddb_response['Items'][0]
-    base_image_object_key = process_image_info['base_image_object_key']['S']
-    base_story = process_image_info['base_story']['S']
-    theme = process_image_info['theme']['S']
-    gender = process_image_info['gender']['S']
-    skin = process_image_info['skin']['S']
-    
-    try:
-        response = ddb_client.query(
-            TableName=DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_TABLE_NAME,
-            KeyConditionExpression='PK = :pk',
-            ExpressionAttributeValues={
-                ':pk': {'S': f'#USERID#{userId}'}
-            }
-        )
-        
-        current_time = datetime.now().isoformat()
-        
-        if response['Items']:
-            # if there is an item, update it (#USERID#{user_id})
-            ddb_client.update_item(
-                TableName=DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_TABLE_NAME,
-                Key={
-                    'PK': {'S': f'#USERID#{userId}'}
-                },
-                UpdateExpression='SET #uuid_attr = :uuid, base_image_object_key = :base_image_object_key, result_object_key = :result_object_key, base_story = :base_story, theme = :theme, updated_at = :updated_at, gender = :gender, skin = :skin',
-                ExpressionAttributeNames={
-                    '#uuid_attr': 'uuid',
-                },
-                ExpressionAttributeValues={
-                    ':uuid': {'S': uuid},
-                    ':base_image_object_key': {'S': base_image_object_key},
-                    ':result_object_key': {'S': result_object_key},
-                    ':base_story': {'S': base_story},
-                    ':theme': {'S': theme},
-                    ':gender': {'S': gender},
-                    ':skin': {'S': skin},
-                    ':updated_at': {'S': current_time}
-                }
-            )
-        else:
-            ddb_client.put_item(
-                TableName=DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_TABLE_NAME,
-                Item={
-                    'PK': {'S': f'#USERID#{userId}'},
-                    'uuid': {'S': uuid},
-                    'userId': {'S': userId},
-                    'gender': {'S': gender},
-                    'skin': {'S': skin},
-                    'base_image_object_key': {'S': base_image_object_key},
-                    'result_object_key': {'S': result_object_key},
-                    'base_story': {'S': base_story},
-                    'theme': {'S': theme},
-                    'updated_at': {'S': current_time},
-                    'created_at': {'S': current_time}
-                }
-            )
-    except Exception as e:
-        print(f"error: {str(e)}")
-        raise e
-    
-    return {
-        'statusCode': 200,
-        'body': json.dumps('Face swap complete')
-    }
+    return unmarshall_item(ddb_response['Items'][0])
@@ -1,10 +1,13 @@
-import json
-import boto3
 import os
+import time
 import urllib.parse
-
-ddb_client = boto3.client('dynamodb')
-sagemaker_runtime = boto3.client('sagemaker-runtime')
+from gallery_runtime import face_landmarks, job_status, routing
+from gallery_runtime.clients import get_client
+from gallery_runtime.ddb import unmarshall_item
+from gallery_runtime.facechain import build_face_swap_request, run_face_swap
+from gallery_runtime.job_metadata import build_metadata, parse_metadata
+from gallery_runtime.metrics import emit_stage, parse_event_time
+from gallery_runtime.records import handle_event
 
 BUCKET_NAME = os.environ['BUCKET_NAME']
 RESULT_OBJECT_PATH = os.environ['RESULT_OBJECT_PATH']
@@ -12,18 +15,57 @@ FACECHAIN_SAGEMAKER_ENDPOINT_NAME = os.environ['FACECHAIN_SAGEMAKER_ENDPOINT_NAM
 DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME = os.environ['DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME']
 
 def lambda_handler(event, context):
-    s3_event = event['Records'][0]['s3']
+    # Each record waits on its own inference, so the records of a notification run side by side
+    return handle_event(event, process_record)
+
+def process_record(s3_record):
+    started_at = time.time()
+    s3_event = s3_record['s3']
     bucket_name = s3_event['bucket']['name']
     encoded_object_key = s3_event['object']['key']
     source_object_key = urllib.parse.unquote_plus(encoded_object_key) # user's cropped face image
     source_object_filename = os.path.basename(source_object_key) # source_object_filename: {current_time}-{user_id}-{theme}-{gender}-{skin}-{unique_id}.jpeg
     uuid = os.path.splitext(source_object_filename)[0] 
-    user_id = uuid.split('-')[1]
-    theme = uuid.split('-')[2]
-    gender = uuid.split('-')[3]
-    skin = uuid.split('-')[4]
+    triggered_at = parse_event_time(s3_record.get('eventTime'))
+
+    if not routing.is_enabled():
+        stage_fields = swap_face(bucket_name, source_object_key, uuid, FACECHAIN_SAGEMAKER_ENDPOINT_NAME)
+    else:
+        # Admission control: run on the least loaded target, or come back later when all are full
+        with routing.endpoint_slot(uuid) as target:
+            if target is None:
+                stage_fields = dict(routing.defer_record(s3_record), outcome='deferred')
+                emit_stage(uuid, 'face_swap', started_at, triggered_at=triggered_at, **stage_fields)
+                return f"Face swap deferred for {uuid} (retry {stage_fields['retry_attempt']} in {stage_fields['retry_delay_seconds']}s)"
+            stage_fields = swap_face(bucket_name, source_object_key, uuid, target['endpoint'], target.get('variant'))
+            stage_fields.update(endpoint=target['endpoint'], variant=target.get('variant'))
+
+    emit_stage(uuid, 'face_swap', started_at, triggered_at=triggered_at, **stage_fields)
     
-    ddb_response = ddb_client.query(
+    if stage_fields.get('async_inference'):
+        return f'Face swap queued for {uuid}'
+    return f'Face swap complete for {uuid}'
+
+def swap_face(bucket_name, source_object_key, uuid, endpoint_name, target_variant=None):
+    source_object_filename = os.path.basename(source_object_key)
+    # face-crop writes the job and the face landmarks onto the crop; crops written without the job
+    # fall back to the process table, and without landmarks FaceChain detects the face itself
+    metadata = get_client('s3').head_object(Bucket=bucket_name, Key=source_object_key).get('Metadata') or {}
+    job = parse_metadata(metadata)
+    if job is None:
+        job = get_process_item(uuid)
+    
+    target_object_key = job['base_image_object_key']
+    output_object_key = os.path.join(RESULT_OBJECT_PATH, source_object_filename)
+
+    request_body = build_face_swap_request(uuid, BUCKET_NAME, target_object_key, output_object_key,
+                                           source_object_key=source_object_key, metadata=build_metadata(job),
+                                           source_landmarks=face_landmarks.decode_landmarks(metadata.get(face_landmarks.METADATA_NAME)))
+    job_status.record_stage(uuid, 'swapping')
+    return run_face_swap(endpoint_name, request_body, target_variant)
+
+def get_process_item(uuid):
+    ddb_response = get_client('dynamodb').query(
         TableName=DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME,
         KeyConditionExpression='#pk = :pk',
         ExpressionAttributeNames={
@@ -37,24 +79,4 @@ def lambda_handler(event, context):
     if not ddb_response['Items']:
         raise Exception(f"Could not find image with uuid({uuid})")
     
-    target_object_key = ddb_response['Items'][0]['base_image_object_key']['S']
-    output_object_key = os.path.join(RESULT_OBJECT_PATH, source_object_filename)
-
-    request_body = {
-        'uuid': uuid,
-        'bucket': BUCKET_NAME,
-        'source': source_object_key,
-        'target': target_object_key,
-        'output': output_object_key
-    }
-    
-    sagemaker_runtime.invoke_endpoint(
-        EndpointName=FACECHAIN_SAGEMAKER_ENDPOINT_NAME,
-        ContentType='application/json',
-        Body=json.dumps(request_body)
-    )
-    
-    return {
-        'statusCode': 200,
-        'body': json.dumps('Face swap complete')
-    }
\ No newline at end of file
+    return unmarshall_item(ddb_response['Items'][0])
@@ -0,0 +1,42 @@
+#!/usr/bin/env bash
+
+# Builds the optional face detector layer for face-crop (OpenCV + YuNet ONNX model)
+# and publishes it. Set the printed ARN as face_detector_layer_arn in cdk.context.json.
+#
+# numpy comes from the numpy layer face-crop already uses, so OpenCV is installed without it.
+
+set -e
+
+layer_name=AmazonBedrockGalleryFaceDetectorLayer
+opencv_version=4.10.0.84
+model_url=https://github.com/opencv/opencv_zoo/raw/main/models/face_detection_yunet/face_detection_yunet_2023mar.onnx
+
+# Region, defaults to us-west-2
+region=$(aws configure get region)
+region=${region:-us-west-2}
+
+build_dir=$(mktemp -d)
+trap 'rm -rf "${build_dir}"' EXIT
+
+pip install \
+    --platform manylinux2014_x86_64 \
+    --python-version 3.11 \
+    --only-binary=:all: \
+    --no-deps \
+    --target "${build_dir}/python" \
+    "opencv-python-headless==${opencv_version}"
+
+# Extracted to /opt/face-detector, the default FACE_DETECTOR_MODEL_PATH directory
+mkdir -p "${build_dir}/face-detector"
+curl -sSL -o "${build_dir}/face-detector/face_detection_yunet_2023mar.onnx" "${model_url}"
+
+(cd "${build_dir}" && zip -qr9 layer.zip python face-detector)
+
+aws lambda publish-layer-version \
+    --region "${region}" \
+    --layer-name "${layer_name}" \
+    --description "OpenCV ${opencv_version} and the YuNet face detection model for face-crop" \
+    --compatible-runtimes python3.11 \
+    --zip-file "fileb://${build_dir}/layer.zip" \
+    --query LayerVersionArn \
+    --output text
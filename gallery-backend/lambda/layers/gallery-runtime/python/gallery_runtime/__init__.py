@@ -0,0 +1,6 @@
+"""Shared runtime helpers for the gallery API and image-processing Lambdas.
+
+Packaged as a Lambda layer (lambda/layers/gallery-runtime), so it is importable
+from /opt/python in every function that attaches the layer. Submodules are kept
+import-light: boto3 is only imported when the first client is requested.
+"""
@@ -0,0 +1,83 @@
+import json
+import os
+import time
+from typing import Any, Dict, List
+from gallery_runtime.clients import get_client
+from gallery_runtime.ddb import marshall_item, unmarshall_item
+
+DDB_AMAZON_BEDROCK_USER_AGREEMENT_TABLE_NAME = os.environ.get('DDB_AMAZON_BEDROCK_USER_AGREEMENT_TABLE_NAME')
+# The user-agreement API enqueues agreements here for user-agreement-writer; unset writes them directly
+USER_AGREEMENT_QUEUE_URL = os.environ.get('USER_AGREEMENT_QUEUE_URL')
+BATCH_WRITE_MAX_ITEMS = 25
+# Resubmissions of the items a batch write leaves unprocessed (throttling), with exponential backoff
+UNPROCESSED_RETRY_ATTEMPTS = 3
+UNPROCESSED_RETRY_BASE_SECONDS = 0.05
+
+def is_buffered() -> bool:
+    return bool(USER_AGREEMENT_QUEUE_URL)
+
+def agreement_item(request_body: Dict[str, Any]) -> Dict[str, Any]:
+    """The user agreement table item of a request; raises ValueError when a field is missing."""
+    image_id = request_body.get('id')
+    name = request_body.get('name')
+    agree = request_body.get('agree')
+    saved_at = request_body.get('savedAt')
+    user_id = request_body.get('userId')
+
+    if not image_id or not name or agree is None or not saved_at:
+        raise ValueError('Missing required fields')
+
+    return {
+        'PK': f'USERID#{user_id}#NAME#{name}',
+        'savedAt': saved_at,
+        'name': name,
+        'agree': agree,
+        'userId': user_id,
+        'imageId': image_id
+    }
+
+def idempotency_key(item: Dict[str, Any]) -> str:
+    """The item's table key: a resubmitted agreement (same savedAt) or a redelivered message maps to it."""
+    return f"{item['PK']}#{item['savedAt']}"
+
+def enqueue_agreement(item: Dict[str, Any]) -> None:
+    get_client('sqs').send_message(
+        QueueUrl=USER_AGREEMENT_QUEUE_URL,
+        MessageBody=json.dumps({'idempotencyKey': idempotency_key(item), 'item': item})
+    )
+
+def put_agreement(item: Dict[str, Any]) -> None:
+    get_client('dynamodb').put_item(
+        TableName=DDB_AMAZON_BEDROCK_USER_AGREEMENT_TABLE_NAME,
+        Item=marshall_item(item)
+    )
+
+def write_agreements(items: Dict[str, Dict[str, Any]]) -> List[str]:
+    """Write items (by idempotency key) with batch_write_item; returns the keys left unprocessed.
+
+    A batch write may not contain one key twice, so items must hold one item per key.
+    Writing an agreement again puts the same item, so redelivered batches are harmless.
+    """
+    keys = list(items)
+    unprocessed_keys = []
+    for start in range(0, len(keys), BATCH_WRITE_MAX_ITEMS):
+        chunk = [items[key] for key in keys[start:start + BATCH_WRITE_MAX_ITEMS]]
+        unprocessed_keys += write_batch(chunk)
+    return unprocessed_keys
+
+def write_batch(batch: List[Dict[str, Any]]) -> List[str]:
+    request_items = {
+        DDB_AMAZON_BEDROCK_USER_AGREEMENT_TABLE_NAME: [{'PutRequest': {'Item': marshall_item(item)}} for item in batch]
+    }
+    for attempt in range(UNPROCESSED_RETRY_ATTEMPTS + 1):
+        if attempt:
+            time.sleep(UNPROCESSED_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+        response = get_client('dynamodb').batch_write_item(RequestItems=request_items)
+        request_items = response.get('UnprocessedItems') or {}
+        if not request_items:
+            return []
+
+    return [
+        idempotency_key(unmarshall_item(request['PutRequest']['Item']))
+        for request in request_items.get(DDB_AMAZON_BEDROCK_USER_AGREEMENT_TABLE_NAME, [])
+    ]
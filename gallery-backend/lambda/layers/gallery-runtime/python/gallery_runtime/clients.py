@@ -0,0 +1,72 @@
+import threading
+from typing import Any, Dict, Optional
+
+# Fail fast on connect, retry throttling/transient errors with the standard mode and
+# keep enough pooled connections for the handlers that fan out over threads.
+DEFAULT_CLIENT_CONFIG = {
+    'connect_timeout': 2,
+    'read_timeout': 10,
+    'retries': {'mode': 'standard', 'total_max_attempts': 3},
+    'max_pool_connections': 16,
+    'tcp_keepalive': True
+}
+
+# Per-service overrides. A synchronous FaceChain inference can take most of the 60s
+# face-swap timeout, and retrying it would run the GPU job twice.
+SERVICE_CLIENT_CONFIGS = {
+    'sagemaker-runtime': {
+        'read_timeout': 65,
+        'retries': {'mode': 'standard', 'total_max_attempts': 1}
+    },
+    # Sends are small; the user-agreement API writes directly instead of waiting on a slow queue
+    'sqs': {
+        'connect_timeout': 1,
+        'read_timeout': 2,
+        'retries': {'mode': 'standard', 'total_max_attempts': 2}
+    },
+    # Calls that must not outlive a short wait, on a client of their own ('service/purpose').
+    # The template prefetch hint is only worth the container's immediate answer; an endpoint
+    # busy with an inference answers too late for the hint to help, so it is dropped instead.
+    'sagemaker-runtime/prefetch': {
+        'connect_timeout': 0.5,
+        'read_timeout': 0.5,
+        'retries': {'mode': 'standard', 'total_max_attempts': 1}
+    }
+}
+
+_clients: Dict[str, Any] = {}
+_registered: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+def get_client(service_name: str, purpose: Optional[str] = None) -> Any:
+    """Return the process-wide client for service_name, creating it on first use.
+
+    purpose selects a separately configured client of the service (see SERVICE_CLIENT_CONFIGS).
+    """
+    key = f'{service_name}/{purpose}' if purpose else service_name
+    client = _registered.get(service_name) or _clients.get(key)
+    if client is not None:
+        return client
+
+    # boto3's default session is not thread-safe while it creates clients
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            import boto3
+            from botocore.config import Config
+
+            config = dict(DEFAULT_CLIENT_CONFIG, **SERVICE_CLIENT_CONFIGS.get(service_name, {}))
+            config.update(SERVICE_CLIENT_CONFIGS.get(key, {}))
+            client = boto3.client(service_name, config=Config(**config))
+            _clients[key] = client
+    return client
+
+def register_client(service_name: str, client: Any) -> None:
+    """Use client for service_name, whatever the purpose, instead of creating one (local harnesses and stubs)."""
+    with _lock:
+        _registered[service_name] = client
+
+def reset_clients() -> None:
+    with _lock:
+        _clients.clear()
+        _registered.clear()
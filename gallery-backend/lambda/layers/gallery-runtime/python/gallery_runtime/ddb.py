@@ -0,0 +1,69 @@
+from decimal import Decimal
+from typing import Any, Dict, Mapping, Union
+
+AttributeValue = Dict[str, Any]
+Item = Dict[str, AttributeValue]
+Number = Union[int, Decimal]
+
+def marshall(value: Any) -> AttributeValue:
+    """Convert a Python value into a low-level DynamoDB AttributeValue."""
+    if value is None:
+        return {'NULL': True}
+    if isinstance(value, bool):
+        return {'BOOL': value}
+    if isinstance(value, str):
+        return {'S': value}
+    if isinstance(value, (int, Decimal)):
+        return {'N': str(value)}
+    if isinstance(value, float):
+        # Go through str() so 0.1 is stored as "0.1" rather than its binary expansion
+        return {'N': str(Decimal(str(value)))}
+    if isinstance(value, (bytes, bytearray)):
+        return {'B': bytes(value)}
+    if isinstance(value, Mapping):
+        return {'M': marshall_item(value)}
+    if isinstance(value, (list, tuple)):
+        return {'L': [marshall(element) for element in value]}
+    if isinstance(value, (set, frozenset)) and value:
+        if all(isinstance(element, str) for element in value):
+            return {'SS': sorted(value)}
+        if all(isinstance(element, (int, Decimal)) and not isinstance(element, bool) for element in value):
+            return {'NS': [str(element) for element in sorted(value)]}
+    raise TypeError(f"Unsupported DynamoDB attribute type: {type(value).__name__}")
+
+def unmarshall(attribute_value: AttributeValue) -> Any:
+    """Convert a low-level DynamoDB AttributeValue into a Python value."""
+    (attribute_type, value), = attribute_value.items()
+    if attribute_type == 'S':
+        return value
+    if attribute_type == 'N':
+        return _to_number(value)
+    if attribute_type == 'BOOL':
+        return value
+    if attribute_type == 'NULL':
+        return None
+    if attribute_type == 'B':
+        return value
+    if attribute_type == 'M':
+        return unmarshall_item(value)
+    if attribute_type == 'L':
+        return [unmarshall(element) for element in value]
+    if attribute_type == 'SS':
+        return set(value)
+    if attribute_type == 'NS':
+        return {_to_number(element) for element in value}
+    if attribute_type == 'BS':
+        return set(value)
+    raise TypeError(f"Unsupported DynamoDB attribute type: {attribute_type}")
+
+def marshall_item(item: Mapping[str, Any]) -> Item:
+    return {key: marshall(value) for key, value in item.items()}
+
+def unmarshall_item(item: Mapping[str, AttributeValue]) -> Dict[str, Any]:
+    return {key: unmarshall(value) for key, value in item.items()}
+
+def _to_number(value: str) -> Number:
+    try:
+        return int(value)
+    except ValueError:
+        return Decimal(value)
@@ -0,0 +1,69 @@
+import os
+import time
+from typing import Any, Dict, Optional
+from gallery_runtime.clients import get_client
+from gallery_runtime.ddb import marshall_item, unmarshall_item
+
+# Completed jobs by user and theme, so face-crop can reuse the result of a repeated upload.
+# Unset disables deduplication.
+DDB_AMAZON_BEDROCK_GALLERY_DEDUP_TABLE_NAME = os.environ.get('DDB_AMAZON_BEDROCK_GALLERY_DEDUP_TABLE_NAME')
+# How long a completed job can be reused (the table's TTL attribute is expires_at)
+DEDUP_TTL_SECONDS = int(os.environ.get('DEDUP_TTL_SECONDS', '3600'))
+# Perceptual hashes at most this many bits apart count as the same photo
+DEDUP_MAX_HASH_DISTANCE = int(os.environ.get('DEDUP_MAX_HASH_DISTANCE', '4'))
+
+def is_enabled() -> bool:
+    return bool(DDB_AMAZON_BEDROCK_GALLERY_DEDUP_TABLE_NAME)
+
+def dedup_key(user_id: str, theme: str) -> str:
+    return f'#USERID#{user_id}#THEME#{theme}'
+
+def hash_distance(perceptual_hash: str, other_perceptual_hash: str) -> int:
+    return bin(int(perceptual_hash, 16) ^ int(other_perceptual_hash, 16)).count('1')
+
+def find_completed_job(user_id: str, theme: str, gender: str, skin: str,
+                       content_hash: str, perceptual_hash: str) -> Optional[Dict[str, Any]]:
+    """The recent completed job of this user and theme with the same photo, or None.
+
+    An identical upload (same content hash) wins over the closest perceptual match.
+    Only jobs with the same gender and skin are considered, as those select the base image.
+    """
+    response = get_client('dynamodb').query(
+        TableName=DDB_AMAZON_BEDROCK_GALLERY_DEDUP_TABLE_NAME,
+        KeyConditionExpression='PK = :pk',
+        ExpressionAttributeValues={':pk': {'S': dedup_key(user_id, theme)}}
+    )
+
+    now = int(time.time())
+    best_match, best_distance = None, DEDUP_MAX_HASH_DISTANCE + 1
+    for item in response['Items']:
+        job = unmarshall_item(item)
+        # TTL deletes expired items eventually, not at expires_at
+        if int(job['expires_at']) <= now or job['gender'] != gender or job['skin'] != skin:
+            continue
+        if job['SK'] == content_hash:
+            return job
+        distance = hash_distance(perceptual_hash, job['perceptual_hash'])
+        if distance < best_distance:
+            best_match, best_distance = job, distance
+    return best_match
+
+def record_completed_job(process_item: Dict[str, Any], uuid: str, result_object_key: str) -> None:
+    """Make a completed job reusable by later uploads of the same photo."""
+    now = int(time.time())
+    get_client('dynamodb').put_item(
+        TableName=DDB_AMAZON_BEDROCK_GALLERY_DEDUP_TABLE_NAME,
+        Item=marshall_item({
+            'PK': dedup_key(process_item['userId'], process_item['theme']),
+            'SK': process_item['content_hash'],
+            'perceptual_hash': process_item['perceptual_hash'],
+            'uuid': uuid,
+            'gender': process_item['gender'],
+            'skin': process_item['skin'],
+            'base_image_object_key': process_item['base_image_object_key'],
+            'base_story': process_item['base_story'],
+            'result_object_key': result_object_key,
+            'created_at': now,
+            'expires_at': now + DEDUP_TTL_SECONDS
+        })
+    )
@@ -0,0 +1,77 @@
+import math
+import os
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+from gallery_runtime.clients import get_client
+from gallery_runtime.display_images import content_type
+
+# Result images go out through the ResultDeliveryStack CloudFront distribution when this is set,
+# otherwise as S3 presigned URLs (a new URL on every request, so nothing is cached)
+RESULT_CDN_DOMAIN_NAME = os.environ.get('RESULT_CDN_DOMAIN_NAME')
+RESULT_CDN_KEY_PAIR_ID = os.environ.get('RESULT_CDN_KEY_PAIR_ID')
+# Secrets Manager secret holding the PEM private key that matches the distribution's public key
+RESULT_CDN_PRIVATE_KEY_SECRET_ID = os.environ.get('RESULT_CDN_PRIVATE_KEY_SECRET_ID')
+# Signed URLs expire at the end of a window instead of a fixed time after signing, so every
+# request within a window gets the same URL and browsers reuse their cached copy
+RESULT_CDN_URL_WINDOW_SECONDS = int(os.environ.get('RESULT_CDN_URL_WINDOW_SECONDS', '3600'))
+# A URL is always valid for at least this long after it was issued
+RESULT_CDN_URL_MIN_TTL_SECONDS = int(os.environ.get('RESULT_CDN_URL_MIN_TTL_SECONDS', '300'))
+PRESIGNED_URL_EXPIRES_IN = 300
+
+_signer = None
+_lock = threading.Lock()
+
+def is_cdn_enabled() -> bool:
+    return bool(RESULT_CDN_DOMAIN_NAME)
+
+def quantized_expiry(now: float, window_seconds: int = RESULT_CDN_URL_WINDOW_SECONDS,
+                     min_ttl_seconds: int = RESULT_CDN_URL_MIN_TTL_SECONDS) -> int:
+    """The end of the window that is still at least min_ttl_seconds away, in epoch seconds."""
+    return int(math.ceil((now + min_ttl_seconds) / window_seconds) * window_seconds)
+
+def rsa_signer(private_key_pem: bytes) -> Callable[[bytes], bytes]:
+    """SHA-1 RSA (PKCS #1 v1.5), the signature CloudFront expects."""
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding
+
+    private_key = serialization.load_pem_private_key(private_key_pem, password=None)
+    return lambda message: private_key.sign(message, padding.PKCS1v15(), hashes.SHA1())
+
+def create_signer(key_pair_id: str, private_key_pem: bytes) -> Any:
+    from botocore.signers import CloudFrontSigner
+
+    return CloudFrontSigner(key_pair_id, rsa_signer(private_key_pem))
+
+def get_signer() -> Any:
+    """The process-wide signer, with the private key read from Secrets Manager on first use."""
+    global _signer
+    if _signer is None:
+        with _lock:
+            if _signer is None:
+                secret = get_client('secretsmanager').get_secret_value(SecretId=RESULT_CDN_PRIVATE_KEY_SECRET_ID)
+                _signer = create_signer(RESULT_CDN_KEY_PAIR_ID, secret['SecretString'].encode('utf-8'))
+    return _signer
+
+def signed_cdn_url(signer: Any, domain_name: str, object_key: str, expires_at: int) -> str:
+    """A canned-policy signed URL for object_key; the same arguments always give the same URL."""
+    url = f"https://{domain_name}/{urllib.parse.quote(object_key)}"
+    return signer.generate_presigned_url(url, date_less_than=datetime.fromtimestamp(expires_at, timezone.utc))
+
+def image_url(bucket_name: str, object_key: str, now: Optional[float] = None) -> str:
+    """The URL a display loads object_key from: signed CloudFront when configured, else presigned S3."""
+    if is_cdn_enabled():
+        return signed_cdn_url(get_signer(), RESULT_CDN_DOMAIN_NAME, object_key,
+                              quantized_expiry(time.time() if now is None else now))
+
+    return get_client('s3').generate_presigned_url(
+        'get_object',
+        Params={
+            'Bucket': bucket_name,
+            'Key': object_key,
+            'ResponseContentType': content_type(object_key)
+        },
+        ExpiresIn=PRESIGNED_URL_EXPIRES_IN
+    )
@@ -0,0 +1,32 @@
+import os
+from typing import Any, Dict, Optional
+
+# Sizes the image APIs serve and the display/history item attribute holding each one's key.
+# 'full' is the PNG FaceChain wrote; the others are derivatives face-swap-completion renders.
+SIZE_ATTRIBUTES = {
+    'full': 'result_object_key',
+    'display': 'display_object_key',
+    'thumbnail': 'thumbnail_object_key'
+}
+DEFAULT_SIZE = 'full'
+CONTENT_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.webp': 'image/webp'
+}
+
+def parse_size(size: Optional[str]) -> str:
+    """The requested size, DEFAULT_SIZE when none was given; raises ValueError for an unknown one."""
+    if not size:
+        return DEFAULT_SIZE
+    if size not in SIZE_ATTRIBUTES:
+        raise ValueError(f"size must be one of {', '.join(SIZE_ATTRIBUTES)}.")
+    return size
+
+def image_object_key(item: Dict[str, Any], size: str) -> Optional[str]:
+    """The key of the item's image at size; results completed before derivatives existed only have the full one."""
+    return item.get(SIZE_ATTRIBUTES[size]) or item.get(SIZE_ATTRIBUTES['full'])
+
+def content_type(object_key: str) -> str:
+    return CONTENT_TYPES.get(os.path.splitext(object_key)[1].lower(), 'image/jpeg')
@@ -0,0 +1,60 @@
+from typing import Any, Dict, List, Optional, Sequence
+from gallery_runtime.job_metadata import MAX_METADATA_SIZE, metadata_size
+
+# The user's face landmarks as face-crop detected them, so FaceChain aligns the face with
+# them instead of running its own detection on the crop (source_landmarks in the request).
+# Five [x, y] points as ratios of the crop, in FaceChain's order: the eye on the image's left,
+# the other eye, the nose, then the mouth corner on the image's left and the other one.
+# Detectors disagree on which side is 'left', so eyes and mouth corners are ordered by position.
+LANDMARK_TYPES = ('eyeLeft', 'eyeRight', 'nose', 'mouthLeft', 'mouthRight')
+# Crop object metadata (x-amz-meta-face-landmarks) carrying them to face-swap
+METADATA_NAME = 'face-landmarks'
+
+def crop_landmarks(face_detail: Dict[str, Any], image_size: Sequence[int], crop_box: Sequence[int]) -> Optional[List[List[float]]]:
+    """The five landmarks of face_detail relative to crop_box (left, top, right, bottom) of the image.
+
+    None when the detector did not return all five.
+    """
+    image_width, image_height = image_size
+    points = {
+        landmark['Type']: (landmark['X'] * image_width, landmark['Y'] * image_height)
+        for landmark in face_detail.get('Landmarks') or []
+    }
+    if not all(landmark_type in points for landmark_type in LANDMARK_TYPES):
+        return None
+
+    left, top, right, bottom = crop_box
+    eyes = sorted([points['eyeLeft'], points['eyeRight']])
+    mouth_corners = sorted([points['mouthLeft'], points['mouthRight']])
+    return [
+        [round((x - left) / (right - left), 4), round((y - top) / (bottom - top), 4)]
+        for x, y in [*eyes, points['nose'], *mouth_corners]
+    ]
+
+def encode_landmarks(landmarks: List[List[float]]) -> str:
+    return ','.join(f'{value:g}' for point in landmarks for value in point)
+
+def decode_landmarks(value: Optional[str]) -> Optional[List[List[float]]]:
+    """The landmarks of a metadata value, or None when it is missing or malformed."""
+    try:
+        values = [float(part) for part in (value or '').split(',')]
+    except ValueError:
+        return None
+    if len(values) != 2 * len(LANDMARK_TYPES):
+        return None
+    return [values[index:index + 2] for index in range(0, len(values), 2)]
+
+def add_landmarks_metadata(metadata: Dict[str, str], landmarks: Optional[List[List[float]]]) -> Dict[str, str]:
+    """metadata with the landmarks added, within the S3 metadata limit.
+
+    The story gives way first, as it is the cheaper one to recover (face-swap-completion
+    reads it from the process table); the landmarks are left out if that is not enough.
+    """
+    if not landmarks:
+        return metadata
+    metadata = dict(metadata, **{METADATA_NAME: encode_landmarks(landmarks)})
+    if metadata_size(metadata) > MAX_METADATA_SIZE:
+        metadata.pop('base-story', None)
+    if metadata_size(metadata) > MAX_METADATA_SIZE:
+        del metadata[METADATA_NAME]
+    return metadata
@@ -0,0 +1,100 @@
+import base64
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+from gallery_runtime.clients import get_client
+
+# Async mode: requests are queued by the endpoint (see AsyncInferenceConfig) instead of awaited.
+# The result landing under the results path triggers face-swap-completion either way.
+FACECHAIN_ASYNC_INFERENCE = os.environ.get('FACECHAIN_ASYNC_INFERENCE', 'false').lower() == 'true'
+# Where the request payloads of async invocations are written; nothing is notified there
+FACECHAIN_ASYNC_INPUT_PATH = os.environ.get('FACECHAIN_ASYNC_INPUT_PATH', 'sagemaker/async-inference/input/')
+
+def build_face_swap_request(uuid: str, bucket: str, target_object_key: str, output_object_key: str,
+                            source_object_key: Optional[str] = None, source_bytes: Optional[bytes] = None,
+                            metadata: Optional[Dict[str, str]] = None,
+                            source_landmarks: Optional[List[List[float]]] = None) -> Dict[str, Any]:
+    """The FaceChain /invocations payload (see byoc/facechain/src/predictor.py).
+
+    The source face is either an S3 key the endpoint downloads, or the image itself
+    (base64) so the endpoint skips that download. source_object_key is still sent with
+    inline bytes, as the key the crop is kept under. metadata is the job metadata for the
+    result object (see gallery_runtime.job_metadata). source_landmarks are the face's five
+    points from face-crop (see gallery_runtime.face_landmarks), so the endpoint skips its
+    own detection on the source.
+    """
+    request_body = {
+        'uuid': uuid,
+        'bucket': bucket,
+        'source': source_object_key,
+        'target': target_object_key,
+        'output': output_object_key
+    }
+    if metadata:
+        request_body['metadata'] = metadata
+    if source_landmarks:
+        request_body['source_landmarks'] = source_landmarks
+    if source_bytes is not None:
+        request_body['source_bytes'] = base64.b64encode(source_bytes).decode('ascii')
+    return request_body
+
+def invoke_face_swap(endpoint_name: str, request_body: Dict[str, Any], target_variant: Optional[str] = None) -> float:
+    """Run the synchronous FaceChain inference and return its duration in milliseconds.
+
+    target_variant pins the request to one production variant instead of the weighted choice.
+    """
+    started_at = time.time()
+    invoke_args = {'TargetVariant': target_variant} if target_variant else {}
+    get_client('sagemaker-runtime').invoke_endpoint(
+        EndpointName=endpoint_name,
+        ContentType='application/json',
+        Body=json.dumps(request_body),
+        **invoke_args
+    )
+    return round((time.time() - started_at) * 1000, 3)
+
+def send_template_prefetch(endpoint_name: str, uuid: str, bucket: str, target_object_key: str) -> None:
+    """Ask the FaceChain container to download the template of a job ahead of its inference.
+
+    The container answers as soon as the download is queued, so the call is made with the
+    short timeouts of the prefetch client; it raises when the endpoint is busy. Async
+    endpoints only take queued invocations, which would arrive too late, so this is for
+    synchronous ones.
+    """
+    get_client('sagemaker-runtime', 'prefetch').invoke_endpoint(
+        EndpointName=endpoint_name,
+        ContentType='application/json',
+        Body=json.dumps({'action': 'prefetch', 'uuid': uuid, 'bucket': bucket, 'target': target_object_key})
+    )
+
+def invoke_face_swap_async(endpoint_name: str, request_body: Dict[str, Any]) -> Dict[str, Any]:
+    """Queue the FaceChain inference and return as soon as the endpoint has accepted it.
+
+    Async invocations take their payload from S3, so the request is written there first.
+    """
+    started_at = time.time()
+    input_object_key = os.path.join(FACECHAIN_ASYNC_INPUT_PATH, f"{request_body['uuid']}.json")
+    get_client('s3').put_object(
+        Bucket=request_body['bucket'],
+        Key=input_object_key,
+        Body=json.dumps(request_body),
+        ContentType='application/json'
+    )
+    response = get_client('sagemaker-runtime').invoke_endpoint_async(
+        EndpointName=endpoint_name,
+        ContentType='application/json',
+        InputLocation=f"s3://{request_body['bucket']}/{input_object_key}",
+        InferenceId=request_body['uuid']
+    )
+    return {
+        'inference_id': response.get('InferenceId'),
+        'submit_ms': round((time.time() - started_at) * 1000, 3)
+    }
+
+def run_face_swap(endpoint_name: str, request_body: Dict[str, Any], target_variant: Optional[str] = None) -> Dict[str, Any]:
+    """Run or, in async mode, queue the inference; returns the fields for the face_swap stage record."""
+    if FACECHAIN_ASYNC_INFERENCE:
+        # Async invocations cannot be pinned to a variant
+        return dict(invoke_face_swap_async(endpoint_name, request_body), async_inference=True)
+    return {'inference_ms': invoke_face_swap(endpoint_name, request_body, target_variant)}
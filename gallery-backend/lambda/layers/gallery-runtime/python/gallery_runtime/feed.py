@@ -0,0 +1,45 @@
+import hashlib
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+# The history feed index (feed-created_at-index) over all results. Every completion writes to
+# it, so its partition key is spread over FEED_SHARDS values instead of one constant; get-gallery
+# queries every shard and merges them newest first. Writers and readers must agree on the count.
+FEED_SHARDS = int(os.environ.get('GALLERY_FEED_SHARDS', '4'))
+# Entries written before the feed was sharded, read as one more shard
+LEGACY_FEED_KEY = '#ALL'
+# The key attributes of a feed index entry, i.e. of its ExclusiveStartKey
+INDEX_KEY_ATTRIBUTES = ('PK', 'feed', 'created_at')
+
+def feed_key(uuid: str) -> str:
+    """The feed shard of a result, stable for its uuid so a repeated completion stays in place."""
+    shard = int(hashlib.sha1(uuid.encode('utf-8')).hexdigest()[:8], 16) % FEED_SHARDS
+    return f'{LEGACY_FEED_KEY}#{shard}'
+
+def feed_keys() -> List[str]:
+    return [f'{LEGACY_FEED_KEY}#{shard}' for shard in range(FEED_SHARDS)] + [LEGACY_FEED_KEY]
+
+def index_key(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {name: item[name] for name in INDEX_KEY_ATTRIBUTES}
+
+def merge_pages(responses: Dict[str, Dict[str, Any]], positions: Dict[str, Optional[Dict[str, Any]]],
+                page_size: int) -> Tuple[List[Dict[str, Any]], Dict[str, Optional[Dict[str, Any]]]]:
+    """The newest page_size items of the shard query responses, and where each shard continues.
+
+    responses are the query responses by feed key (raw DynamoDB items, newest first) and
+    positions the ExclusiveStartKey each was queried with (None from the top). A shard is
+    left out of the returned positions once it is exhausted.
+    """
+    candidates = [(item, key) for key, response in responses.items() for item in response['Items']]
+    candidates.sort(key=lambda candidate: (candidate[0]['created_at']['S'], candidate[0]['PK']['S']), reverse=True)
+    page = candidates[:page_size]
+
+    next_positions = {}
+    for key, response in responses.items():
+        taken = [item for item, item_key in page if item_key == key]
+        if len(taken) < len(response['Items']):
+            # The shard's next item did not make this page; continue right after its last one shown
+            next_positions[key] = index_key(taken[-1]) if taken else positions[key]
+        elif response.get('LastEvaluatedKey'):
+            next_positions[key] = response['LastEvaluatedKey']
+    return [item for item, _ in page], next_positions
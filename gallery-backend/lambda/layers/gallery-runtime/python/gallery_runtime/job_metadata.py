@@ -0,0 +1,57 @@
+import urllib.parse
+from typing import Any, Dict, Optional
+
+# S3 user-defined metadata (x-amz-meta-*) carried by the upload and every object derived from it,
+# so the stages read the job from the object instead of the process table.
+# S3 limits user-defined metadata to 2 KB (names and values).
+MAX_METADATA_SIZE = 2048
+METADATA_KEYS = {
+    'userId': 'user-id',
+    'theme': 'theme',
+    'gender': 'gender',
+    'skin': 'skin',
+    'base_image_object_key': 'base-image-object-key',
+    'base_story': 'base-story',
+    'content_hash': 'content-hash',
+    'perceptual_hash': 'perceptual-hash',
+    'dedup_of': 'dedup-of'
+}
+REQUIRED_FIELDS = ['userId', 'theme', 'gender', 'skin', 'base_image_object_key']
+
+def metadata_size(metadata: Dict[str, str]) -> int:
+    return sum(len(f'x-amz-meta-{name}') + len(value.encode('utf-8')) for name, value in metadata.items())
+
+def build_metadata(job: Dict[str, Any]) -> Dict[str, str]:
+    """Object metadata for the job fields present in job (process table attribute names).
+
+    Values are percent-encoded, as metadata travels in HTTP headers. The story is left out
+    when it would take the metadata over the S3 limit; readers then fall back to the table.
+    When the rest is still over the limit no metadata is written at all, so the readers take
+    the whole job from the table rather than a partial one from the object.
+    """
+    metadata = {
+        name: urllib.parse.quote(str(job[field]), safe='/')
+        for field, name in METADATA_KEYS.items()
+        if job.get(field) is not None
+    }
+    if metadata_size(metadata) > MAX_METADATA_SIZE:
+        metadata.pop('base-story', None)
+    if metadata_size(metadata) > MAX_METADATA_SIZE:
+        return {}
+    return metadata
+
+def parse_metadata(metadata: Optional[Dict[str, str]]) -> Optional[Dict[str, Any]]:
+    """The job fields of an object's metadata, or None for objects written without them."""
+    metadata = metadata or {}
+    job = {
+        field: urllib.parse.unquote(metadata[name])
+        for field, name in METADATA_KEYS.items()
+        if name in metadata
+    }
+    if not all(field in job for field in REQUIRED_FIELDS):
+        return None
+    return job
+
+def presigned_post_metadata(job: Dict[str, Any]) -> Dict[str, str]:
+    """The same metadata as presigned POST form fields (x-amz-meta-*)."""
+    return {f'x-amz-meta-{name}': value for name, value in build_metadata(job).items()}
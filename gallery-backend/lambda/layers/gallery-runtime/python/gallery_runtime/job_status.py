@@ -0,0 +1,75 @@
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from gallery_runtime.clients import get_client
+
+DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME = os.environ.get('DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME')
+# Latest job of a user, newest first by created_at (see DDBTables)
+USER_JOBS_INDEX_NAME = 'userId-created_at-index'
+
+# Pipeline stages in order, and the process table attribute holding when each one began.
+# put-image writes created_at, face-crop cropped_at or rejected_at, face-swap swapping_at
+# and face-swap-completion completed_at. The current stage is the last one with a timestamp,
+# so a late or repeated write can never move a job back.
+STAGES = ('issued', 'cropped', 'swapping', 'completed')
+STAGE_ATTRIBUTES = {
+    'issued': 'created_at',
+    'cropped': 'cropped_at',
+    'rejected': 'rejected_at',
+    'swapping': 'swapping_at',
+    'completed': 'completed_at'
+}
+FINAL_STAGES = ('completed', 'rejected')
+# Typical seconds a job spends in each unfinished stage: the upload and face-crop, the hand-off
+# to face-swap, and the inference with face-swap-completion
+DEFAULT_STAGE_SECONDS = {'issued': 8, 'cropped': 3, 'swapping': 20}
+JOB_STAGE_SECONDS = {**DEFAULT_STAGE_SECONDS, **json.loads(os.environ.get('JOB_STAGE_SECONDS') or '{}')}
+
+def now_iso() -> str:
+    # The format and clock of the other process table timestamps
+    return datetime.now().isoformat()
+
+def stage_set_expressions(stages: List[str], value_name: str = ':stage_at') -> List[str]:
+    """SET clauses recording that stages began at value_name; the first time is kept on redelivery."""
+    return [f'{STAGE_ATTRIBUTES[stage]} = if_not_exists({STAGE_ATTRIBUTES[stage]}, {value_name})' for stage in stages]
+
+def record_stage(job_id: str, stage: str) -> None:
+    """Record that the job entered stage; best effort, as only get-job-status reads it."""
+    try:
+        get_client('dynamodb').update_item(
+            TableName=DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME,
+            Key={'PK': {'S': f'#UUID#{job_id}'}},
+            UpdateExpression='SET ' + ', '.join(stage_set_expressions([stage])),
+            # Never create entries for objects put-image did not issue
+            ConditionExpression='attribute_exists(PK)',
+            ExpressionAttributeValues={':stage_at': {'S': now_iso()}}
+        )
+    except get_client('dynamodb').exceptions.ConditionalCheckFailedException:
+        print(f"No process entry for {job_id}, stage {stage} not recorded")
+    except Exception as e:
+        print(f"Could not record stage {stage} of {job_id}: {str(e)}")
+
+def current_stage(item: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+    """The stage the job is in and when it began."""
+    if item.get(STAGE_ATTRIBUTES['rejected']):
+        return 'rejected', item[STAGE_ATTRIBUTES['rejected']]
+    for stage in reversed(STAGES):
+        if item.get(STAGE_ATTRIBUTES[stage]):
+            return stage, item[STAGE_ATTRIBUTES[stage]]
+    return STAGES[0], None
+
+def remaining_seconds(stage: str, stage_started_at: Optional[str], now: Optional[datetime] = None) -> Optional[float]:
+    """Estimated seconds until the result is on the display, None once the job is finished.
+
+    The time already spent in the current stage counts against its typical duration only,
+    so a slow stage shows the rest of the pipeline instead of zero.
+    """
+    if stage in FINAL_STAGES:
+        return None
+    now = now or datetime.now()
+    elapsed = (now - datetime.fromisoformat(stage_started_at)).total_seconds() if stage_started_at else 0
+    remaining = max(JOB_STAGE_SECONDS[stage] - elapsed, 0)
+    for later_stage in STAGES[STAGES.index(stage) + 1:]:
+        remaining += JOB_STAGE_SECONDS.get(later_stage, 0)
+    return round(remaining, 1)
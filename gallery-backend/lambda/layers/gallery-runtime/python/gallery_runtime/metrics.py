@@ -0,0 +1,53 @@
+import json
+import sys
+import time
+from datetime import datetime
+from typing import Any, Optional
+
+NAMESPACE = 'AmazonBedrockGallery/Pipeline'
+STAGE_RECORD = 'pipeline_stage'
+
+def emit_stage(correlation_id: str, stage: str, started_at: float, finished_at: Optional[float] = None,
+               triggered_at: Optional[float] = None, **properties: Any) -> None:
+    """Print one pipeline stage record in CloudWatch Embedded Metric Format.
+
+    correlation_id is the image object name built by put-image, which every stage can
+    recover from its S3 key. Timestamps are epoch seconds; triggered_at is when the
+    event that started the stage was produced (e.g. the S3 eventTime), so the gap to
+    started_at is the notification/queueing delay in front of the stage.
+    """
+    finished_at = time.time() if finished_at is None else finished_at
+    metrics = [{'Name': 'StageDuration', 'Unit': 'Milliseconds'}]
+    record = {
+        'record': STAGE_RECORD,
+        'correlationId': correlation_id,
+        'Stage': stage,
+        'startedAt': started_at,
+        'finishedAt': finished_at,
+        'StageDuration': round((finished_at - started_at) * 1000, 3)
+    }
+    if triggered_at is not None:
+        metrics.append({'Name': 'TriggerDelay', 'Unit': 'Milliseconds'})
+        record['triggeredAt'] = triggered_at
+        record['TriggerDelay'] = round(max(0.0, started_at - triggered_at) * 1000, 3)
+    record.update(properties)
+    record['_aws'] = {
+        'Timestamp': int(finished_at * 1000),
+        'CloudWatchMetrics': [{
+            'Namespace': NAMESPACE,
+            'Dimensions': [['Stage']],
+            'Metrics': metrics
+        }]
+    }
+    write_line(json.dumps(record))
+
+def write_line(line: str) -> None:
+    # One write per record: print() writes the text and the newline separately, which lets
+    # records from handler threads run into each other in the log stream
+    sys.stdout.write(line + '\n')
+
+def parse_event_time(event_time: Optional[str]) -> Optional[float]:
+    """Convert an S3/SQS event time such as 2025-01-01T00:00:00.000Z to epoch seconds."""
+    if not event_time:
+        return None
+    return datetime.fromisoformat(event_time.replace('Z', '+00:00')).timestamp()
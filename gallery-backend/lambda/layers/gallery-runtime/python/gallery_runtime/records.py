@@ -0,0 +1,109 @@
+import json
+import os
+import traceback
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+from gallery_runtime.metrics import write_line
+
+# Records of one notification handled side by side. The work per record is mostly
+# waiting on S3, DynamoDB, Rekognition or SageMaker, so a few threads are enough.
+DEFAULT_MAX_WORKERS = int(os.environ.get('RECORD_CONCURRENCY', '4'))
+
+class RecordResult:
+    def __init__(self, index: int, record: Dict[str, Any], result: Any = None, error: Optional[BaseException] = None):
+        self.index = index
+        self.record = record
+        self.result = result
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+def record_object_key(record: Dict[str, Any]) -> Optional[str]:
+    key = record.get('s3', {}).get('object', {}).get('key')
+    return urllib.parse.unquote_plus(key) if key else None
+
+def process_records(records: List[Dict[str, Any]], handle_record: Callable[[Dict[str, Any]], Any],
+                    max_workers: Optional[int] = None) -> List[RecordResult]:
+    """Run handle_record for every record, at most max_workers at a time.
+
+    A failing record does not affect the others: its exception is caught, printed as
+    one JSON line with the record's object key and returned in its RecordResult.
+    Results keep the order of the records.
+    """
+    def run(index: int, record: Dict[str, Any]) -> RecordResult:
+        try:
+            return RecordResult(index, record, result=handle_record(record))
+        except Exception as e:
+            write_line(json.dumps({
+                'record': 'record_failure',
+                'index': index,
+                'objectKey': record_object_key(record),
+                'error': f'{type(e).__name__}: {str(e)}',
+                'traceback': traceback.format_exc()
+            }))
+            return RecordResult(index, record, error=e)
+
+    if len(records) <= 1:
+        # No pool for the common single-record notification
+        return [run(index, record) for index, record in enumerate(records)]
+
+    workers = min(len(records), max_workers or DEFAULT_MAX_WORKERS)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run, range(len(records)), records))
+
+def summarize(results: List[RecordResult]) -> Dict[str, Any]:
+    """The Lambda response for a batch, raising when no record could be processed.
+
+    Raising hands a fully failed notification back to Lambda's asynchronous retries,
+    as before. Partial failures are not raised: a retry would redo the records that
+    succeeded (for face-swap, a second GPU inference), so they are reported instead.
+    """
+    failures = [result for result in results if not result.ok]
+    if results and len(failures) == len(results):
+        raise failures[0].error
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'processed': len(results) - len(failures),
+            'failed': [
+                {'objectKey': record_object_key(result.record), 'error': str(result.error)}
+                for result in failures
+            ],
+            'results': [result.result for result in results if result.ok]
+        })
+    }
+
+def handle_event(event: Dict[str, Any], handle_record: Callable[[Dict[str, Any]], Any],
+                 max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """Process the S3 records of an event delivered directly by S3 or through an SQS queue.
+
+    Each SQS message carries one S3 notification. Messages with a failed record are
+    returned as batchItemFailures (the event source mapping must report batch item
+    failures), so only they become visible again and are retried.
+    """
+    messages = event.get('Records', [])
+    if not messages or messages[0].get('eventSource') != 'aws:sqs':
+        return summarize(process_records(messages, handle_record, max_workers))
+
+    s3_records, message_ids, failed_message_ids = [], [], []
+    for message in messages:
+        try:
+            notification = json.loads(message['body'])
+        except ValueError as e:
+            write_line(json.dumps({'record': 'record_failure', 'messageId': message['messageId'], 'error': f'Invalid message body: {str(e)}'}))
+            failed_message_ids.append(message['messageId'])
+            continue
+        # The s3:TestEvent S3 sends when the notification is configured has no Records
+        for s3_record in notification.get('Records', []):
+            s3_records.append(s3_record)
+            message_ids.append(message['messageId'])
+
+    for result in process_records(s3_records, handle_record, max_workers):
+        if not result.ok and message_ids[result.index] not in failed_message_ids:
+            failed_message_ids.append(message_ids[result.index])
+
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failed_message_ids]}
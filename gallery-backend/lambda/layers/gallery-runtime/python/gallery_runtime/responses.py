@@ -0,0 +1,15 @@
+import json
+from typing import Any, Dict, Optional
+
+def create_response(status_code: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """An API Gateway proxy response; headers are set over the default CORS headers."""
+    return {
+        'statusCode': status_code,
+        'body': json.dumps(body),
+        'headers': dict({
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
+            'Access-Control-Allow-Methods': 'OPTIONS,GET,POST'
+        }, **(headers or {}))
+    }
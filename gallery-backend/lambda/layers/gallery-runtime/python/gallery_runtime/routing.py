@@ -0,0 +1,174 @@
+import json
+import os
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from gallery_runtime.clients import get_client
+from gallery_runtime.ddb import marshall_item, unmarshall_item
+from gallery_runtime.metrics import write_line
+
+# Load-aware routing over several FaceChain endpoints/variants, each with a limit on the
+# requests in flight: [{"endpoint": ..., "variant": ... or null, "max_in_flight": ...}].
+# Unset (or no load table) sends every request to FACECHAIN_SAGEMAKER_ENDPOINT_NAME as before.
+FACECHAIN_TARGETS = json.loads(os.environ.get('FACECHAIN_TARGETS') or '[]')
+# One item per target whose leases map holds the jobs in flight: {job id: lease expiry (epoch seconds)}
+DDB_AMAZON_BEDROCK_GALLERY_ENDPOINT_LOAD_TABLE_NAME = os.environ.get('DDB_AMAZON_BEDROCK_GALLERY_ENDPOINT_LOAD_TABLE_NAME')
+# Longer than the function timeout: a lease only outlives its job when the invocation was killed
+FACECHAIN_LEASE_SECONDS = int(os.environ.get('FACECHAIN_LEASE_SECONDS', '90'))
+# Jobs that find every target saturated are sent back through this queue after a backoff
+FACE_SWAP_RETRY_QUEUE_URL = os.environ.get('FACE_SWAP_RETRY_QUEUE_URL')
+FACE_SWAP_RETRY_BASE_SECONDS = float(os.environ.get('FACE_SWAP_RETRY_BASE_SECONDS', '5'))
+FACE_SWAP_RETRY_MAX_DELAY_SECONDS = 900  # the SQS limit on DelaySeconds
+FACE_SWAP_RETRY_MAX_ATTEMPTS = int(os.environ.get('FACE_SWAP_RETRY_MAX_ATTEMPTS', '8'))
+# Carried on the S3 record of a deferred job
+RETRY_ATTEMPT_FIELD = 'faceSwapRetryAttempt'
+
+class EndpointsSaturated(Exception):
+    pass
+
+def is_enabled() -> bool:
+    return bool(FACECHAIN_TARGETS and DDB_AMAZON_BEDROCK_GALLERY_ENDPOINT_LOAD_TABLE_NAME)
+
+def target_key(target: Dict[str, Any]) -> str:
+    return f"#ENDPOINT#{target['endpoint']}#VARIANT#{target.get('variant') or ''}"
+
+def read_leases(job_id: str, now: int) -> List[Dict[str, Any]]:
+    """Every target with its active and expired leases and whether job_id holds one (one BatchGetItem)."""
+    table_name = DDB_AMAZON_BEDROCK_GALLERY_ENDPOINT_LOAD_TABLE_NAME
+    response = get_client('dynamodb').batch_get_item(RequestItems={
+        table_name: {
+            'Keys': [{'PK': {'S': target_key(target)}} for target in FACECHAIN_TARGETS],
+            'ConsistentRead': True
+        }
+    })
+    items = {item['PK']['S']: unmarshall_item(item) for item in response['Responses'].get(table_name, [])}
+
+    loads = []
+    for target in FACECHAIN_TARGETS:
+        item = items.get(target_key(target))
+        leases = {job_id: int(expires_at) for job_id, expires_at in (item or {}).get('leases', {}).items()}
+        loads.append({
+            'target': target,
+            'exists': item is not None,
+            'held': job_id in leases,
+            'active': sum(1 for expires_at in leases.values() if expires_at > now),
+            'expired': {job_id: expires_at for job_id, expires_at in leases.items() if expires_at <= now}
+        })
+    return loads
+
+def create_target_item(target: Dict[str, Any]) -> None:
+    try:
+        get_client('dynamodb').put_item(
+            TableName=DDB_AMAZON_BEDROCK_GALLERY_ENDPOINT_LOAD_TABLE_NAME,
+            Item=marshall_item({'PK': target_key(target), 'endpoint': target['endpoint'],
+                                'variant': target.get('variant') or '', 'leases': {}}),
+            ConditionExpression='attribute_not_exists(PK)'
+        )
+    except get_client('dynamodb').exceptions.ConditionalCheckFailedException:
+        pass  # another invocation created it first
+
+def remove_expired_leases(target: Dict[str, Any], expired: Dict[str, int]) -> None:
+    """Drop the leases of invocations that never released them, unless they were renewed since."""
+    for job_id, expires_at in expired.items():
+        try:
+            get_client('dynamodb').update_item(
+                TableName=DDB_AMAZON_BEDROCK_GALLERY_ENDPOINT_LOAD_TABLE_NAME,
+                Key={'PK': {'S': target_key(target)}},
+                UpdateExpression='REMOVE leases.#job',
+                ConditionExpression='leases.#job = :expires_at',
+                ExpressionAttributeNames={'#job': job_id},
+                ExpressionAttributeValues={':expires_at': {'N': str(expires_at)}}
+            )
+        except get_client('dynamodb').exceptions.ConditionalCheckFailedException:
+            pass  # renewed or already removed
+
+def try_acquire(target: Dict[str, Any], job_id: str, expires_at: int) -> bool:
+    """Take a slot on target unless it is full. A job that already holds one (a redelivery) keeps it."""
+    try:
+        get_client('dynamodb').update_item(
+            TableName=DDB_AMAZON_BEDROCK_GALLERY_ENDPOINT_LOAD_TABLE_NAME,
+            Key={'PK': {'S': target_key(target)}},
+            UpdateExpression='SET leases.#job = :expires_at',
+            ConditionExpression='size(leases) < :max_in_flight OR attribute_exists(leases.#job)',
+            ExpressionAttributeNames={'#job': job_id},
+            ExpressionAttributeValues={
+                ':expires_at': {'N': str(expires_at)},
+                ':max_in_flight': {'N': str(target['max_in_flight'])}
+            }
+        )
+        return True
+    except get_client('dynamodb').exceptions.ConditionalCheckFailedException:
+        return False
+
+def acquire_target(job_id: str) -> Optional[Dict[str, Any]]:
+    """The least loaded target with a free slot, now leased to job_id, or None when all are full.
+
+    Targets are tried by their share of requests in flight (ties in random order, so
+    concurrent invocations spread out); the conditional write is what enforces the limit,
+    the read only orders the attempts.
+    """
+    now = int(time.time())
+    loads = read_leases(job_id, now)
+    random.shuffle(loads)
+    # A redelivered job goes back to the target it already holds
+    loads.sort(key=lambda load: (not load['held'], load['active'] / load['target']['max_in_flight']))
+
+    for load in loads:
+        target = load['target']
+        if load['active'] >= target['max_in_flight'] and not load['held']:
+            continue
+        if not load['exists']:
+            create_target_item(target)
+        if load['expired']:
+            remove_expired_leases(target, load['expired'])
+        if try_acquire(target, job_id, now + FACECHAIN_LEASE_SECONDS):
+            return target
+    return None
+
+def release_target(target: Dict[str, Any], job_id: str) -> None:
+    """Give the slot back; a lease that cannot be removed expires after FACECHAIN_LEASE_SECONDS."""
+    try:
+        get_client('dynamodb').update_item(
+            TableName=DDB_AMAZON_BEDROCK_GALLERY_ENDPOINT_LOAD_TABLE_NAME,
+            Key={'PK': {'S': target_key(target)}},
+            UpdateExpression='REMOVE leases.#job',
+            ExpressionAttributeNames={'#job': job_id}
+        )
+    except Exception as e:
+        write_line(json.dumps({'record': 'lease_release_failure', 'jobId': job_id,
+                               'target': target_key(target), 'error': str(e)}))
+
+@contextmanager
+def endpoint_slot(job_id: str) -> Iterator[Optional[Dict[str, Any]]]:
+    """Hold a slot on the least loaded target while the block runs; yields None when every target is full."""
+    target = acquire_target(job_id)
+    try:
+        yield target
+    finally:
+        if target is not None:
+            release_target(target, job_id)
+
+def retry_delay(attempt: int) -> int:
+    """Exponential backoff with equal jitter, so deferred jobs do not all come back together."""
+    backoff = min(FACE_SWAP_RETRY_MAX_DELAY_SECONDS, FACE_SWAP_RETRY_BASE_SECONDS * 2 ** attempt)
+    return max(1, int(round(backoff / 2 + random.uniform(0, backoff / 2))))
+
+def defer_record(s3_record: Dict[str, Any]) -> Dict[str, Any]:
+    """Send the S3 record to the retry queue for a later attempt; returns the fields for the stage record.
+
+    The message is an S3 notification like the ones the pipeline queues carry, so the
+    retry queue is consumed by the same handler. Raises EndpointsSaturated once the
+    attempts are used up, handing the job to the usual failure handling.
+    """
+    attempt = int(s3_record.get(RETRY_ATTEMPT_FIELD, 0))
+    if attempt >= FACE_SWAP_RETRY_MAX_ATTEMPTS or not FACE_SWAP_RETRY_QUEUE_URL:
+        raise EndpointsSaturated(f'Every FaceChain endpoint is saturated after {attempt} retries')
+
+    delay = retry_delay(attempt)
+    get_client('sqs').send_message(
+        QueueUrl=FACE_SWAP_RETRY_QUEUE_URL,
+        MessageBody=json.dumps({'Records': [dict(s3_record, **{RETRY_ATTEMPT_FIELD: attempt + 1})]}),
+        DelaySeconds=delay
+    )
+    return {'retry_attempt': attempt + 1, 'retry_delay_seconds': delay}
@@ -0,0 +1,71 @@
+import boto3
+
+# (events, function ARN property, queue ARN property, key prefix property) per pipeline stage.
+# Uploads arrive through a presigned POST, so face crop listens for both Put and Post
+STAGES = [
+    (['s3:ObjectCreated:Put', 's3:ObjectCreated:Post'], 'FaceCropLambdaArn', 'FaceCropQueueArn', 'FaceImagesPath'),
+    (['s3:ObjectCreated:Put'], 'FaceSwapLambdaArn', 'FaceSwapQueueArn', 'FaceCroppedImagesPath'),
+    # Copy: face-crop reuses the result of a deduplicated upload with CopyObject
+    (['s3:ObjectCreated:Put', 's3:ObjectCreated:Copy'], 'FaceSwapCompletionLambdaArn', 'FaceSwapCompletionQueueArn', 'ResultImagesPath')
+]
+
+def build_notification_configuration(props):
+    """Notify each stage's Lambda directly, or its SQS queue when the queue ARN is set (queue mode)."""
+    lambda_configurations = []
+    queue_configurations = []
+    for events, function_arn_property, queue_arn_property, prefix_property in STAGES:
+        configuration = {
+            'Events': events,
+            'Filter': {
+                'Key': {
+                    'FilterRules': [
+                        {
+                            'Name': 'prefix',
+                            'Value': props[prefix_property]
+                        }
+                    ]
+                }
+            }
+        }
+        if props.get(queue_arn_property):
+            configuration['QueueArn'] = props[queue_arn_property]
+            queue_configurations.append(configuration)
+        else:
+            configuration['LambdaFunctionArn'] = props[function_arn_property]
+            lambda_configurations.append(configuration)
+
+    notification_configuration = {}
+    if lambda_configurations:
+        notification_configuration['LambdaFunctionConfigurations'] = lambda_configurations
+    if queue_configurations:
+        notification_configuration['QueueConfigurations'] = queue_configurations
+    return notification_configuration
+
+def handler(event, context):
+    props = event['ResourceProperties']
+    bucket_name = props['BucketName']
+    s3 = boto3.client('s3')
+
+    # The Provider framework reports success or failure to CloudFormation from the return value or exception
+    if event['RequestType'] in ['Create', 'Update']:
+        try:
+            s3.put_bucket_notification_configuration(
+                Bucket=bucket_name,
+                NotificationConfiguration=build_notification_configuration(props)
+            )
+        except Exception as e:
+            print(f"Error configuring bucket notifications: {str(e)}")
+            raise e
+    elif event['RequestType'] == 'Delete':
+        try:
+            s3.put_bucket_notification_configuration(
+                Bucket=bucket_name,
+                NotificationConfiguration={}
+            )
+        except Exception as e:
+            print(f"Error clearing bucket notifications: {str(e)}")
+            raise e
+
+    return {
+        'PhysicalResourceId': event.get('PhysicalResourceId', f'{bucket_name}-notifications')
+    }
@@ -4,16 +4,23 @@ from aws_cdk import (
     Duration,
     aws_apigateway as apigw,
     aws_lambda as lambda_,
+    aws_lambda_event_sources as lambda_events,
+    aws_sqs as sqs,
     aws_ssm as ssm,
     aws_iam as iam
 )
 from constructs import Construct
+import json
 import os
 
 class ApiGatewayApisStack(Stack):
-    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str, runtime_layer: lambda_.ILayerVersion, result_delivery=None, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        self.runtime_layer = runtime_layer
+        # ResultDeliveryStack when result_cdn_enabled: the image APIs then issue signed CloudFront URLs
+        self.result_delivery = result_delivery
+
         # Retrieve S3 bucket name and object path from context
         self.s3_base_bucket_name = self.node.try_get_context("s3_base_bucket_name")
         self.s3_face_images_path = self.node.try_get_context("s3_face_images_path")
@@ -22,6 +29,14 @@ class ApiGatewayApisStack(Stack):
         self.ddb_amazon_bedrock_gallery_display_history_table_name = self.node.try_get_context("ddb_amazon_bedrock_gallery_display_history_table_name")
         self.ddb_amazon_bedrock_gallery_base_resource_table_name = self.node.try_get_context("ddb_amazon_bedrock_gallery_base_resource_table_name")
         self.ddb_amazon_bedrock_user_agreement_table_name = self.node.try_get_context("ddb_amazon_bedrock_user_agreement_table_name")
+        # The user-agreement API enqueues agreements for a batch writer instead of writing each one
+        self.user_agreement_queue_enabled = bool(self.node.try_get_context("user_agreement_queue_enabled"))
+        self.facechain_sagemaker_endpoint_name = self.node.try_get_context("facechain_sagemaker_endpoint_name")
+        # put-image sends the template prefetch hint to synchronous FaceChain endpoints only
+        self.facechain_template_prefetch = (
+            bool(self.node.try_get_context("facechain_template_prefetch"))
+            and not bool(self.node.try_get_context("facechain_async_inference"))
+        )
 
         # Create API Gateway
         self.api_gateway = self.create_api_gateway()
@@ -57,6 +72,62 @@ class ApiGatewayApisStack(Stack):
             ]
         )
 
+        # Create API resources: /apis/images/upload/{jobId}
+        self.upload_status_resource = self.upload_resource.add_resource("{jobId}")
+
+        # Create Lambda function for reporting the face quality gate result of an upload
+        self.get_upload_status_lambda = self.create_get_upload_status_lambda_function(
+            lambda_path="lambda/apis/get-upload-status"
+        )
+
+        # Set up Lambda integration for the upload status resource
+        get_upload_status_integration = apigw.LambdaIntegration(self.get_upload_status_lambda)
+
+        # Add GET method
+        self.upload_status_resource.add_method(
+            "GET",
+            get_upload_status_integration,
+            authorization_type=apigw.AuthorizationType.NONE,
+            method_responses=[
+                apigw.MethodResponse(
+                    status_code="200",
+                    response_parameters={
+                        "method.response.header.Access-Control-Allow-Origin": True,
+                        "method.response.header.Access-Control-Allow-Headers": True,
+                        "method.response.header.Access-Control-Allow-Methods": True
+                    }
+                )
+            ]
+        )
+
+        # Create API resources: /apis/jobs/{userId}
+        self.job_status_resource = apis_resource.add_resource("jobs").add_resource("{userId}")
+
+        # Create Lambda function for reporting the stage and ETA of a user's latest job
+        self.get_job_status_lambda = self.create_get_job_status_lambda_function(
+            lambda_path="lambda/apis/get-job-status"
+        )
+
+        # Set up Lambda integration for the job status resource
+        get_job_status_integration = apigw.LambdaIntegration(self.get_job_status_lambda)
+
+        # Add GET method
+        self.job_status_resource.add_method(
+            "GET",
+            get_job_status_integration,
+            authorization_type=apigw.AuthorizationType.NONE,
+            method_responses=[
+                apigw.MethodResponse(
+                    status_code="200",
+                    response_parameters={
+                        "method.response.header.Access-Control-Allow-Origin": True,
+                        "method.response.header.Access-Control-Allow-Headers": True,
+                        "method.response.header.Access-Control-Allow-Methods": True
+                    }
+                )
+            ]
+        )
+
         # Create API resources: /apis/images/{userId}
         self.get_image_resource = images_resource.add_resource("{userId}")
 
@@ -85,6 +156,62 @@ class ApiGatewayApisStack(Stack):
             ]
         )
 
+        # Create API resources: /apis/images/batch
+        self.batch_get_image_resource = images_resource.add_resource("batch")
+
+        # Create Lambda function for resolving several display images at once
+        self.batch_get_image_lambda = self.create_batch_get_image_lambda_function(
+            lambda_path="lambda/apis/batch-get-image"
+        )
+
+        # Set up Lambda integration for the batch get image resource
+        batch_get_image_integration = apigw.LambdaIntegration(self.batch_get_image_lambda)
+
+        # Add POST method
+        self.batch_get_image_resource.add_method(
+            "POST",
+            batch_get_image_integration,
+            authorization_type=apigw.AuthorizationType.NONE,
+            method_responses=[
+                apigw.MethodResponse(
+                    status_code="200",
+                    response_parameters={
+                        "method.response.header.Access-Control-Allow-Origin": True,
+                        "method.response.header.Access-Control-Allow-Headers": True,
+                        "method.response.header.Access-Control-Allow-Methods": True
+                    }
+                )
+            ]
+        )
+
+        # Create API resources: /apis/gallery
+        self.gallery_resource = apis_resource.add_resource("gallery")
+
+        # Create Lambda function for serving the recent results feed
+        self.gallery_lambda = self.create_gallery_lambda_function(
+            lambda_path="lambda/apis/get-gallery"
+        )
+
+        # Set up Lambda integration for the gallery resource
+        gallery_integration = apigw.LambdaIntegration(self.gallery_lambda)
+
+        # Add GET method
+        self.gallery_resource.add_method(
+            "GET",
+            gallery_integration,
+            authorization_type=apigw.AuthorizationType.NONE,
+            method_responses=[
+                apigw.MethodResponse(
+                    status_code="200",
+                    response_parameters={
+                        "method.response.header.Access-Control-Allow-Origin": True,
+                        "method.response.header.Access-Control-Allow-Headers": True,
+                        "method.response.header.Access-Control-Allow-Methods": True
+                    }
+                )
+            ]
+        )
+
         self.user_agreement_lambda = self.create_user_agreement_lambda_function(
             lambda_path="lambda/apis/user-agreement"
         )
@@ -158,7 +285,8 @@ class ApiGatewayApisStack(Stack):
                 "DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_TABLE_NAME": self.ddb_amazon_bedrock_gallery_display_table_name
             },
             timeout=Duration.seconds(10),
-            memory_size=1024
+            memory_size=1024,
+            layers=[self.runtime_layer]
         )
         
         # Grant permission to put objects in the specified S3 bucket path
@@ -177,6 +305,170 @@ class ApiGatewayApisStack(Stack):
             ]
         ))
         
+        self.configure_result_delivery(lambda_function)
+
+        return lambda_function
+
+    def configure_result_delivery(self, lambda_function):
+        if self.result_delivery is None:
+            return
+
+        result_cdn_private_key_secret_name = self.node.try_get_context("result_cdn_private_key_secret_name")
+        cryptography_layer_arn = self.node.try_get_context("cryptography_layer_arn")
+        if not cryptography_layer_arn:
+            raise ValueError("result_cdn_enabled needs cryptography_layer_arn in cdk.context.json")
+
+        lambda_function.add_environment("RESULT_CDN_DOMAIN_NAME", self.result_delivery.domain_name)
+        lambda_function.add_environment("RESULT_CDN_KEY_PAIR_ID", self.result_delivery.public_key_id)
+        lambda_function.add_environment("RESULT_CDN_PRIVATE_KEY_SECRET_ID", result_cdn_private_key_secret_name)
+        lambda_function.add_environment("RESULT_CDN_URL_WINDOW_SECONDS", str(self.result_delivery.result_cdn_url_window_seconds))
+
+        # The URLs are signed with cryptography (RSA), which the Lambda runtime does not include
+        lambda_function.add_layers(lambda_.LayerVersion.from_layer_version_arn(
+            self, f"{lambda_function.node.id}CryptographyLayer",
+            layer_version_arn=cryptography_layer_arn
+        ))
+
+        # Grant permission to read the signing key
+        lambda_function.add_to_role_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["secretsmanager:GetSecretValue"],
+            resources=[
+                f"arn:aws:secretsmanager:{self.region}:{self.account}:secret:{result_cdn_private_key_secret_name}-*"
+            ]
+        ))
+
+    def create_get_upload_status_lambda_function(self, lambda_path):
+        """Create and return a Lambda function that reads an upload's processing status."""
+        lambda_function = lambda_.Function(
+            self, "AmazonBedrockGalleryGetUploadStatus",
+            function_name="AmazonBedrockGalleryGetUploadStatus",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="index.lambda_handler",
+            code=lambda_.Code.from_asset(lambda_path),
+            environment={
+                "DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME": self.ddb_amazon_bedrock_gallery_process_table_name
+            },
+            timeout=Duration.seconds(10),
+            memory_size=1024,
+            layers=[self.runtime_layer]
+        )
+
+        # Grant permission to read items from the process table
+        lambda_function.add_to_role_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["dynamodb:GetItem"],
+            resources=[
+                f"arn:aws:dynamodb:{self.region}:{self.account}:table/{self.ddb_amazon_bedrock_gallery_process_table_name}"
+            ]
+        ))
+
+        return lambda_function
+
+    def create_get_job_status_lambda_function(self, lambda_path):
+        """Create and return a Lambda function that reports the progress of a user's latest job."""
+        lambda_function = lambda_.Function(
+            self, "AmazonBedrockGalleryGetJobStatus",
+            function_name="AmazonBedrockGalleryGetJobStatus",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="index.lambda_handler",
+            code=lambda_.Code.from_asset(lambda_path),
+            environment={
+                "DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME": self.ddb_amazon_bedrock_gallery_process_table_name,
+                # Typical seconds per stage, for the ETA
+                "JOB_STAGE_SECONDS": json.dumps(self.node.try_get_context("job_stage_estimate_seconds") or {})
+            },
+            timeout=Duration.seconds(10),
+            memory_size=1024,
+            layers=[self.runtime_layer]
+        )
+
+        # Grant permission to query the userId index of the process table
+        lambda_function.add_to_role_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["dynamodb:Query"],
+            resources=[
+                f"arn:aws:dynamodb:{self.region}:{self.account}:table/{self.ddb_amazon_bedrock_gallery_process_table_name}/index/*"
+            ]
+        ))
+
+        return lambda_function
+
+    def create_batch_get_image_lambda_function(self, lambda_path):
+        """Create and return a Lambda function that resolves display images for several users."""
+        lambda_function = lambda_.Function(
+            self, "AmazonBedrockGalleryBatchGetImage",
+            function_name="AmazonBedrockGalleryBatchGetImage",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="index.lambda_handler",
+            code=lambda_.Code.from_asset(lambda_path),
+            environment={
+                "BUCKET_NAME": self.s3_base_bucket_name,
+                "DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_TABLE_NAME": self.ddb_amazon_bedrock_gallery_display_table_name
+            },
+            timeout=Duration.seconds(10),
+            memory_size=1024,
+            layers=[self.runtime_layer]
+        )
+
+        # Grant permission to get objects in the specified S3 bucket path
+        lambda_function.add_to_role_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["s3:GetObject"],
+            resources=[f"arn:aws:s3:::{self.s3_base_bucket_name}/*"]
+        ))
+
+        # Grant permission to batch read items in the specified DDB table
+        lambda_function.add_to_role_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["dynamodb:BatchGetItem"],
+            resources=[
+                f"arn:aws:dynamodb:{self.region}:{self.account}:table/{self.ddb_amazon_bedrock_gallery_display_table_name}"
+            ]
+        ))
+
+        self.configure_result_delivery(lambda_function)
+
+        return lambda_function
+
+    def create_gallery_lambda_function(self, lambda_path):
+        """Create and return a Lambda function that pages through the display history feed."""
+        lambda_function = lambda_.Function(
+            self, "AmazonBedrockGalleryGetGallery",
+            function_name="AmazonBedrockGalleryGetGallery",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="index.lambda_handler",
+            code=lambda_.Code.from_asset(lambda_path),
+            environment={
+                "BUCKET_NAME": self.s3_base_bucket_name,
+                "DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_HISTORY_TABLE_NAME": self.ddb_amazon_bedrock_gallery_display_history_table_name,
+                # Shards of the history feed index, as face-swap-completion writes them
+                "GALLERY_FEED_SHARDS": str(self.node.try_get_context("gallery_feed_shards") or 4),
+                "THEME_FEED_ENABLED": str(bool(self.node.try_get_context("display_history_theme_index"))).lower()
+            },
+            timeout=Duration.seconds(10),
+            memory_size=1024,
+            layers=[self.runtime_layer]
+        )
+
+        # Grant permission to get objects in the specified S3 bucket path
+        lambda_function.add_to_role_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["s3:GetObject"],
+            resources=[f"arn:aws:s3:::{self.s3_base_bucket_name}/*"]
+        ))
+
+        # Grant permission to query the feed indexes of the display history table
+        lambda_function.add_to_role_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["dynamodb:Query"],
+            resources=[
+                f"arn:aws:dynamodb:{self.region}:{self.account}:table/{self.ddb_amazon_bedrock_gallery_display_history_table_name}/index/*"
+            ]
+        ))
+
+        self.configure_result_delivery(lambda_function)
+
         return lambda_function
 
     def create_upload_image_lambda_function(self, lambda_path, object_path):
@@ -194,8 +486,21 @@ class ApiGatewayApisStack(Stack):
                 "DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME": self.ddb_amazon_bedrock_gallery_process_table_name
             },
             timeout=Duration.seconds(10),
-            memory_size=1024
+            memory_size=1024,
+            layers=[self.runtime_layer]
         )
+
+        if self.facechain_template_prefetch:
+            # Grant permission to send the template prefetch hint to the FaceChain endpoint
+            lambda_function.add_environment("FACECHAIN_TEMPLATE_PREFETCH", "true")
+            lambda_function.add_environment("FACECHAIN_SAGEMAKER_ENDPOINT_NAME", self.facechain_sagemaker_endpoint_name)
+            lambda_function.add_to_role_policy(iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["sagemaker:InvokeEndpoint"],
+                resources=[
+                    f"arn:aws:sagemaker:{self.region}:{self.account}:endpoint/{self.facechain_sagemaker_endpoint_name}"
+                ]
+            ))
         
         # Grant permission to put objects in the specified S3 bucket path
         lambda_function.add_to_role_policy(iam.PolicyStatement(
@@ -235,10 +540,11 @@ class ApiGatewayApisStack(Stack):
                 "DDB_AMAZON_BEDROCK_USER_AGREEMENT_TABLE_NAME": self.ddb_amazon_bedrock_user_agreement_table_name
             },
             timeout=Duration.seconds(10),
-            memory_size=1024
+            memory_size=1024,
+            layers=[self.runtime_layer]
         )
         
-        # Grant permission to update items in the DynamoDB table
+        # Grant permission to update items in the DynamoDB table (PutItem is the fallback when the queue fails)
         lambda_function.add_to_role_policy(iam.PolicyStatement(
             effect=iam.Effect.ALLOW,
             actions=["dynamodb:PutItem", "dynamodb:UpdateItem"],
@@ -246,5 +552,58 @@ class ApiGatewayApisStack(Stack):
                 f"arn:aws:dynamodb:{self.region}:{self.account}:table/{self.ddb_amazon_bedrock_user_agreement_table_name}"
             ]
         ))
+
+        if self.user_agreement_queue_enabled:
+            self.configure_user_agreement_queue(lambda_function)
         
-        return lambda_function
\ No newline at end of file
+        return lambda_function
+
+    def configure_user_agreement_queue(self, lambda_function):
+        """Buffer the agreements in SQS and write them in batches with user-agreement-writer."""
+        writer_function = lambda_.Function(
+            self, "UserAgreementWriterLambda",
+            function_name="UserAgreementWriterFunction",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="index.lambda_handler",
+            code=lambda_.Code.from_asset("lambda/apis/user-agreement-writer"),
+            environment={
+                "DDB_AMAZON_BEDROCK_USER_AGREEMENT_TABLE_NAME": self.ddb_amazon_bedrock_user_agreement_table_name
+            },
+            timeout=Duration.seconds(30),
+            memory_size=256,
+            layers=[self.runtime_layer]
+        )
+
+        writer_function.add_to_role_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["dynamodb:BatchWriteItem"],
+            resources=[
+                f"arn:aws:dynamodb:{self.region}:{self.account}:table/{self.ddb_amazon_bedrock_user_agreement_table_name}"
+            ]
+        ))
+
+        dead_letter_queue = sqs.Queue(
+            self, "UserAgreementDeadLetterQueue",
+            retention_period=Duration.days(14)
+        )
+        queue = sqs.Queue(
+            self, "UserAgreementQueue",
+            # Six times the function timeout, as recommended for Lambda event sources
+            visibility_timeout=Duration.seconds(writer_function.timeout.to_seconds() * 6),
+            retention_period=Duration.days(4),
+            dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=5, queue=dead_letter_queue)
+        )
+        lambda_function.add_environment("USER_AGREEMENT_QUEUE_URL", queue.queue_url)
+        lambda_function.add_to_role_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["sqs:SendMessage"],
+            resources=[queue.queue_arn]
+        ))
+
+        # One batch_write_item per 25 agreements; a burst is collected for up to a second
+        writer_function.add_event_source(lambda_events.SqsEventSource(
+            queue,
+            batch_size=25,
+            max_batching_window=Duration.seconds(1),
+            report_batch_item_failures=True
+        ))
\ No newline at end of file
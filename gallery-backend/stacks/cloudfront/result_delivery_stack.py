@@ -0,0 +1,107 @@
+from aws_cdk import (
+    Stack,
+    Annotations,
+    CfnOutput,
+    Duration,
+    aws_cloudfront as cloudfront,
+    aws_cloudfront_origins as origins,
+    aws_s3 as s3,
+)
+from constructs import Construct
+
+class ResultDeliveryStack(Stack):
+    """CloudFront in front of the result and display images, which only serves signed URLs."""
+
+    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        self.s3_base_bucket_name = self.node.try_get_context("s3_base_bucket_name")
+        self.s3_result_images_path = self.node.try_get_context("s3_result_images_path")
+        self.s3_display_images_path = self.node.try_get_context("s3_display_images_path") or "images/display/"
+        # The public half of the signing key; the private half stays in Secrets Manager (see README)
+        self.result_cdn_public_key_pem = self.node.try_get_context("result_cdn_public_key_pem")
+        # Signed URLs expire at the end of a window of this length, so polls within it get the same URL
+        self.result_cdn_url_window_seconds = int(self.node.try_get_context("result_cdn_url_window_seconds") or 3600)
+
+        if not self.result_cdn_public_key_pem:
+            raise ValueError("result_cdn_enabled needs result_cdn_public_key_pem in cdk.context.json")
+
+        bucket = s3.Bucket.from_bucket_name(self, "ResultBucket", bucket_name=self.s3_base_bucket_name)
+
+        public_key = cloudfront.PublicKey(self, "ResultSigningPublicKey",
+            encoded_key=self.result_cdn_public_key_pem,
+            comment="Verifies the signed result image URLs issued by the image APIs"
+        )
+        self.key_group = cloudfront.KeyGroup(self, "ResultSigningKeyGroup", items=[public_key])
+        self.public_key_id = public_key.public_key_id
+
+        # Results and derivatives are keyed by uuid and never change, so the edge keeps them long.
+        # The signature is checked on every request but is not part of the cache key
+        cache_policy = cloudfront.CachePolicy(self, "ResultCachePolicy",
+            default_ttl=Duration.days(1),
+            min_ttl=Duration.seconds(0),
+            max_ttl=Duration.days(365),
+            query_string_behavior=cloudfront.CacheQueryStringBehavior.none(),
+            header_behavior=cloudfront.CacheHeaderBehavior.none(),
+            cookie_behavior=cloudfront.CacheCookieBehavior.none()
+        )
+
+        # Let browsers keep results for a URL window; derivatives carry their own Cache-Control
+        response_headers_policy = cloudfront.ResponseHeadersPolicy(self, "ResultResponseHeadersPolicy",
+            custom_headers_behavior=cloudfront.ResponseCustomHeadersBehavior(custom_headers=[
+                cloudfront.ResponseCustomHeader(
+                    header="Cache-Control",
+                    value=f"max-age={self.result_cdn_url_window_seconds}",
+                    override=False
+                )
+            ]),
+            cors_behavior=cloudfront.ResponseHeadersCorsBehavior(
+                access_control_allow_credentials=False,
+                access_control_allow_headers=["*"],
+                access_control_allow_methods=["GET", "HEAD"],
+                access_control_allow_origins=["*"],
+                origin_override=True
+            )
+        )
+
+        self.distribution = cloudfront.Distribution(self, "ResultDistribution",
+            comment="Amazon Bedrock Gallery result images",
+            http_version=cloudfront.HttpVersion.HTTP2_AND_3,
+            default_behavior=cloudfront.BehaviorOptions(
+                origin=origins.S3BucketOrigin.with_origin_access_control(bucket),
+                viewer_protocol_policy=cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+                allowed_methods=cloudfront.AllowedMethods.ALLOW_GET_HEAD,
+                cache_policy=cache_policy,
+                response_headers_policy=response_headers_policy,
+                trusted_key_groups=[self.key_group]
+            )
+        )
+
+        # The bucket belongs to S3Bucket and CDK does not change the policy of an imported bucket,
+        # so the origin access control grant is written here. It covers the image prefixes only
+        Annotations.of(self).acknowledge_warning("@aws-cdk/aws-cloudfront-origins:updateImportedBucketPolicyOac")
+        s3.CfnBucketPolicy(self, "ResultBucketPolicy",
+            bucket=self.s3_base_bucket_name,
+            policy_document={
+                "Version": "2012-10-17",
+                "Statement": [{
+                    "Sid": "AllowResultDistributionRead",
+                    "Effect": "Allow",
+                    "Principal": {"Service": "cloudfront.amazonaws.com"},
+                    "Action": "s3:GetObject",
+                    "Resource": [
+                        f"arn:aws:s3:::{self.s3_base_bucket_name}/{self.s3_result_images_path}*",
+                        f"arn:aws:s3:::{self.s3_base_bucket_name}/{self.s3_display_images_path}*"
+                    ],
+                    "Condition": {
+                        "StringEquals": {
+                            "AWS:SourceArn": f"arn:aws:cloudfront::{self.account}:distribution/{self.distribution.distribution_id}"
+                        }
+                    }
+                }]
+            }
+        )
+
+        self.domain_name = self.distribution.distribution_domain_name
+
+        CfnOutput(self, "ResultDistributionDomainName", value=self.domain_name)
@@ -16,6 +16,8 @@ class DDBTables(Stack):
         self.ddb_amazon_bedrock_gallery_display_history_table_name = self.node.try_get_context("ddb_amazon_bedrock_gallery_display_history_table_name")
         self.ddb_amazon_bedrock_gallery_base_resource_table_name = self.node.try_get_context("ddb_amazon_bedrock_gallery_base_resource_table_name")
         self.ddb_amazon_bedrock_user_agreement_table_name = self.node.try_get_context("ddb_amazon_bedrock_user_agreement_table_name")
+        self.ddb_amazon_bedrock_gallery_dedup_table_name = self.node.try_get_context("ddb_amazon_bedrock_gallery_dedup_table_name")
+        self.ddb_amazon_bedrock_gallery_endpoint_load_table_name = self.node.try_get_context("ddb_amazon_bedrock_gallery_endpoint_load_table_name")
         
         self.ddb_amazon_bedrock_gallery_process_table = dynamodb.Table(
             self, 'AmazonBedrockGalleryProcessTable',
@@ -27,7 +29,23 @@ class DDBTables(Stack):
                 removal_policy=RemovalPolicy.DESTROY,
                 billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
         )
-        
+
+        # Latest job of a user for get-job-status, newest first via ScanIndexForward=False.
+        # Only the status and the stage timestamps are projected, so the index item stays small
+        self.ddb_amazon_bedrock_gallery_process_table.add_global_secondary_index(
+            index_name='userId-created_at-index',
+            partition_key=dynamodb.Attribute(
+                name='userId',
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name='created_at',
+                type=dynamodb.AttributeType.STRING
+            ),
+            projection_type=dynamodb.ProjectionType.INCLUDE,
+            non_key_attributes=['status', 'status_reason', 'updated_at', 'cropped_at', 'rejected_at', 'swapping_at', 'completed_at']
+        )
+
         self.ddb_amazon_bedrock_gallery_display_table = dynamodb.Table(
                 self, 'AmazonBedrockGalleryDisplayTable',
                 table_name=self.ddb_amazon_bedrock_gallery_display_table_name,
@@ -50,6 +68,36 @@ class DDBTables(Stack):
                 billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
             )
 
+        # Time-ordered feeds over all results and per theme, newest first via ScanIndexForward=False
+        self.ddb_amazon_bedrock_gallery_display_history_table.add_global_secondary_index(
+            index_name='feed-created_at-index',
+            partition_key=dynamodb.Attribute(
+                name='feed', #ALL#{shard}, see gallery_runtime.feed
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name='created_at',
+                type=dynamodb.AttributeType.STRING
+            ),
+            projection_type=dynamodb.ProjectionType.ALL
+        )
+
+        # DynamoDB creates one GSI per table update, so a deployed table gets this index in a
+        # deployment after the one that added the feed index (see the README)
+        if self.node.try_get_context("display_history_theme_index"):
+            self.ddb_amazon_bedrock_gallery_display_history_table.add_global_secondary_index(
+                index_name='theme-created_at-index',
+                partition_key=dynamodb.Attribute(
+                    name='theme',
+                    type=dynamodb.AttributeType.STRING
+                ),
+                sort_key=dynamodb.Attribute(
+                    name='created_at',
+                    type=dynamodb.AttributeType.STRING
+                ),
+                projection_type=dynamodb.ProjectionType.ALL
+            )
+
         self.ddb_amazon_bedrock_gallery_base_resource_table = dynamodb.Table(
             self, 'AmazonBedrockGalleryBaseResourceTable',
             table_name=self.ddb_amazon_bedrock_gallery_base_resource_table_name,
@@ -80,4 +128,31 @@ class DDBTables(Stack):
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST
         )
 
-        
\ No newline at end of file
+        # Recently completed jobs by user and theme, so repeated uploads of a photo reuse the result
+        self.ddb_amazon_bedrock_gallery_dedup_table = dynamodb.Table(
+            self, 'AmazonBedrockGalleryDedupTable',
+            table_name=self.ddb_amazon_bedrock_gallery_dedup_table_name,
+            partition_key=dynamodb.Attribute(
+                name='PK',  #USERID#{user_id}#THEME#{theme}
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name='SK',  # SHA-256 of the uploaded photo
+                type=dynamodb.AttributeType.STRING
+            ),
+            time_to_live_attribute='expires_at',
+            removal_policy=RemovalPolicy.DESTROY,
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST
+        )
+
+        # Requests in flight per FaceChain endpoint/variant, for face-swap's load-aware routing
+        self.ddb_amazon_bedrock_gallery_endpoint_load_table = dynamodb.Table(
+            self, 'AmazonBedrockGalleryEndpointLoadTable',
+            table_name=self.ddb_amazon_bedrock_gallery_endpoint_load_table_name,
+            partition_key=dynamodb.Attribute(
+                name='PK',  #ENDPOINT#{endpoint}#VARIANT#{variant}
+                type=dynamodb.AttributeType.STRING
+            ),
+            removal_policy=RemovalPolicy.DESTROY,
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST
+        )
@@ -3,13 +3,34 @@ from aws_cdk import aws_sagemaker as sagemaker
 from aws_cdk import aws_iam as iam
 from constructs import Construct
 
+def facechain_endpoint_variants(node):
+    """The production variants of the FaceChain endpoint from the context.
+
+    facechain_sagemaker_endpoint_variants lists them as {"name", "instance_type",
+    "instance_count", "weight"}; when empty the endpoint has the single FaceChainVariant.
+    """
+    instance_type = node.try_get_context("facechain_sagemaker_endpoint_instance_type")
+    instance_count = node.try_get_context("facechain_sagemaker_endpoint_instance_count")
+    variants = node.try_get_context("facechain_sagemaker_endpoint_variants") or [{"name": "FaceChainVariant"}]
+    return [
+        {
+            "name": variant["name"],
+            "instance_type": variant.get("instance_type") or instance_type,
+            "instance_count": int(variant.get("instance_count") or instance_count),
+            "weight": variant.get("weight", 1)
+        }
+        for variant in variants
+    ]
+
 class FaceChainSageMakerEndpointStack(Stack):
     def __init__(self, scope: Construct, construct_id: str, facechain_image_uri: str, codebuild_status_resource: CustomResource, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
         facechain_sagemaker_endpoint_name = self.node.try_get_context("facechain_sagemaker_endpoint_name")
-        facechain_sagemaker_endpoint_instance_count = self.node.try_get_context("facechain_sagemaker_endpoint_instance_count")
-        facechain_sagemaker_endpoint_instance_type = self.node.try_get_context("facechain_sagemaker_endpoint_instance_type")
+        facechain_sagemaker_endpoint_variants = facechain_endpoint_variants(self.node)
+        facechain_async_inference = bool(self.node.try_get_context("facechain_async_inference"))
+        s3_base_bucket_name = self.node.try_get_context("s3_base_bucket_name")
+        s3_async_inference_path = self.node.try_get_context("s3_async_inference_path") or "sagemaker/async-inference/"
 
         # Add a dependency on the CodeBuild status resource
         self.node.add_dependency(codebuild_status_resource)
@@ -34,18 +55,37 @@ class FaceChainSageMakerEndpointStack(Stack):
             model_name="facechain-sagemaker-model"
         )
 
+        # Async inference: the endpoint queues requests and takes one at a time per instance (one GPU).
+        # The predictor writes the result image itself; the response body and failures go to the paths below
+        async_inference_config = None
+        endpoint_config_name = "facechain-sagemaker-endpoint-config"
+        if facechain_async_inference:
+            async_inference_config = {
+                "outputConfig": {
+                    "s3OutputPath": f"s3://{s3_base_bucket_name}/{s3_async_inference_path}output/",
+                    "s3FailurePath": f"s3://{s3_base_bucket_name}/{s3_async_inference_path}failures/"
+                },
+                "clientConfig": {
+                    "maxConcurrentInvocationsPerInstance": 1
+                }
+            }
+            # Switching modes replaces the endpoint configuration, which needs a new name
+            endpoint_config_name = "facechain-sagemaker-endpoint-config-async"
+
         # Create SageMaker Endpoint Configuration for FaceChain
         facechain_endpoint_config = sagemaker.CfnEndpointConfig(self, "FaceChainSageMakerEndpointConfig",
+            async_inference_config=async_inference_config,
             production_variants=[
                 {
-                    "initialInstanceCount": facechain_sagemaker_endpoint_instance_count,
-                    "instanceType": facechain_sagemaker_endpoint_instance_type,
+                    "initialInstanceCount": variant["instance_count"],
+                    "instanceType": variant["instance_type"],
                     "modelName": facechain_model.model_name,
-                    "variantName": "FaceChainVariant",
-                    "initialVariantWeight": 1
+                    "variantName": variant["name"],
+                    "initialVariantWeight": variant["weight"]
                 }
+                for variant in facechain_sagemaker_endpoint_variants
             ],
-            endpoint_config_name="facechain-sagemaker-endpoint-config"
+            endpoint_config_name=endpoint_config_name
         )
         facechain_endpoint_config.add_dependency(facechain_model)
 
@@ -1,3 +1,4 @@
+import json
 from aws_cdk import (
     Stack,
     CfnOutput,
@@ -11,23 +12,50 @@ from aws_cdk import (
     aws_s3 as s3,
     RemovalPolicy,
     aws_s3_notifications as s3n,
+    aws_sqs as sqs,
     CustomResource,
 )
 from constructs import Construct
 from aws_cdk.custom_resources import Provider
+from stacks.facechain.sagemaker_endpoint_stack import facechain_endpoint_variants
 
 class LambdaImageProcessingStack(Stack):
-    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str, runtime_layer: lambda_.ILayerVersion, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        self.runtime_layer = runtime_layer
+
         self.ddb_amazon_bedrock_gallery_process_table_name = self.node.try_get_context("ddb_amazon_bedrock_gallery_process_table_name")
         self.ddb_amazon_bedrock_gallery_display_table_name = self.node.try_get_context("ddb_amazon_bedrock_gallery_display_table_name")
+        self.ddb_amazon_bedrock_gallery_display_history_table_name = self.node.try_get_context("ddb_amazon_bedrock_gallery_display_history_table_name")
+        self.ddb_amazon_bedrock_gallery_dedup_table_name = self.node.try_get_context("ddb_amazon_bedrock_gallery_dedup_table_name")
+        # Deduplication: repeated uploads of a recently completed photo reuse its result
+        self.upload_dedup_enabled = bool(self.node.try_get_context("upload_dedup_enabled"))
         self.s3_base_bucket_name = self.node.try_get_context("s3_base_bucket_name")
         self.s3_face_images_path = self.node.try_get_context("s3_face_images_path")
         self.s3_face_cropped_images_path = self.node.try_get_context("s3_face_cropped_images_path")
         self.s3_face_swapped_images_path = self.node.try_get_context("s3_face_swapped_images_path")
         self.s3_result_images_path = self.node.try_get_context("s3_result_images_path")
+        # Display derivatives: face-swap-completion renders a display-sized image and a thumbnail of each result
+        self.display_derivatives_enabled = bool(self.node.try_get_context("display_derivatives_enabled"))
+        self.s3_display_images_path = self.node.try_get_context("s3_display_images_path") or "images/display/"
         self.facechain_sagemaker_endpoint_name = self.node.try_get_context("facechain_sagemaker_endpoint_name")
+        # Queue mode: S3 notifications go to an SQS queue per stage instead of invoking the Lambdas
+        self.pipeline_queue_mode = bool(self.node.try_get_context("pipeline_queue_mode"))
+        # Concurrent face-swap invocations in queue mode, i.e. requests in flight against the endpoint
+        self.face_swap_max_concurrency = int(self.node.try_get_context("face_swap_max_concurrency") or 2)
+        # Fused mode: face-crop runs the face swap itself with the crop inline, the crop only goes to the audit path
+        self.pipeline_fused_crop_swap = bool(self.node.try_get_context("pipeline_fused_crop_swap"))
+        self.s3_face_crop_audit_path = self.node.try_get_context("s3_face_crop_audit_path") or "images/face-crop-audit/"
+        # Async mode: the FaceChain endpoint queues requests itself and face swap only submits them
+        self.facechain_async_inference = bool(self.node.try_get_context("facechain_async_inference"))
+        self.s3_async_inference_path = self.node.try_get_context("s3_async_inference_path") or "sagemaker/async-inference/"
+        # Routing: the stage running the inference (face-swap, or face-crop in fused mode) picks the least
+        # loaded endpoint/variant with a free slot and defers the job to a retry queue when all are full.
+        # Async endpoints keep their own backlog, so it is sync only
+        self.facechain_routing_enabled = bool(self.node.try_get_context("facechain_routing_enabled")) and not self.facechain_async_inference
+        self.ddb_amazon_bedrock_gallery_endpoint_load_table_name = self.node.try_get_context("ddb_amazon_bedrock_gallery_endpoint_load_table_name")
+        self.facechain_routing_targets = self.get_facechain_routing_targets()
 
         # Create the face crop Lambda function
         self.face_crop_lambda = self.create_face_crop_lambda()
@@ -41,6 +69,25 @@ class LambdaImageProcessingStack(Stack):
         # Configure S3 notifications after all Lambda functions are created
         self.configure_s3_notifications()
 
+    def get_facechain_routing_targets(self):
+        """facechain_routing_targets ({"endpoint", "variant", "max_in_flight"}), by default the variants of our endpoint."""
+        targets = self.node.try_get_context("facechain_routing_targets")
+        if targets:
+            return [
+                {"endpoint": target["endpoint"], "variant": target.get("variant"), "max_in_flight": int(target["max_in_flight"])}
+                for target in targets
+            ]
+
+        max_in_flight_per_instance = int(self.node.try_get_context("facechain_max_in_flight_per_instance") or 1)
+        return [
+            {
+                "endpoint": self.facechain_sagemaker_endpoint_name,
+                "variant": variant["name"],
+                "max_in_flight": variant["instance_count"] * max_in_flight_per_instance
+            }
+            for variant in facechain_endpoint_variants(self.node)
+        ]
+
     def create_face_crop_lambda(self):
         # Create the necessary layers
         pillow_layer_arn = self.node.try_get_context("pillow_layer_arn")
@@ -55,6 +102,35 @@ class LambdaImageProcessingStack(Stack):
             layer_version_arn=numpy_layer_arn
         )
 
+        layers = [pillow_layer, numpy_layer, self.runtime_layer]
+        environment = {
+            "BUCKET_NAME": self.s3_base_bucket_name,
+            "FACE_CROPPED_OBJECT_PATH": self.s3_face_cropped_images_path,
+            "FACE_DETECTOR_POLICY": "rekognition",
+            "DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME": self.ddb_amazon_bedrock_gallery_process_table_name
+        }
+
+        # Optional local face detector (OpenCV + YuNet model, see lambda/layers/face-detector)
+        face_detector_layer_arn = self.node.try_get_context("face_detector_layer_arn")
+        if face_detector_layer_arn:
+            layers.append(lambda_.LayerVersion.from_layer_version_arn(
+                self, "FaceDetectorLayer",
+                layer_version_arn=face_detector_layer_arn
+            ))
+            environment["FACE_DETECTOR_POLICY"] = self.node.try_get_context("face_detector_policy") or "local-fallback"
+            environment["FACE_DETECTOR_MIN_CONFIDENCE"] = str(self.node.try_get_context("face_detector_min_confidence") or 90)
+
+        if self.upload_dedup_enabled:
+            environment["DDB_AMAZON_BEDROCK_GALLERY_DEDUP_TABLE_NAME"] = self.ddb_amazon_bedrock_gallery_dedup_table_name
+            environment["DEDUP_MAX_HASH_DISTANCE"] = str(self.node.try_get_context("upload_dedup_max_hash_distance") or 4)
+            environment["RESULT_OBJECT_PATH"] = self.s3_result_images_path
+
+        if self.pipeline_fused_crop_swap:
+            environment["FUSED_FACE_SWAP"] = "true"
+            environment["FACE_CROP_AUDIT_OBJECT_PATH"] = self.s3_face_crop_audit_path
+            environment["RESULT_OBJECT_PATH"] = self.s3_result_images_path
+            environment["FACECHAIN_SAGEMAKER_ENDPOINT_NAME"] = self.facechain_sagemaker_endpoint_name
+
         # Create the face-crop Lambda function inline
         lambda_func = lambda_.Function(
             self, "AmazonBedrockGalleryFaceCropLambda",
@@ -62,13 +138,11 @@ class LambdaImageProcessingStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="index.lambda_handler",
             code=lambda_.Code.from_asset("lambda/image-processing/face-crop"),
-            environment={
-                "BUCKET_NAME": self.s3_base_bucket_name,
-                "FACE_CROPPED_OBJECT_PATH": self.s3_face_cropped_images_path
-            },
-            timeout=Duration.seconds(10),
+            environment=environment,
+            # The fused stage waits on the SageMaker inference, like face-swap, unless it is only submitted
+            timeout=Duration.seconds(60 if self.pipeline_fused_crop_swap and not self.facechain_async_inference else 10),
             memory_size=1024,
-            layers=[pillow_layer, numpy_layer]
+            layers=layers
         )
 
         # Grant permissions for S3 object put/get operations
@@ -89,6 +163,43 @@ class LambdaImageProcessingStack(Stack):
             resources=["*"]
         ))
 
+        # Grant permission to record the quality gate status on the process table entry
+        lambda_func.add_to_role_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["dynamodb:UpdateItem"],
+            resources=[
+                f"arn:aws:dynamodb:{self.region}:{self.account}:table/{self.ddb_amazon_bedrock_gallery_process_table_name}"
+            ]
+        ))
+
+        if self.upload_dedup_enabled:
+            # Grant permissions to look up completed jobs and copy their results
+            lambda_func.add_to_role_policy(iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["dynamodb:Query"],
+                resources=[
+                    f"arn:aws:dynamodb:{self.region}:{self.account}:table/{self.ddb_amazon_bedrock_gallery_dedup_table_name}"
+                ]
+            ))
+            lambda_func.add_to_role_policy(iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["s3:GetObject", "s3:PutObject"],
+                resources=[f"arn:aws:s3:::{self.s3_base_bucket_name}/{self.s3_result_images_path}*"]
+            ))
+
+        if self.pipeline_fused_crop_swap:
+            # Grant permission to keep the crop under the audit path (no notification is configured there)
+            lambda_func.add_to_role_policy(iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["s3:PutObject"],
+                resources=[f"arn:aws:s3:::{self.s3_base_bucket_name}/{self.s3_face_crop_audit_path}*"]
+            ))
+
+            self.grant_face_swap_invoke(lambda_func)
+            if self.facechain_routing_enabled:
+                # Deferred uploads come back to face-crop, which crops them again before its next attempt
+                self.configure_face_swap_routing(lambda_func)
+
         return lambda_func
 
     def create_face_swap_lambda(self):
@@ -105,26 +216,20 @@ class LambdaImageProcessingStack(Stack):
                 "DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME": self.ddb_amazon_bedrock_gallery_process_table_name
             },
             timeout=Duration.seconds(60),
-            memory_size=1024
+            memory_size=1024,
+            layers=[self.runtime_layer]
         )
 
-        # Grant permissions for DynamoDB operations
+        # Grant permissions for DynamoDB operations (UpdateItem records the swapping stage)
         lambda_func.add_to_role_policy(iam.PolicyStatement(
             effect=iam.Effect.ALLOW,
-            actions=["dynamodb:GetItem", "dynamodb:Query"],
+            actions=["dynamodb:GetItem", "dynamodb:Query", "dynamodb:UpdateItem"],
             resources=[
                 f"arn:aws:dynamodb:{self.region}:{self.account}:table/{self.ddb_amazon_bedrock_gallery_process_table_name}"
             ]
         ))
 
-        # Grant SageMaker endpoint invoke permission
-        lambda_func.add_to_role_policy(iam.PolicyStatement(
-            effect=iam.Effect.ALLOW,
-            actions=["sagemaker:InvokeEndpoint"],
-            resources=[
-                f"arn:aws:sagemaker:{self.region}:{self.account}:endpoint/{self.facechain_sagemaker_endpoint_name}"
-            ]
-        ))
+        self.grant_face_swap_invoke(lambda_func)
 
         # Grant permissions for S3 object put/get operations
         lambda_func.add_to_role_policy(iam.PolicyStatement(
@@ -137,8 +242,79 @@ class LambdaImageProcessingStack(Stack):
             ]
         ))
 
+        # In fused mode face-swap gets no crops; face-crop holds the slots (see create_face_crop_lambda)
+        if self.facechain_routing_enabled and not self.pipeline_fused_crop_swap:
+            self.configure_face_swap_routing(lambda_func)
+
         return lambda_func
 
+    def configure_face_swap_routing(self, lambda_func):
+        lambda_func.add_environment("FACECHAIN_TARGETS", json.dumps(self.facechain_routing_targets))
+        lambda_func.add_environment("DDB_AMAZON_BEDROCK_GALLERY_ENDPOINT_LOAD_TABLE_NAME", self.ddb_amazon_bedrock_gallery_endpoint_load_table_name)
+        # Leases outlive a running invocation, so only those of killed invocations expire
+        lambda_func.add_environment("FACECHAIN_LEASE_SECONDS", str(int(lambda_func.timeout.to_seconds()) + 30))
+        lambda_func.add_environment("FACE_SWAP_RETRY_MAX_ATTEMPTS", str(self.node.try_get_context("face_swap_retry_max_attempts") or 8))
+
+        # Grant permissions to read and update the requests in flight per target
+        lambda_func.add_to_role_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["dynamodb:BatchGetItem", "dynamodb:PutItem", "dynamodb:UpdateItem"],
+            resources=[
+                f"arn:aws:dynamodb:{self.region}:{self.account}:table/{self.ddb_amazon_bedrock_gallery_endpoint_load_table_name}"
+            ]
+        ))
+
+        # Jobs deferred while every target is full come back through this queue after their backoff
+        dead_letter_queue = sqs.Queue(
+            self, "FaceSwapRetryDeadLetterQueue",
+            retention_period=Duration.days(14)
+        )
+        retry_queue = sqs.Queue(
+            self, "FaceSwapRetryQueue",
+            visibility_timeout=Duration.seconds(lambda_func.timeout.to_seconds() * 6),
+            retention_period=Duration.days(1),
+            dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=5, queue=dead_letter_queue)
+        )
+        lambda_func.add_environment("FACE_SWAP_RETRY_QUEUE_URL", retry_queue.queue_url)
+        lambda_func.add_to_role_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["sqs:SendMessage"],
+            resources=[retry_queue.queue_arn]
+        ))
+
+        # The messages are S3 notifications, handled like those of the stage's pipeline queue
+        lambda_func.add_event_source(lambda_events.SqsEventSource(
+            retry_queue,
+            batch_size=1,
+            report_batch_item_failures=True,
+            max_concurrency=self.face_swap_max_concurrency if self.pipeline_queue_mode else None
+        ))
+
+    def grant_face_swap_invoke(self, lambda_func):
+        # Grant SageMaker endpoint invoke permission, on every routing target when routing is on
+        endpoint_names = [self.facechain_sagemaker_endpoint_name]
+        if self.facechain_routing_enabled:
+            endpoint_names += [target["endpoint"] for target in self.facechain_routing_targets if target["endpoint"] not in endpoint_names]
+        lambda_func.add_to_role_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            actions=["sagemaker:InvokeEndpointAsync" if self.facechain_async_inference else "sagemaker:InvokeEndpoint"],
+            resources=[
+                f"arn:aws:sagemaker:{self.region}:{self.account}:endpoint/{endpoint_name}"
+                for endpoint_name in endpoint_names
+            ]
+        ))
+
+        if self.facechain_async_inference:
+            # Async invocations read the request from S3
+            async_input_path = f"{self.s3_async_inference_path}input/"
+            lambda_func.add_environment("FACECHAIN_ASYNC_INFERENCE", "true")
+            lambda_func.add_environment("FACECHAIN_ASYNC_INPUT_PATH", async_input_path)
+            lambda_func.add_to_role_policy(iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["s3:PutObject"],
+                resources=[f"arn:aws:s3:::{self.s3_base_bucket_name}/{async_input_path}*"]
+            ))
+
     def create_face_swap_completion_lambda(self):
         lambda_func = lambda_.Function(
             self, "AmazonBedrockGalleryFaceSwapCompletionLambda",
@@ -148,12 +324,40 @@ class LambdaImageProcessingStack(Stack):
             code=lambda_.Code.from_asset("lambda/image-processing/face-swap-completion"),
             environment={
                 "DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME": self.ddb_amazon_bedrock_gallery_process_table_name,
-                "DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_TABLE_NAME": self.ddb_amazon_bedrock_gallery_display_table_name
+                "DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_TABLE_NAME": self.ddb_amazon_bedrock_gallery_display_table_name,
+                "DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_HISTORY_TABLE_NAME": self.ddb_amazon_bedrock_gallery_display_history_table_name,
+                # The display row and the history entry in one TransactWriteItems (UpdateItem on both tables)
+                "COMPLETION_HISTORY_TRANSACTION": str(bool(self.node.try_get_context("completion_history_transaction"))).lower(),
+                # Shards of the history feed index; get-gallery reads the same count
+                "GALLERY_FEED_SHARDS": str(self.node.try_get_context("gallery_feed_shards") or 4)
             },
             timeout=Duration.seconds(60),
-            memory_size=1024
+            memory_size=1024,
+            layers=[self.runtime_layer]
         )
 
+        if self.display_derivatives_enabled:
+            # Render the display rendition and thumbnail of every result (Pillow)
+            lambda_func.add_layers(lambda_.LayerVersion.from_layer_version_arn(
+                self, "CompletionPillowLayer",
+                layer_version_arn=self.node.try_get_context("pillow_layer_arn")
+            ))
+            lambda_func.add_environment("DISPLAY_OBJECT_PATH", self.s3_display_images_path)
+            lambda_func.add_environment("DISPLAY_MAX_SIZE", str(self.node.try_get_context("display_max_size") or 1080))
+            lambda_func.add_environment("THUMBNAIL_MAX_SIZE", str(self.node.try_get_context("display_thumbnail_max_size") or 320))
+            lambda_func.add_environment("DISPLAY_IMAGE_FORMAT", self.node.try_get_context("display_image_format") or "JPEG")
+
+        if self.upload_dedup_enabled:
+            lambda_func.add_environment("DDB_AMAZON_BEDROCK_GALLERY_DEDUP_TABLE_NAME", self.ddb_amazon_bedrock_gallery_dedup_table_name)
+            lambda_func.add_environment("DEDUP_TTL_SECONDS", str(int(self.node.try_get_context("upload_dedup_ttl_minutes") or 60) * 60))
+            lambda_func.add_to_role_policy(iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["dynamodb:PutItem"],
+                resources=[
+                    f"arn:aws:dynamodb:{self.region}:{self.account}:table/{self.ddb_amazon_bedrock_gallery_dedup_table_name}"
+                ]
+            ))
+
         # Grant permissions for DynamoDB operations
         lambda_func.add_to_role_policy(iam.PolicyStatement(
             effect=iam.Effect.ALLOW,
@@ -167,7 +371,8 @@ class LambdaImageProcessingStack(Stack):
                 f"arn:aws:dynamodb:{self.region}:{self.account}:table/{self.ddb_amazon_bedrock_gallery_process_table_name}",
                 f"arn:aws:dynamodb:{self.region}:{self.account}:table/{self.ddb_amazon_bedrock_gallery_process_table_name}/index/*",
                 f"arn:aws:dynamodb:{self.region}:{self.account}:table/{self.ddb_amazon_bedrock_gallery_display_table_name}",
-                f"arn:aws:dynamodb:{self.region}:{self.account}:table/{self.ddb_amazon_bedrock_gallery_display_table_name}/index/*"
+                f"arn:aws:dynamodb:{self.region}:{self.account}:table/{self.ddb_amazon_bedrock_gallery_display_table_name}/index/*",
+                f"arn:aws:dynamodb:{self.region}:{self.account}:table/{self.ddb_amazon_bedrock_gallery_display_history_table_name}"
             ]
         ))
 
@@ -187,7 +392,7 @@ class LambdaImageProcessingStack(Stack):
 
         return lambda_func
 
-    def configure_s3_notifications(self):
+    def grant_s3_invoke_permissions(self):
         # Granting Permissions to Lambda Function (Using Unique ID to Avoid Name Collisions)
         self.face_crop_lambda.add_permission(
             "S3InvokeFaceCrop-" + self.node.addr,
@@ -209,7 +414,93 @@ class LambdaImageProcessingStack(Stack):
             action="lambda:InvokeFunction",
             source_arn=f"arn:aws:s3:::{self.s3_base_bucket_name}"
         )
-        
+
+    def create_pipeline_queue(self, name, lambda_func, batch_size, max_batching_window, max_concurrency):
+        """An SQS queue (with a dead-letter queue) that buffers a stage's S3 notifications."""
+        dead_letter_queue = sqs.Queue(
+            self, f"{name}DeadLetterQueue",
+            retention_period=Duration.days(14)
+        )
+
+        queue = sqs.Queue(
+            self, f"{name}Queue",
+            # Six times the function timeout, as recommended for Lambda event sources
+            visibility_timeout=Duration.seconds(lambda_func.timeout.to_seconds() * 6),
+            retention_period=Duration.days(1),
+            dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=5, queue=dead_letter_queue)
+        )
+
+        # Let the bucket send its notifications to the queue
+        policy = queue.add_to_resource_policy(iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            principals=[iam.ServicePrincipal("s3.amazonaws.com")],
+            actions=["sqs:SendMessage"],
+            resources=[queue.queue_arn],
+            conditions={
+                "ArnLike": {"aws:SourceArn": f"arn:aws:s3:::{self.s3_base_bucket_name}"},
+                "StringEquals": {"aws:SourceAccount": self.account}
+            }
+        ))
+
+        # Failed records only return their own messages to the queue
+        lambda_func.add_event_source(lambda_events.SqsEventSource(
+            queue,
+            batch_size=batch_size,
+            max_batching_window=max_batching_window,
+            report_batch_item_failures=True,
+            max_concurrency=max_concurrency
+        ))
+
+        # S3 checks that it may send to the queue when the notification configuration is put
+        self.pipeline_queue_policies.append(policy.policy_dependable)
+
+        return queue
+
+    def configure_pipeline_queues(self):
+        self.pipeline_queue_policies = []
+
+        # face-crop and face-swap-completion only talk to S3/DynamoDB/Rekognition and take batches
+        if self.pipeline_fused_crop_swap and not self.facechain_async_inference:
+            # Fused face-crop runs the inference, so it is throttled like face-swap below
+            self.face_crop_lambda.add_environment("RECORD_CONCURRENCY", "1")
+            face_crop_queue = self.create_pipeline_queue(
+                "FaceCrop", self.face_crop_lambda,
+                batch_size=1, max_batching_window=None, max_concurrency=self.face_swap_max_concurrency
+            )
+        else:
+            face_crop_queue = self.create_pipeline_queue(
+                "FaceCrop", self.face_crop_lambda,
+                batch_size=10, max_batching_window=Duration.seconds(1), max_concurrency=10
+            )
+        face_swap_completion_queue = self.create_pipeline_queue(
+            "FaceSwapCompletion", self.face_swap_completion_lambda,
+            batch_size=10, max_batching_window=Duration.seconds(1), max_concurrency=10
+        )
+
+        if self.facechain_async_inference:
+            # Submitting only takes a moment and the endpoint keeps its own backlog, so no throttling here
+            face_swap_queue = self.create_pipeline_queue(
+                "FaceSwap", self.face_swap_lambda,
+                batch_size=10, max_batching_window=Duration.seconds(1), max_concurrency=10
+            )
+        else:
+            # One inference per face-swap invocation, so the requests in flight against the endpoint
+            # never exceed face_swap_max_concurrency and the rest of a burst waits in the queue
+            self.face_swap_lambda.add_environment("RECORD_CONCURRENCY", "1")
+            face_swap_queue = self.create_pipeline_queue(
+                "FaceSwap", self.face_swap_lambda,
+                batch_size=1, max_batching_window=None, max_concurrency=self.face_swap_max_concurrency
+            )
+
+        return face_crop_queue, face_swap_queue, face_swap_completion_queue
+
+    def configure_s3_notifications(self):
+        if self.pipeline_queue_mode:
+            queues = self.configure_pipeline_queues()
+        else:
+            queues = None
+            self.grant_s3_invoke_permissions()
+
         # Create bucket reference
         bucket = s3.Bucket.from_bucket_name(
             self,
@@ -223,84 +514,7 @@ class LambdaImageProcessingStack(Stack):
             "ConfigureS3NotificationsLambda",
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="index.handler",
-            code=lambda_.Code.from_inline("""
-import boto3
-import cfnresponse
-import json
-
-def handler(event, context):
-    props = event['ResourceProperties']
-    bucket_name = props['BucketName']
-    notification_config = {
-        'LambdaFunctionConfigurations': [
-            {
-                'Events': ['s3:ObjectCreated:Put'],
-                'LambdaFunctionArn': props['FaceCropLambdaArn'],
-                'Filter': {
-                    'Key': {
-                        'FilterRules': [
-                            {
-                                'Name': 'prefix',
-                                'Value': props['FaceImagesPath']
-                            }
-                        ]
-                    }
-                }
-            },
-            {
-                'Events': ['s3:ObjectCreated:Put'],
-                'LambdaFunctionArn': props['FaceSwapLambdaArn'],
-                'Filter': {
-                    'Key': {
-                        'FilterRules': [
-                            {
-                                'Name': 'prefix',
-                                'Value': props['FaceCroppedImagesPath'] 
-                            }
-                        ]
-                    }
-                }
-            },
-            {
-                'Events': ['s3:ObjectCreated:Put'],
-                'LambdaFunctionArn': props['FaceSwapCompletionLambdaArn'],
-                'Filter': {
-                    'Key': {
-                        'FilterRules': [
-                            {
-                                'Name': 'prefix',
-                                'Value': props['ResultImagesPath']
-                            }
-                        ]
-                    }
-                }
-            }
-        ]
-    }
-    
-    if event['RequestType'] in ['Create', 'Update']:
-        try:
-            s3 = boto3.client('s3')
-            s3.put_bucket_notification_configuration(
-                Bucket=bucket_name,
-                NotificationConfiguration=notification_config
-            )
-            cfnresponse.send(event, context, cfnresponse.SUCCESS, {})
-        except Exception as e:
-            print(f"Error configuring bucket notifications: {str(e)}")
-            cfnresponse.send(event, context, cfnresponse.FAILED, {'Error': str(e)})
-    elif event['RequestType'] == 'Delete':
-        try:
-            s3 = boto3.client('s3')
-            s3.put_bucket_notification_configuration(
-                Bucket=bucket_name,
-                NotificationConfiguration={}
-            )
-            cfnresponse.send(event, context, cfnresponse.SUCCESS, {})
-        except Exception as e:
-            print(f"Error clearing bucket notifications: {str(e)}")
-            cfnresponse.send(event, context, cfnresponse.FAILED, {'Error': str(e)})
-        """),
+            code=lambda_.Code.from_asset("lambda/s3_notifications_config"),
             timeout=Duration.seconds(30)
         )
         
@@ -318,17 +532,27 @@ def handler(event, context):
             on_event_handler=configure_notifications_lambda
         )
 
-        CustomResource(
+        properties = {
+            "BucketName": self.s3_base_bucket_name,
+            "FaceCropLambdaArn": self.face_crop_lambda.function_arn,
+            "FaceSwapLambdaArn": self.face_swap_lambda.function_arn,
+            "FaceSwapCompletionLambdaArn": self.face_swap_completion_lambda.function_arn,
+            "FaceImagesPath": self.s3_face_images_path,
+            "FaceCroppedImagesPath": self.s3_face_cropped_images_path,
+            "ResultImagesPath": self.s3_result_images_path
+        }
+        if queues:
+            face_crop_queue, face_swap_queue, face_swap_completion_queue = queues
+            properties["FaceCropQueueArn"] = face_crop_queue.queue_arn
+            properties["FaceSwapQueueArn"] = face_swap_queue.queue_arn
+            properties["FaceSwapCompletionQueueArn"] = face_swap_completion_queue.queue_arn
+
+        notifications_config = CustomResource(
             self,
             "S3NotificationsConfig",
             service_token=provider.service_token,
-            properties={
-                "BucketName": self.s3_base_bucket_name,
-                "FaceCropLambdaArn": self.face_crop_lambda.function_arn,
-                "FaceSwapLambdaArn": self.face_swap_lambda.function_arn,
-                "FaceSwapCompletionLambdaArn": self.face_swap_completion_lambda.function_arn,
-                "FaceImagesPath": self.s3_face_images_path,
-                "FaceCroppedImagesPath": self.s3_face_cropped_images_path,
-                "ResultImagesPath": self.s3_result_images_path
-            }
+            properties=properties
         )
+
+        if queues:
+            notifications_config.node.add_dependency(*self.pipeline_queue_policies)
@@ -0,0 +1,18 @@
+from aws_cdk import (
+    Stack,
+    aws_lambda as lambda_,
+)
+from constructs import Construct
+
+class LambdaRuntimeLayerStack(Stack):
+    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        # Shared clients, responses and DynamoDB marshalling for the API and image-processing Lambdas
+        self.runtime_layer = lambda_.LayerVersion(
+            self, "AmazonBedrockGalleryRuntimeLayer",
+            layer_version_name="AmazonBedrockGalleryRuntimeLayer",
+            code=lambda_.Code.from_asset("lambda/layers/gallery-runtime"),
+            compatible_runtimes=[lambda_.Runtime.PYTHON_3_11],
+            description="Shared runtime module (gallery_runtime) for the Amazon Bedrock Gallery Lambdas"
+        )
@@ -0,0 +1,21 @@
+import os
+import sys
+
+BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The shared runtime layer, importable as it is on Lambda under /opt/python
+sys.path.insert(0, os.path.join(BACKEND_ROOT, 'lambda', 'layers', 'gallery-runtime', 'python'))
+if BACKEND_ROOT not in sys.path:
+    sys.path.insert(0, BACKEND_ROOT)
+# The stacks resolve their Lambda assets relative to the backend directory, as cdk synth does
+os.chdir(BACKEND_ROOT)
+
+import pytest
+
+from tools import local_aws
+
+@pytest.fixture
+def load_handler(monkeypatch):
+    """Load a Lambda handler (by its tools.local_aws name) with the environment the stacks set."""
+    for name, value in local_aws.handler_environment().items():
+        monkeypatch.setenv(name, value)
+    return local_aws.load_handler
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from gallery_runtime import agreements, clients
+from gallery_runtime.ddb import unmarshall_item
+
+TABLE_NAME = 'ddb-amazon-bedrock-user-agreement'
+
+class BatchWriteStub:
+    """batch_write_item that leaves the first item of every request unprocessed `unprocessed_rounds` times."""
+
+    def __init__(self, unprocessed_rounds=0):
+        self.unprocessed_rounds = unprocessed_rounds
+        self.requests = []
+
+    def put_item(self, TableName, Item):
+        self.requests.append({TableName: [{'PutRequest': {'Item': Item}}]})
+        return {}
+
+    def batch_write_item(self, RequestItems):
+        self.requests.append(RequestItems)
+        if self.unprocessed_rounds:
+            self.unprocessed_rounds -= 1
+            return {'UnprocessedItems': {name: requests[:1] for name, requests in RequestItems.items()}}
+        return {'UnprocessedItems': {}}
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    monkeypatch.setattr(agreements, 'DDB_AMAZON_BEDROCK_USER_AGREEMENT_TABLE_NAME', TABLE_NAME)
+    monkeypatch.setattr(agreements, 'UNPROCESSED_RETRY_BASE_SECONDS', 0)
+    stub = BatchWriteStub()
+    clients.register_client('dynamodb', stub)
+    yield stub
+    clients.reset_clients()
+
+def agreement(name, saved_at='2025-01-01T00:00:00Z'):
+    return agreements.agreement_item({'id': 'x.jpeg', 'name': name, 'agree': 'Y', 'userId': 'kiosk01', 'savedAt': saved_at})
+
+def test_agreement_item_requires_the_fields():
+    with pytest.raises(ValueError):
+        agreements.agreement_item({'name': 'Kim', 'agree': 'Y', 'userId': 'kiosk01'})
+
+def test_a_resubmitted_agreement_has_the_same_key():
+    assert agreements.idempotency_key(agreement('Kim')) == agreements.idempotency_key(agreement('Kim'))
+    assert agreements.idempotency_key(agreement('Kim')) != agreements.idempotency_key(agreement('Kim', '2025-01-01T00:00:01Z'))
+
+def test_write_agreements_batches_by_25(dynamodb):
+    items = {agreements.idempotency_key(item): item for item in (agreement(f'user{n}') for n in range(30))}
+    assert agreements.write_agreements(items) == []
+    assert [len(request[TABLE_NAME]) for request in dynamodb.requests] == [25, 5]
+
+def test_unprocessed_items_are_resubmitted(dynamodb):
+    dynamodb.unprocessed_rounds = 2
+    items = {agreements.idempotency_key(item): item for item in (agreement(f'user{n}') for n in range(3))}
+    assert agreements.write_agreements(items) == []
+    assert [len(request[TABLE_NAME]) for request in dynamodb.requests] == [3, 1, 1]
+
+def test_items_still_unprocessed_are_returned_by_key(dynamodb):
+    dynamodb.unprocessed_rounds = agreements.UNPROCESSED_RETRY_ATTEMPTS + 1
+    items = {agreements.idempotency_key(item): item for item in (agreement(f'user{n}') for n in range(3))}
+    unprocessed_keys = agreements.write_agreements(items)
+    first_item = unmarshall_item(dynamodb.requests[0][TABLE_NAME][0]['PutRequest']['Item'])
+    assert unprocessed_keys == [agreements.idempotency_key(first_item)]
+
+@pytest.mark.parametrize('request_body, status_code', [
+    ({'id': 'x.jpeg', 'name': 'Kim', 'agree': 'Y', 'userId': 'kiosk01', 'savedAt': '2025-01-01T00:00:00Z'}, 200),
+    ({'name': 'Kim', 'agree': 'Y', 'userId': 'kiosk01'}, 400)
+])
+def test_the_api_keeps_its_cors_headers(dynamodb, monkeypatch, load_handler, request_body, status_code):
+    user_agreement = load_handler('user-agreement')
+    monkeypatch.setattr(agreements, 'USER_AGREEMENT_QUEUE_URL', None)
+    response = user_agreement.handler({'body': json.dumps(request_body)}, None)
+    assert response['statusCode'] == status_code
+    assert response['headers']['Access-Control-Allow-Credentials'] == 'true'
+    assert response['headers']['Access-Control-Allow-Methods'] == 'GET,PUT,POST,DELETE,OPTIONS'
+    assert response['headers']['Access-Control-Allow-Headers'] == 'Content-Type, Authorization, Content-Length, X-Requested-With'
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from gallery_runtime import clients
+
+def display_item(key):
+    user_id = key['PK']['S'][len('#USERID#'):]
+    return dict(key, result_object_key={'S': f'result/{user_id}.jpg'})
+
+class BatchGetStub:
+    """batch_get_item that returns the first key of every request and leaves the rest
+    unprocessed, `partial_rounds` times."""
+
+    def __init__(self, partial_rounds=0):
+        self.partial_rounds = partial_rounds
+        self.requests = []
+
+    def batch_get_item(self, RequestItems):
+        self.requests.append(RequestItems)
+        responses, unprocessed = {}, {}
+        for table_name, request in RequestItems.items():
+            keys = request['Keys']
+            served = keys[:1] if self.partial_rounds else keys
+            responses[table_name] = [display_item(key) for key in served]
+            if len(served) < len(keys):
+                unprocessed[table_name] = {'Keys': keys[len(served):]}
+        if self.partial_rounds:
+            self.partial_rounds -= 1
+        return {'Responses': responses, 'UnprocessedKeys': unprocessed}
+
+@pytest.fixture
+def batch_get_image(load_handler, monkeypatch):
+    handler = load_handler('batch-get-image')
+    monkeypatch.setattr(handler.time, 'sleep', lambda seconds: None)
+    yield handler
+    clients.reset_clients()
+
+@pytest.fixture
+def dynamodb():
+    stub = BatchGetStub()
+    clients.register_client('dynamodb', stub)
+    return stub
+
+def post(handler, body):
+    response = handler.lambda_handler({'httpMethod': 'POST', 'body': json.dumps(body)}, None)
+    return response['statusCode'], json.loads(response['body'])
+
+def test_unprocessed_keys_are_retried(batch_get_image, dynamodb):
+    dynamodb.partial_rounds = 2
+    status, body = post(batch_get_image, {'userIds': ['a', 'b', 'c', 'd']})
+    assert status == 200
+    assert [image['userId'] for image in body['images']] == ['a', 'b', 'c', 'd']
+    assert body['missing'] == []
+    assert [len(request[batch_get_image.DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_TABLE_NAME]['Keys']) for request in dynamodb.requests] == [4, 3, 2]
+
+def test_keys_still_unprocessed_after_the_retries_fail_the_request(batch_get_image, dynamodb):
+    dynamodb.partial_rounds = batch_get_image.MAX_UNPROCESSED_RETRIES + 1
+    status, _ = post(batch_get_image, {'userIds': [f'user{n}' for n in range(10)]})
+    assert status == 500
+    assert len(dynamodb.requests) == batch_get_image.MAX_UNPROCESSED_RETRIES + 1
+
+def test_duplicate_user_ids_are_requested_once(batch_get_image, dynamodb):
+    status, body = post(batch_get_image, {'userIds': ['a', 'b', 'a']})
+    assert status == 200
+    assert [image['userId'] for image in body['images']] == ['a', 'b']
+    assert len(dynamodb.requests[0][batch_get_image.DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_TABLE_NAME]['Keys']) == 2
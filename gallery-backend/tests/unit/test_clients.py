@@ -0,0 +1,25 @@
+import pytest
+
+from gallery_runtime import clients
+
+@pytest.fixture(autouse=True)
+def fresh_clients(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-west-2')
+    clients.reset_clients()
+    yield
+    clients.reset_clients()
+
+def test_a_purpose_has_its_own_client_and_config():
+    inference = clients.get_client('sagemaker-runtime')
+    prefetch = clients.get_client('sagemaker-runtime', 'prefetch')
+    assert prefetch is not inference
+    assert prefetch is clients.get_client('sagemaker-runtime', 'prefetch')
+    assert inference.meta.config.read_timeout == 65
+    assert prefetch.meta.config.read_timeout == 0.5
+    assert prefetch.meta.config.retries['total_max_attempts'] == 1
+
+def test_a_registered_client_serves_every_purpose():
+    stub = object()
+    clients.register_client('sagemaker-runtime', stub)
+    assert clients.get_client('sagemaker-runtime') is stub
+    assert clients.get_client('sagemaker-runtime', 'prefetch') is stub
@@ -0,0 +1,98 @@
+import sys
+import time
+from io import BytesIO
+
+import pytest
+from moto import mock_aws
+from PIL import Image, ImageDraw
+
+from gallery_runtime import clients, dedup
+from tools import local_aws
+
+PERCEPTUAL_HASH = '0f0f0f0f0f0f0f0f'
+
+@pytest.fixture
+def dedup_table(monkeypatch):
+    context = local_aws.load_context()
+    for name, value in local_aws.handler_environment(context).items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(dedup, 'DDB_AMAZON_BEDROCK_GALLERY_DEDUP_TABLE_NAME', context['ddb_amazon_bedrock_gallery_dedup_table_name'])
+    with mock_aws():
+        clients.reset_clients()
+        local_aws.create_resources(context)
+        yield
+    clients.reset_clients()
+
+def flip_bits(perceptual_hash, bits):
+    """perceptual_hash with its lowest `bits` bits inverted."""
+    return f'{int(perceptual_hash, 16) ^ ((1 << bits) - 1):016x}'
+
+def record(uuid, content_hash='sha-1', perceptual_hash=PERCEPTUAL_HASH, user_id='kiosk01', theme='ancient_rome', gender='male', skin='light'):
+    dedup.record_completed_job({
+        'userId': user_id, 'theme': theme, 'gender': gender, 'skin': skin,
+        'content_hash': content_hash, 'perceptual_hash': perceptual_hash,
+        'base_image_object_key': 'base-images/ancient_rome.png', 'base_story': 'A portrait.'
+    }, uuid, f'result-images/{uuid}.jpeg')
+
+def find(content_hash='sha-2', perceptual_hash=PERCEPTUAL_HASH, user_id='kiosk01', theme='ancient_rome', gender='male', skin='light'):
+    job = dedup.find_completed_job(user_id, theme, gender, skin, content_hash, perceptual_hash)
+    return job and job['uuid']
+
+def test_an_identical_upload_wins_over_a_closer_perceptual_match(dedup_table):
+    record('job-exact', content_hash='sha-1', perceptual_hash=flip_bits(PERCEPTUAL_HASH, 3))
+    record('job-similar', content_hash='sha-2', perceptual_hash=PERCEPTUAL_HASH)
+    assert find(content_hash='sha-1') == 'job-exact'
+
+def test_a_near_duplicate_within_the_threshold_is_reused(dedup_table):
+    record('job-1', perceptual_hash=flip_bits(PERCEPTUAL_HASH, dedup.DEDUP_MAX_HASH_DISTANCE))
+    record('job-2', content_hash='sha-3', perceptual_hash=flip_bits(PERCEPTUAL_HASH, 1))
+    assert find() == 'job-2'
+
+def test_a_photo_over_the_threshold_is_not_reused(dedup_table):
+    record('job-1', perceptual_hash=flip_bits(PERCEPTUAL_HASH, dedup.DEDUP_MAX_HASH_DISTANCE + 1))
+    assert find() is None
+
+def test_matches_are_scoped_by_user_theme_gender_and_skin(dedup_table):
+    record('job-1')
+    assert find() == 'job-1'
+    assert find(user_id='kiosk02') is None
+    assert find(theme='medieval_period') is None
+    assert find(gender='female') is None
+    assert find(skin='dark') is None
+
+def test_a_job_is_reusable_until_it_expires(dedup_table, monkeypatch):
+    started_at = int(time.time())
+    record('job-1')
+    item = clients.get_client('dynamodb').scan(TableName=dedup.DDB_AMAZON_BEDROCK_GALLERY_DEDUP_TABLE_NAME)['Items'][0]
+    assert int(item['expires_at']['N']) - int(item['created_at']['N']) == dedup.DEDUP_TTL_SECONDS
+    assert int(item['created_at']['N']) >= started_at
+
+    # TTL removes items some time after expires_at; until then they are skipped
+    monkeypatch.setattr(dedup, 'DEDUP_TTL_SECONDS', -1)
+    record('job-2', content_hash='sha-2')
+    assert find(content_hash='sha-2') == 'job-1'
+
+@pytest.fixture
+def face_crop(load_handler):
+    load_handler('face-crop')
+    return sys.modules['image_hash'], sys.modules['detectors']
+
+def jpeg_upload(detectors, image, quality):
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return detectors.UploadImage(Image.open(BytesIO(buffer.getvalue())), buffer.getvalue())
+
+def portrait(face_box):
+    image = Image.linear_gradient('L').resize((640, 480)).convert('RGB')
+    ImageDraw.Draw(image).ellipse(face_box, fill=(224, 172, 105))
+    return image
+
+def test_the_perceptual_hash_matches_a_re_encoded_photo_but_not_another_one(face_crop):
+    image_hash, detectors = face_crop
+    photo = portrait((220, 120, 420, 400))
+    original = image_hash.perceptual_hash(jpeg_upload(detectors, photo, 95))
+    re_encoded = image_hash.perceptual_hash(jpeg_upload(detectors, photo, 60))
+    other = image_hash.perceptual_hash(jpeg_upload(detectors, portrait((20, 20, 200, 300)).rotate(90), 95))
+    assert dedup.hash_distance(original, re_encoded) <= dedup.DEDUP_MAX_HASH_DISTANCE
+    assert dedup.hash_distance(original, other) > dedup.DEDUP_MAX_HASH_DISTANCE
+    assert image_hash.content_hash(b'photo') != image_hash.content_hash(b'photo ')
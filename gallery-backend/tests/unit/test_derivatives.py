@@ -0,0 +1,78 @@
+import sys
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from gallery_runtime import clients
+
+class PutObjectStub:
+    def __init__(self):
+        self.puts = []
+
+    def put_object(self, **params):
+        self.puts.append(params)
+        return {}
+
+@pytest.fixture
+def completion(load_handler):
+    handler = load_handler('face-swap-completion')
+    yield handler, sys.modules['derivatives']
+    clients.reset_clients()
+
+def png_result(size):
+    """A result as the FaceChain endpoint writes it: a PNG, here with an alpha channel."""
+    buffer = BytesIO()
+    Image.new('RGBA', size, (120, 90, 60, 255)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def decoded(content):
+    return Image.open(BytesIO(content))
+
+def test_the_renditions_fit_their_bounds_and_keep_the_aspect_ratio(completion):
+    _, derivatives = completion
+    renditions = derivatives.render_derivatives(png_result((1600, 1200)), 'job-1')
+
+    display_key, display_content, display_type = renditions['display']
+    thumbnail_key, thumbnail_content, thumbnail_type = renditions['thumbnail']
+    assert decoded(display_content).size == (1080, 810)
+    assert decoded(thumbnail_content).size == (320, 240)
+    assert decoded(display_content).format == decoded(thumbnail_content).format == 'JPEG'
+    assert display_type == thumbnail_type == 'image/jpeg'
+    assert display_key == f'{derivatives.DISPLAY_OBJECT_PATH}display/job-1.jpg'
+    assert thumbnail_key == f'{derivatives.DISPLAY_OBJECT_PATH}thumbnail/job-1.jpg'
+
+def test_a_small_result_is_not_scaled_up(completion):
+    _, derivatives = completion
+    renditions = derivatives.render_derivatives(png_result((300, 400)), 'job-1')
+    assert decoded(renditions['display'][1]).size == (300, 400)
+    assert decoded(renditions['thumbnail'][1]).size == (240, 320)
+
+def test_webp_renditions(completion, monkeypatch):
+    _, derivatives = completion
+    monkeypatch.setattr(derivatives, 'DISPLAY_IMAGE_FORMAT', 'WEBP')
+    object_key, content, content_type = derivatives.render_derivatives(png_result((1200, 1600)), 'job-1')['display']
+    assert object_key.endswith('display/job-1.webp')
+    assert content_type == 'image/webp'
+    assert decoded(content).format == 'WEBP'
+    assert decoded(content).size == (810, 1080)
+
+def test_the_renditions_are_stored_as_immutable(completion):
+    handler, derivatives = completion
+    s3 = PutObjectStub()
+    clients.register_client('s3', s3)
+
+    keys = handler.write_derivatives('bucket', png_result((1600, 1200)), 'job-1')
+    assert keys == {'display': f'{derivatives.DISPLAY_OBJECT_PATH}display/job-1.jpg',
+                    'thumbnail': f'{derivatives.DISPLAY_OBJECT_PATH}thumbnail/job-1.jpg'}
+    assert [put['Key'] for put in s3.puts] == [keys['display'], keys['thumbnail']]
+    for put in s3.puts:
+        assert put['CacheControl'] == 'public, max-age=31536000, immutable'
+        assert put['ContentType'] == 'image/jpeg'
+
+def test_an_unreadable_result_leaves_the_completion_without_renditions(completion):
+    handler, _ = completion
+    s3 = PutObjectStub()
+    clients.register_client('s3', s3)
+    assert handler.write_derivatives('bucket', b'not an image', 'job-1') == {}
+    assert s3.puts == []
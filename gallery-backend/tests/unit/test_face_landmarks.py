@@ -0,0 +1,45 @@
+from gallery_runtime import face_landmarks
+from gallery_runtime.job_metadata import MAX_METADATA_SIZE
+
+def face_detail(**overrides):
+    points = dict({
+        'eyeLeft': (0.4, 0.4),
+        'eyeRight': (0.6, 0.4),
+        'nose': (0.5, 0.5),
+        'mouthLeft': (0.42, 0.6),
+        'mouthRight': (0.58, 0.6)
+    }, **overrides)
+    return {'Landmarks': [{'Type': name, 'X': x, 'Y': y} for name, (x, y) in points.items()]}
+
+def test_crop_landmarks_are_ratios_of_the_crop():
+    landmarks = face_landmarks.crop_landmarks(face_detail(), (1000, 1000), (300, 300, 700, 700))
+    assert landmarks == [[0.25, 0.25], [0.75, 0.25], [0.5, 0.5], [0.3, 0.75], [0.7, 0.75]]
+
+def test_crop_landmarks_order_by_position_not_label():
+    swapped = face_detail(eyeLeft=(0.6, 0.4), eyeRight=(0.4, 0.4), mouthLeft=(0.58, 0.6), mouthRight=(0.42, 0.6))
+    crop_box = (300, 300, 700, 700)
+    assert face_landmarks.crop_landmarks(swapped, (1000, 1000), crop_box) == \
+        face_landmarks.crop_landmarks(face_detail(), (1000, 1000), crop_box)
+
+def test_crop_landmarks_need_all_five():
+    detail = face_detail()
+    detail['Landmarks'] = [landmark for landmark in detail['Landmarks'] if landmark['Type'] != 'nose']
+    assert face_landmarks.crop_landmarks(detail, (1000, 1000), (300, 300, 700, 700)) is None
+    assert face_landmarks.crop_landmarks({}, (1000, 1000), (300, 300, 700, 700)) is None
+
+def test_landmarks_round_trip_through_metadata():
+    landmarks = [[0.25, 0.25], [0.75, 0.25], [0.5, 0.5], [0.3, 0.75], [0.7, 0.75]]
+    assert face_landmarks.decode_landmarks(face_landmarks.encode_landmarks(landmarks)) == landmarks
+
+def test_malformed_metadata_decodes_to_none():
+    assert face_landmarks.decode_landmarks(None) is None
+    assert face_landmarks.decode_landmarks('0.1,0.2,0.3') is None
+    assert face_landmarks.decode_landmarks('a,b,c,d,e,f,g,h,i,j') is None
+
+def test_the_story_gives_way_to_the_landmarks():
+    landmarks = [[0.25, 0.25], [0.75, 0.25], [0.5, 0.5], [0.3, 0.75], [0.7, 0.75]]
+    metadata = {'uuid': 'x', 'base-story': 's' * (MAX_METADATA_SIZE - 30)}
+    with_landmarks = face_landmarks.add_landmarks_metadata(metadata, landmarks)
+    assert 'base-story' not in with_landmarks
+    assert face_landmarks.decode_landmarks(with_landmarks[face_landmarks.METADATA_NAME]) == landmarks
+    assert face_landmarks.add_landmarks_metadata(metadata, None) is metadata
@@ -0,0 +1,105 @@
+import json
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from gallery_runtime import clients
+from gallery_runtime.job_metadata import build_metadata
+from tools import local_aws
+
+USER_ID = 'kiosk01'
+
+@pytest.fixture
+def completion(load_handler):
+    context = local_aws.load_context()
+    with mock_aws():
+        clients.reset_clients()
+        local_aws.create_resources(context)
+        handler = load_handler('face-swap-completion')
+        handler.context = context
+        yield handler
+    clients.reset_clients()
+
+@pytest.fixture(params=[False, True], ids=['update', 'transaction'])
+def transaction_mode(request, completion, monkeypatch):
+    monkeypatch.setattr(completion, 'COMPLETION_HISTORY_TRANSACTION', request.param)
+    return request.param
+
+def put_result(completion, uuid):
+    """A result image as the FaceChain endpoint writes it, with the job in its metadata."""
+    object_key = f"{completion.context['s3_result_images_path']}{uuid}.jpeg"
+    boto3.client('s3').put_object(
+        Bucket=completion.context['s3_base_bucket_name'],
+        Key=object_key,
+        Body=local_aws.sample_image(640, 640),
+        Metadata=build_metadata({
+            'userId': USER_ID, 'theme': 'ancient_rome', 'gender': 'female', 'skin': 'light',
+            'base_image_object_key': 'base-images/ancient_rome.png', 'base_story': 'A portrait.'
+        })
+    )
+    return object_key
+
+def complete(completion, object_key, event_time):
+    event = local_aws.s3_put_event(completion.context['s3_base_bucket_name'], object_key)
+    event['Records'][0]['eventTime'] = event_time
+    return completion.lambda_handler(event, None)
+
+def outcomes(capsys):
+    """The outcome of every face_swap_completion stage record printed so far."""
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{')]
+    return [record['outcome'] for record in records if record.get('Stage') == 'face_swap_completion']
+
+def display_row(completion):
+    item = boto3.client('dynamodb').get_item(
+        TableName=completion.DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_TABLE_NAME,
+        Key={'PK': {'S': f'#USERID#{USER_ID}'}}
+    ).get('Item')
+    return {name: value.get('S') for name, value in item.items()} if item else None
+
+def history(completion):
+    items = boto3.client('dynamodb').scan(TableName=completion.DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_HISTORY_TABLE_NAME)['Items']
+    return {item['uuid']['S']: item['created_at']['S'] for item in items}
+
+def test_a_duplicate_event_leaves_the_display_row_and_history_as_they_are(completion, transaction_mode, capsys):
+    object_key = put_result(completion, 'job-1')
+    complete(completion, object_key, '2025-01-01T00:00:01.000Z')
+    first_row, first_history = display_row(completion), history(completion)
+
+    complete(completion, object_key, '2025-01-01T00:00:01.000Z')
+    assert display_row(completion) == first_row
+    assert history(completion) == first_history
+    assert list(first_history) == ['job-1']
+    assert outcomes(capsys) == ['updated', 'duplicate_event']
+
+def test_an_older_result_arriving_late_does_not_replace_the_newer_one(completion, transaction_mode, capsys):
+    newer_key, older_key = put_result(completion, 'job-2'), put_result(completion, 'job-1')
+    complete(completion, newer_key, '2025-01-01T00:00:02.000Z')
+    complete(completion, older_key, '2025-01-01T00:00:01.000Z')
+
+    row = display_row(completion)
+    assert row['uuid'] == 'job-2'
+    assert row['result_event_time'] == '2025-01-01T00:00:02.000Z'
+    # The older result is still a result of the gallery
+    assert sorted(history(completion)) == ['job-1', 'job-2']
+    assert outcomes(capsys) == ['updated', 'superseded']
+
+def test_a_newer_result_replaces_the_display_row(completion, transaction_mode):
+    complete(completion, put_result(completion, 'job-1'), '2025-01-01T00:00:01.000Z')
+    complete(completion, put_result(completion, 'job-2'), '2025-01-01T00:00:02.000Z')
+    assert display_row(completion)['uuid'] == 'job-2'
+
+def test_a_failed_transaction_writes_neither_row(completion, monkeypatch):
+    monkeypatch.setattr(completion, 'COMPLETION_HISTORY_TRANSACTION', True)
+    object_key = put_result(completion, 'job-1')
+    history_table_name = completion.DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_HISTORY_TABLE_NAME
+    monkeypatch.setattr(completion, 'DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_HISTORY_TABLE_NAME', 'missing-history-table')
+
+    with pytest.raises(Exception):
+        complete(completion, object_key, '2025-01-01T00:00:01.000Z')
+    assert display_row(completion) is None
+
+    monkeypatch.setattr(completion, 'DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_HISTORY_TABLE_NAME', history_table_name)
+    complete(completion, object_key, '2025-01-01T00:00:01.000Z')
+    assert display_row(completion)['uuid'] == 'job-1'
+    assert list(history(completion)) == ['job-1']
@@ -0,0 +1,45 @@
+from gallery_runtime import feed
+
+def item(pk, created_at, feed_key='#ALL#0'):
+    return {'PK': {'S': pk}, 'feed': {'S': feed_key}, 'created_at': {'S': created_at}, 'theme': {'S': 'space'}}
+
+def test_a_result_stays_on_its_shard():
+    keys = {feed.feed_key(f'uuid-{index}') for index in range(200)}
+    assert keys == set(feed.feed_keys()) - {feed.LEGACY_FEED_KEY}
+    assert feed.feed_key('uuid-1') == feed.feed_key('uuid-1')
+
+def test_the_legacy_partition_is_read_as_a_shard():
+    assert feed.feed_keys()[-1] == '#ALL'
+    assert len(feed.feed_keys()) == feed.FEED_SHARDS + 1
+
+def test_pages_merge_newest_first_and_continue_after_the_last_item_shown():
+    responses = {
+        '#ALL#0': {'Items': [item('a', '2024-01-05'), item('b', '2024-01-02')]},
+        '#ALL#1': {'Items': [item('c', '2024-01-04', '#ALL#1'), item('d', '2024-01-03', '#ALL#1')],
+                   'LastEvaluatedKey': feed.index_key(item('d', '2024-01-03', '#ALL#1'))},
+        '#ALL': {'Items': []}
+    }
+    positions = dict.fromkeys(responses)
+    page, next_positions = feed.merge_pages(responses, positions, 3)
+    assert [entry['PK']['S'] for entry in page] == ['a', 'c', 'd']
+    # Shard 0 was cut after 'a', shard 1 was read to its LastEvaluatedKey, the legacy shard is exhausted
+    assert next_positions == {
+        '#ALL#0': feed.index_key(item('a', '2024-01-05')),
+        '#ALL#1': feed.index_key(item('d', '2024-01-03', '#ALL#1'))
+    }
+
+def test_a_shard_with_nothing_shown_keeps_its_position():
+    start = feed.index_key(item('x', '2024-02-01', '#ALL#1'))
+    responses = {
+        '#ALL#0': {'Items': [item('a', '2024-01-05'), item('b', '2024-01-04')]},
+        '#ALL#1': {'Items': [item('c', '2024-01-01', '#ALL#1')]}
+    }
+    page, next_positions = feed.merge_pages(responses, {'#ALL#0': None, '#ALL#1': start}, 2)
+    assert [entry['PK']['S'] for entry in page] == ['a', 'b']
+    assert next_positions == {'#ALL#1': start}
+
+def test_every_shard_exhausted_ends_the_feed():
+    responses = {'#ALL#0': {'Items': [item('a', '2024-01-05')]}, '#ALL': {'Items': []}}
+    page, next_positions = feed.merge_pages(responses, dict.fromkeys(responses), 20)
+    assert len(page) == 1
+    assert next_positions == {}
@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from gallery_runtime import clients, feed
+
+class StubDynamoDB:
+    """Serves the feed index queries from in-memory items, one page of Limit items at a time."""
+
+    def __init__(self, items):
+        self.items = items
+        self.queries = []
+
+    def query(self, **params):
+        self.queries.append(params)
+        partition = params['ExpressionAttributeValues'][':feed']['S']
+        matching = sorted((entry for entry in self.items if entry['feed']['S'] == partition),
+                          key=lambda entry: entry['created_at']['S'], reverse=True)
+        start = params.get('ExclusiveStartKey')
+        if start:
+            matching = [entry for entry in matching if entry['created_at']['S'] < start['created_at']['S']]
+        page = matching[:params['Limit']]
+        response = {'Items': page}
+        if len(matching) > params['Limit']:
+            response['LastEvaluatedKey'] = feed.index_key(page[-1])
+        return response
+
+def history_item(index):
+    uuid = f'uuid-{index}'
+    return {
+        'PK': {'S': uuid}, 'uuid': {'S': uuid}, 'feed': {'S': feed.feed_key(uuid)},
+        'created_at': {'S': f'2024-01-01T00:00:{index:02d}'}, 'theme': {'S': 'space'},
+        'userId': {'S': 'user'}, 'result_object_key': {'S': f'result/{uuid}.jpg'}
+    }
+
+@pytest.fixture
+def get_gallery(load_handler):
+    yield load_handler('get-gallery')
+    clients.reset_clients()
+
+@pytest.fixture
+def dynamodb():
+    stub = StubDynamoDB([history_item(index) for index in range(25)])
+    clients.register_client('dynamodb', stub)
+    return stub
+
+def get(handler, **query_parameters):
+    response = handler.lambda_handler({'httpMethod': 'GET', 'queryStringParameters': query_parameters}, None)
+    return response['statusCode'], json.loads(response['body'])
+
+def test_a_cursor_round_trips(get_gallery):
+    position = {'shards': {'#ALL#0': {'PK': {'S': 'a'}}, '#ALL': None}}
+    assert get_gallery.decode_cursor(get_gallery.encode_cursor(position)) == position
+    assert get_gallery.encode_cursor(None) is None
+
+@pytest.mark.parametrize('cursor', ['not base64!', 'bm90IGpzb24=', 'WzFd', 'eyJ4IjogMX0='])
+def test_a_malformed_cursor_is_rejected(get_gallery, cursor):
+    with pytest.raises(ValueError):
+        get_gallery.decode_cursor(cursor)
+
+@pytest.mark.parametrize('limit', ['0', '51', 'ten'])
+def test_the_limit_is_bounded(get_gallery, dynamodb, limit):
+    status, _ = get(get_gallery, limit=limit)
+    assert status == 400
+    assert dynamodb.queries == []
+
+def test_a_cursor_of_another_feed_is_rejected(get_gallery, dynamodb):
+    theme_cursor = get_gallery.encode_cursor({'PK': {'S': 'a'}})
+    assert get(get_gallery, cursor=theme_cursor)[0] == 400
+    foreign_shards = get_gallery.encode_cursor({'shards': {'#OTHER': None}})
+    assert get(get_gallery, cursor=foreign_shards)[0] == 400
+
+def test_the_pages_walk_every_shard_newest_first(get_gallery, dynamodb):
+    seen = []
+    cursor = None
+    while True:
+        parameters = {'limit': '10', 'cursor': cursor} if cursor else {'limit': '10'}
+        status, body = get(get_gallery, **parameters)
+        assert status == 200
+        assert len(body['items']) <= 10
+        seen.extend(entry['uuid'] for entry in body['items'])
+        cursor = body['nextCursor']
+        if not cursor:
+            break
+    assert seen == [f'uuid-{index}' for index in reversed(range(25))]
+    assert {query['ExpressionAttributeValues'][':feed']['S'] for query in dynamodb.queries} == set(feed.feed_keys())
+
+def test_the_theme_feed_waits_for_its_index(get_gallery, dynamodb, monkeypatch):
+    monkeypatch.setattr(get_gallery, 'THEME_FEED_ENABLED', False)
+    assert get(get_gallery, theme='space')[0] == 400
+    assert dynamodb.queries == []
@@ -0,0 +1,34 @@
+from gallery_runtime import job_metadata
+
+JOB = {
+    'userId': 'kiosk01',
+    'theme': 'space',
+    'gender': 'female',
+    'skin': 'light',
+    'base_image_object_key': 'images/base/space-female-light-1.png',
+    'base_story': 'An astronaut looks back at the Earth.'
+}
+
+def test_metadata_round_trips_the_job():
+    assert job_metadata.parse_metadata(job_metadata.build_metadata(JOB)) == JOB
+
+def test_a_long_story_is_left_out():
+    job = dict(JOB, base_story='별' * job_metadata.MAX_METADATA_SIZE)
+    metadata = job_metadata.build_metadata(job)
+    assert 'base-story' not in metadata
+    assert job_metadata.metadata_size(metadata) <= job_metadata.MAX_METADATA_SIZE
+    assert job_metadata.parse_metadata(metadata) == {field: value for field, value in JOB.items() if field != 'base_story'}
+
+def test_oversized_metadata_without_a_story_is_dropped():
+    job = {field: value for field, value in JOB.items() if field != 'base_story'}
+    job['base_image_object_key'] = 'images/base/' + 'x' * job_metadata.MAX_METADATA_SIZE
+    assert job_metadata.build_metadata(job) == {}
+
+def test_oversized_metadata_is_dropped_when_the_story_is_not_enough():
+    job = dict(JOB, base_image_object_key='images/base/' + 'x' * job_metadata.MAX_METADATA_SIZE)
+    assert job_metadata.build_metadata(job) == {}
+    assert job_metadata.presigned_post_metadata(job) == {}
+
+def test_objects_without_the_required_fields_have_no_job():
+    assert job_metadata.parse_metadata(None) is None
+    assert job_metadata.parse_metadata({'user-id': 'kiosk01'}) is None
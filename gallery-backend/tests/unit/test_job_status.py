@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+from gallery_runtime import job_status
+
+STARTED_AT = datetime(2025, 1, 1, 12, 0, 0)
+
+def at(seconds):
+    return (STARTED_AT + timedelta(seconds=seconds)).isoformat()
+
+def test_current_stage_is_the_latest_recorded_one():
+    item = {'created_at': at(0), 'cropped_at': at(4), 'swapping_at': at(6)}
+    assert job_status.current_stage(item) == ('swapping', at(6))
+
+def test_current_stage_ignores_a_missing_intermediate_stage():
+    # face-swap records nothing for a deduplicated upload, whose result is copied by face-crop
+    item = {'created_at': at(0), 'cropped_at': at(4), 'completed_at': at(5)}
+    assert job_status.current_stage(item) == ('completed', at(5))
+
+def test_rejected_is_final():
+    item = {'created_at': at(0), 'rejected_at': at(3)}
+    assert job_status.current_stage(item) == ('rejected', at(3))
+    assert job_status.remaining_seconds('rejected', at(3)) is None
+
+def test_remaining_seconds_counts_the_later_stages():
+    stage_seconds = job_status.JOB_STAGE_SECONDS
+    remaining = job_status.remaining_seconds('cropped', at(0), now=STARTED_AT + timedelta(seconds=1))
+    assert remaining == stage_seconds['cropped'] - 1 + stage_seconds['swapping']
+
+def test_a_slow_stage_does_not_eat_into_the_later_ones():
+    remaining = job_status.remaining_seconds('cropped', at(0), now=STARTED_AT + timedelta(seconds=60))
+    assert remaining == job_status.JOB_STAGE_SECONDS['swapping']
+
+def test_stage_set_expressions_keep_the_first_time():
+    assert job_status.stage_set_expressions(['cropped', 'swapping'], ':updated_at') == [
+        'cropped_at = if_not_exists(cropped_at, :updated_at)',
+        'swapping_at = if_not_exists(swapping_at, :updated_at)'
+    ]
@@ -0,0 +1,90 @@
+import sys
+from io import BytesIO
+
+import pytest
+from PIL import Image, ImageDraw
+
+FACE_BOX = {'Left': 0.3, 'Top': 0.2, 'Width': 0.4, 'Height': 0.6}
+
+@pytest.fixture
+def face_crop(load_handler):
+    load_handler('face-crop')
+    # index.py imports its sibling modules, which stay loaded under their own names
+    return sys.modules['quality_gate'], sys.modules['detectors']
+
+def upload_image(detectors, image):
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=95)
+    image_content = buffer.getvalue()
+    return detectors.UploadImage(Image.open(BytesIO(image_content)), image_content)
+
+def flat_image(size=(800, 800)):
+    return Image.new('RGB', size, (180, 140, 110))
+
+def detailed_image(size=(800, 800)):
+    image = flat_image(size)
+    draw = ImageDraw.Draw(image)
+    for x in range(0, size[0], 8):
+        draw.line((x, 0, x, size[1]), fill=(20, 20, 20), width=2)
+    return image
+
+def face(box=FACE_BOX, **fields):
+    return dict({'BoundingBox': dict(box), 'Confidence': 99.0}, **fields)
+
+def test_no_face_is_rejected(face_crop):
+    quality_gate, detectors = face_crop
+    status, _ = quality_gate.evaluate(upload_image(detectors, detailed_image()), [])
+    assert status == quality_gate.STATUS_REJECTED_NO_FACE
+
+def test_a_second_large_face_is_rejected(face_crop):
+    quality_gate, detectors = face_crop
+    second = face({'Left': 0.0, 'Top': 0.0, 'Width': 0.3, 'Height': 0.6})
+    status, _ = quality_gate.evaluate(upload_image(detectors, detailed_image()), [face(), second])
+    assert status == quality_gate.STATUS_REJECTED_MULTIPLE_FACES
+
+def test_a_small_background_face_is_ignored(face_crop):
+    quality_gate, detectors = face_crop
+    background = face({'Left': 0.0, 'Top': 0.0, 'Width': 0.1, 'Height': 0.1})
+    status, _ = quality_gate.evaluate(upload_image(detectors, detailed_image()), [face(), background])
+    assert status == quality_gate.STATUS_ACCEPTED
+
+def test_a_face_below_the_minimum_size_is_rejected(face_crop):
+    quality_gate, detectors = face_crop
+    box = {'Left': 0.4, 'Top': 0.4, 'Width': (quality_gate.MIN_FACE_SIZE - 1) / 800, 'Height': 0.2}
+    status, _ = quality_gate.evaluate(upload_image(detectors, detailed_image()), [face(box)])
+    assert status == quality_gate.STATUS_REJECTED_FACE_TOO_SMALL
+
+def test_rekognition_sharpness_is_checked_against_the_threshold(face_crop):
+    quality_gate, detectors = face_crop
+    upload = upload_image(detectors, detailed_image())
+    blurry = face(Quality={'Sharpness': quality_gate.MIN_SHARPNESS - 0.1})
+    sharp = face(Quality={'Sharpness': quality_gate.MIN_SHARPNESS})
+    assert quality_gate.evaluate(upload, [blurry])[0] == quality_gate.STATUS_REJECTED_BLURRY
+    assert quality_gate.evaluate(upload, [sharp])[0] == quality_gate.STATUS_ACCEPTED
+
+def test_a_featureless_face_fails_the_laplacian_check(face_crop):
+    # Detectors without a sharpness score fall back to the variance of the Laplacian
+    quality_gate, detectors = face_crop
+    assert quality_gate.laplacian_variance(upload_image(detectors, flat_image()), FACE_BOX) < 1
+    status, _ = quality_gate.evaluate(upload_image(detectors, flat_image()), [face()])
+    assert status == quality_gate.STATUS_REJECTED_BLURRY
+    status, _ = quality_gate.evaluate(upload_image(detectors, detailed_image()), [face()])
+    assert status == quality_gate.STATUS_ACCEPTED
+
+def test_a_turned_away_face_is_rejected(face_crop):
+    quality_gate, detectors = face_crop
+    upload = upload_image(detectors, detailed_image())
+    turned = face(Quality={'Sharpness': 90.0}, Pose={'Yaw': quality_gate.MAX_YAW + 1, 'Pitch': 0.0})
+    facing = face(Quality={'Sharpness': 90.0}, Pose={'Yaw': quality_gate.MAX_YAW, 'Pitch': 0.0})
+    assert quality_gate.evaluate(upload, [turned])[0] == quality_gate.STATUS_REJECTED_POSE
+    assert quality_gate.evaluate(upload, [facing])[0] == quality_gate.STATUS_ACCEPTED
+
+def test_the_proxy_is_decoded_once(face_crop, monkeypatch):
+    quality_gate, detectors = face_crop
+    decodes = []
+    detection_proxy_image = detectors.detection_proxy_image
+    monkeypatch.setattr(detectors, 'detection_proxy_image', lambda *args: decodes.append(args) or detection_proxy_image(*args))
+    upload = upload_image(detectors, detailed_image((3000, 2000)))
+    assert upload.proxy().size == (1280, 853)
+    assert upload.proxy(quality_gate.SHARPNESS_SAMPLE_SIZE).size == (640, 427)
+    assert len(decodes) == 1
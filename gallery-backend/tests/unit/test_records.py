@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from gallery_runtime import records
+
+def s3_record(object_key):
+    return {'eventSource': 'aws:s3', 's3': {'bucket': {'name': 'bucket'}, 'object': {'key': object_key}}}
+
+def sqs_message(message_id, *object_keys):
+    return {'eventSource': 'aws:sqs', 'messageId': message_id,
+            'body': json.dumps({'Records': [s3_record(object_key) for object_key in object_keys]})}
+
+def handle_record(record):
+    object_key = records.record_object_key(record)
+    if object_key.startswith('bad'):
+        raise ValueError(f'cannot process {object_key}')
+    return object_key
+
+def test_a_partial_failure_is_reported_not_raised():
+    response = records.handle_event({'Records': [s3_record('good-1'), s3_record('bad-1'), s3_record('good%2B2')]}, handle_record)
+    body = json.loads(response['body'])
+    assert response['statusCode'] == 200
+    assert body['processed'] == 2
+    assert body['failed'] == [{'objectKey': 'bad-1', 'error': 'cannot process bad-1'}]
+    # Results keep the order of the records; keys are URL-decoded
+    assert body['results'] == ['good-1', 'good+2']
+
+def test_a_fully_failed_notification_is_raised_for_retry():
+    with pytest.raises(ValueError):
+        records.handle_event({'Records': [s3_record('bad-1'), s3_record('bad-2')]}, handle_record)
+
+def test_an_empty_notification_succeeds():
+    assert json.loads(records.summarize([])['body'])['processed'] == 0
+
+def test_only_sqs_messages_with_a_failed_record_are_retried():
+    event = {'Records': [
+        sqs_message('m1', 'good-1'),
+        sqs_message('m2', 'good-2', 'bad-2'),
+        sqs_message('m3', 'bad-3', 'bad-4'),
+        {'eventSource': 'aws:sqs', 'messageId': 'm4', 'body': 'not json'},
+        # The s3:TestEvent carries no records
+        {'eventSource': 'aws:sqs', 'messageId': 'm5', 'body': json.dumps({'Event': 's3:TestEvent'})}
+    ]}
+    response = records.handle_event(event, handle_record, max_workers=2)
+    assert sorted(failure['itemIdentifier'] for failure in response['batchItemFailures']) == ['m2', 'm3', 'm4']
+
+def test_an_sqs_batch_without_failures_is_acknowledged():
+    response = records.handle_event({'Records': [sqs_message('m1', 'good-1', 'good-2')]}, handle_record)
+    assert response == {'batchItemFailures': []}
@@ -0,0 +1,74 @@
+import base64
+import json
+import urllib.parse
+
+import pytest
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+from gallery_runtime import delivery
+
+KEY_PAIR_ID = 'K2JCJMDEHXQW5F'
+DOMAIN_NAME = 'd111111abcdef8.cloudfront.net'
+
+@pytest.fixture(scope='module')
+def private_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+@pytest.fixture(scope='module')
+def signer(private_key):
+    pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    return delivery.create_signer(KEY_PAIR_ID, pem)
+
+def cloudfront_b64decode(value):
+    return base64.b64decode(value.replace('-', '+').replace('_', '=').replace('~', '/'))
+
+def test_signed_url_verifies_against_the_public_key(private_key, signer):
+    expires_at = 1767225600
+    url = delivery.signed_cdn_url(signer, DOMAIN_NAME, 'images/display/display/20250101-u1-joseon-male-light-1a2b3c4d.jpg', expires_at)
+
+    resource, query = url.split('?')
+    parameters = dict(urllib.parse.parse_qsl(query))
+    assert resource == f'https://{DOMAIN_NAME}/images/display/display/20250101-u1-joseon-male-light-1a2b3c4d.jpg'
+    assert parameters['Key-Pair-Id'] == KEY_PAIR_ID
+    assert parameters['Expires'] == str(expires_at)
+
+    # The canned policy CloudFront rebuilds from the URL and Expires
+    policy = json.dumps({'Statement': [{'Resource': resource, 'Condition': {'DateLessThan': {'AWS:EpochTime': expires_at}}}]},
+                        separators=(',', ':'))
+    private_key.public_key().verify(cloudfront_b64decode(parameters['Signature']), policy.encode('utf-8'),
+                                    padding.PKCS1v15(), hashes.SHA1())
+    with pytest.raises(InvalidSignature):
+        private_key.public_key().verify(cloudfront_b64decode(parameters['Signature']), policy.replace('display', 'results').encode('utf-8'),
+                                        padding.PKCS1v15(), hashes.SHA1())
+
+def test_expiry_is_stable_within_a_window_and_leaves_the_minimum_ttl():
+    window, min_ttl = 3600, 300
+    assert delivery.quantized_expiry(7200, window, min_ttl) == 10800
+    assert delivery.quantized_expiry(10499, window, min_ttl) == 10800
+    # Less than min_ttl before the end of a window, the next window's end is used
+    assert delivery.quantized_expiry(10501, window, min_ttl) == 14400
+    for now in range(0, 100000, 997):
+        expires_at = delivery.quantized_expiry(now, window, min_ttl)
+        assert expires_at % window == 0
+        assert min_ttl <= expires_at - now < min_ttl + window
+
+def test_repeated_requests_within_a_window_get_the_same_url(monkeypatch, signer):
+    monkeypatch.setattr(delivery, 'RESULT_CDN_DOMAIN_NAME', DOMAIN_NAME)
+    monkeypatch.setattr(delivery, '_signer', signer)
+
+    first = delivery.image_url('bucket', 'images/results/a.png', now=1767225600)
+    assert delivery.image_url('bucket', 'images/results/a.png', now=1767225600 + 1200) == first
+    assert delivery.image_url('bucket', 'images/results/a.png', now=1767225600 + 3600) != first
+    assert delivery.image_url('bucket', 'images/results/b.png', now=1767225600) != first
+
+def test_without_a_distribution_urls_are_presigned_s3_urls(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-west-2')
+    monkeypatch.setattr(delivery, 'RESULT_CDN_DOMAIN_NAME', None)
+
+    url = delivery.image_url('bucket', 'images/display/thumbnail/a.jpg')
+    assert url.startswith('https://bucket.s3.')
+    assert 'response-content-type=image%2Fjpeg' in url
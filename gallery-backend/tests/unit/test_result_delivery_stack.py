@@ -0,0 +1,124 @@
+import json
+import os
+
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from stacks.apigateway.apis import ApiGatewayApisStack
+from stacks.cloudfront.result_delivery_stack import ResultDeliveryStack
+from stacks.layers.runtime_layer import LambdaRuntimeLayerStack
+
+CRYPTOGRAPHY_LAYER_ARN = 'arn:aws:lambda:us-west-2:123456789012:layer:cryptography:1'
+
+def public_key_pem():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode('ascii')
+
+def synth(**context_overrides):
+    with open('cdk.context.json') as file:
+        context = json.load(file)
+    context['s3_base_bucket_name'] = 'amazon-bedrock-gallery-test'
+    context.update(context_overrides)
+
+    app = core.App(context=context)
+    runtime_layer_stack = LambdaRuntimeLayerStack(app, 'RuntimeLayer')
+    result_delivery_stack = ResultDeliveryStack(app, 'ResultDelivery') if context.get('result_cdn_enabled') else None
+    api_stack = ApiGatewayApisStack(app, 'Api', runtime_layer=runtime_layer_stack.runtime_layer,
+                                    result_delivery=result_delivery_stack)
+    return result_delivery_stack, api_stack
+
+def function_environment(template, function_name):
+    functions = template.find_resources('AWS::Lambda::Function', {'Properties': {'FunctionName': function_name}})
+    (function,) = functions.values()
+    return function['Properties']['Environment']['Variables']
+
+@pytest.fixture(scope='module')
+def enabled():
+    result_delivery_stack, api_stack = synth(
+        result_cdn_enabled=True,
+        result_cdn_public_key_pem=public_key_pem(),
+        cryptography_layer_arn=CRYPTOGRAPHY_LAYER_ARN
+    )
+    return assertions.Template.from_stack(result_delivery_stack), assertions.Template.from_stack(api_stack)
+
+def test_distribution_only_serves_signed_requests_over_https(enabled):
+    delivery, _ = enabled
+    delivery.resource_count_is('AWS::CloudFront::Distribution', 1)
+    delivery.resource_count_is('AWS::CloudFront::PublicKey', 1)
+    delivery.has_resource_properties('AWS::CloudFront::Distribution', {
+        'DistributionConfig': {
+            'DefaultCacheBehavior': {
+                'TrustedKeyGroups': [assertions.Match.any_value()],
+                'ViewerProtocolPolicy': 'redirect-to-https',
+                'AllowedMethods': ['GET', 'HEAD']
+            }
+        }
+    })
+
+def test_signature_is_not_part_of_the_cache_key(enabled):
+    delivery, _ = enabled
+    delivery.has_resource_properties('AWS::CloudFront::CachePolicy', {
+        'CachePolicyConfig': {
+            'ParametersInCacheKeyAndForwardedToOrigin': {
+                'QueryStringsConfig': {'QueryStringBehavior': 'none'},
+                'CookiesConfig': {'CookieBehavior': 'none'}
+            }
+        }
+    })
+
+def test_bucket_is_read_through_origin_access_control_for_image_prefixes_only(enabled):
+    delivery, _ = enabled
+    delivery.resource_count_is('AWS::CloudFront::OriginAccessControl', 1)
+    delivery.has_resource_properties('AWS::S3::BucketPolicy', {
+        'Bucket': 'amazon-bedrock-gallery-test',
+        'PolicyDocument': {
+            'Statement': [assertions.Match.object_like({
+                'Principal': {'Service': 'cloudfront.amazonaws.com'},
+                'Action': 's3:GetObject',
+                'Resource': [
+                    'arn:aws:s3:::amazon-bedrock-gallery-test/images/results/*',
+                    'arn:aws:s3:::amazon-bedrock-gallery-test/images/display/*'
+                ]
+            })]
+        }
+    })
+
+@pytest.mark.parametrize('function_name', [
+    'AmazonBedrockGalleryGetImage', 'AmazonBedrockGalleryBatchGetImage', 'AmazonBedrockGalleryGetGallery'
+])
+def test_image_apis_sign_cdn_urls(enabled, function_name):
+    _, api = enabled
+    environment = function_environment(api, function_name)
+    assert 'RESULT_CDN_DOMAIN_NAME' in environment
+    assert 'RESULT_CDN_KEY_PAIR_ID' in environment
+    assert environment['RESULT_CDN_PRIVATE_KEY_SECRET_ID'] == 'amazon-bedrock-gallery/result-cdn-signing-key'
+    assert environment['RESULT_CDN_URL_WINDOW_SECONDS'] == '3600'
+    api.has_resource_properties('AWS::Lambda::Function', {
+        'FunctionName': function_name,
+        'Layers': assertions.Match.array_with([CRYPTOGRAPHY_LAYER_ARN])
+    })
+
+def test_image_apis_may_read_the_signing_key(enabled):
+    _, api = enabled
+    api.has_resource_properties('AWS::IAM::Policy', {
+        'PolicyDocument': {
+            'Statement': assertions.Match.array_with([assertions.Match.object_like({
+                'Action': 'secretsmanager:GetSecretValue',
+                'Effect': 'Allow'
+            })])
+        }
+    })
+
+def test_disabled_by_default_keeps_presigned_s3_urls():
+    _, api_stack = synth()
+    api = assertions.Template.from_stack(api_stack)
+    assert 'RESULT_CDN_DOMAIN_NAME' not in function_environment(api, 'AmazonBedrockGalleryGetImage')
+
+def test_public_key_is_required():
+    with pytest.raises(ValueError, match='result_cdn_public_key_pem'):
+        synth(result_cdn_enabled=True, result_cdn_public_key_pem='', cryptography_layer_arn=CRYPTOGRAPHY_LAYER_ARN)
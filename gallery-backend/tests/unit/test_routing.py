@@ -0,0 +1,54 @@
+import pytest
+from moto import mock_aws
+
+from gallery_runtime import clients, routing
+from tools import local_aws
+
+TARGETS = [
+    {'endpoint': 'facechain-a', 'variant': None, 'max_in_flight': 2},
+    {'endpoint': 'facechain-b', 'variant': 'AllTraffic', 'max_in_flight': 1}
+]
+
+@pytest.fixture
+def endpoint_load(monkeypatch):
+    context = local_aws.load_context()
+    for name, value in local_aws.handler_environment(context).items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(routing, 'FACECHAIN_TARGETS', TARGETS)
+    monkeypatch.setattr(routing, 'DDB_AMAZON_BEDROCK_GALLERY_ENDPOINT_LOAD_TABLE_NAME',
+                        context['ddb_amazon_bedrock_gallery_endpoint_load_table_name'])
+    with mock_aws():
+        clients.reset_clients()
+        local_aws.create_resources(context)
+        yield
+    clients.reset_clients()
+
+def leases():
+    return {load['target']['endpoint']: load['active'] for load in routing.read_leases('nobody', 0)}
+
+def test_leases_fill_every_target_up_to_its_limit(endpoint_load):
+    acquired = [routing.acquire_target(f'job-{n}') for n in range(3)]
+    assert sorted(target['endpoint'] for target in acquired) == ['facechain-a', 'facechain-a', 'facechain-b']
+    assert routing.acquire_target('job-3') is None
+
+def test_a_released_slot_can_be_taken_again(endpoint_load):
+    acquired = [routing.acquire_target(f'job-{n}') for n in range(3)]
+    with routing.endpoint_slot('job-3') as target:
+        assert target is None
+    routing.release_target(acquired[0], 'job-0')
+    with routing.endpoint_slot('job-3') as target:
+        assert target == acquired[0]
+    # endpoint_slot gives the slot back when the block ends
+    assert sum(leases().values()) == 2
+
+def test_a_redelivered_job_keeps_its_slot(endpoint_load):
+    target = routing.acquire_target('job-0')
+    assert routing.acquire_target('job-0') == target
+    assert sum(leases().values()) == 1
+
+def test_expired_leases_are_reclaimed(endpoint_load, monkeypatch):
+    monkeypatch.setattr(routing, 'FACECHAIN_LEASE_SECONDS', -1)
+    for n in range(3):
+        assert routing.acquire_target(f'stale-{n}') is not None
+    monkeypatch.setattr(routing, 'FACECHAIN_LEASE_SECONDS', 90)
+    assert routing.acquire_target('job-0') is not None
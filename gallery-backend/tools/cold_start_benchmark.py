@@ -0,0 +1,235 @@
+"""Measure import/INIT time, first-invocation and warm latency of the gallery Lambda handlers.
+
+Each sample runs the handler in a fresh interpreter that has nothing preloaded, so
+boto3/PIL imports and client creation are charged to INIT or to the first
+invocation exactly as on a Lambda cold start. S3 and DynamoDB are served by a moto
+server in this process (reached through AWS_ENDPOINT_URL), and Rekognition and
+SageMaker are stubbed. Use --baseline-ref to measure the handlers of another git
+revision side by side, e.g. before and after a change:
+
+    python -m tools.cold_start_benchmark --baseline-ref HEAD~1
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from io import BytesIO
+from typing import Any, Dict, List, Optional
+
+from tools import local_aws
+
+def prepare_invocation(name: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    """Seed the resources a handler reads and return the event it is invoked with."""
+    import boto3
+
+    s3_client = boto3.client('s3', region_name=local_aws.LOCAL_REGION)
+    ddb_client = boto3.client('dynamodb', region_name=local_aws.LOCAL_REGION)
+    bucket_name = context['s3_base_bucket_name']
+    base_image_object_key = local_aws.seed_base_resource('ancient_rome', 'male', 'light', context)
+    object_name = '2025010100-kiosk01-ancient_rome-male-light-bench0001'
+    ddb_client.put_item(
+        TableName=context['ddb_amazon_bedrock_gallery_process_table_name'],
+        Item={
+            'PK': {'S': f'#UUID#{object_name}'},
+            'userId': {'S': 'kiosk01'},
+            'theme': {'S': 'ancient_rome'},
+            'gender': {'S': 'male'},
+            'skin': {'S': 'light'},
+            'base_image_object_key': {'S': base_image_object_key},
+            'base_story': {'S': 'A portrait from the ancient_rome era.'},
+            'status': {'S': 'PENDING'},
+            'updated_at': {'S': '2025-01-01T00:00:00'},
+            'created_at': {'S': '2025-01-01T00:00:00'}
+        }
+    )
+    result_object_key = f"{context['s3_result_images_path']}{object_name}.jpeg"
+    ddb_client.put_item(
+        TableName=context['ddb_amazon_bedrock_gallery_display_table_name'],
+        Item={
+            'PK': {'S': '#USERID#kiosk01'},
+            'uuid': {'S': object_name},
+            'userId': {'S': 'kiosk01'},
+            'result_object_key': {'S': result_object_key},
+            'base_story': {'S': 'A portrait from the ancient_rome era.'},
+            'theme': {'S': 'ancient_rome'},
+            'gender': {'S': 'male'},
+            'skin': {'S': 'light'}
+        }
+    )
+
+    if name == 'get-image':
+        return {'httpMethod': 'GET', 'pathParameters': {'userId': 'kiosk01'}}
+    if name == 'batch-get-image':
+        return {'httpMethod': 'POST', 'body': json.dumps({'userIds': ['kiosk01', 'kiosk02']})}
+    if name == 'get-gallery':
+        return {'httpMethod': 'GET', 'queryStringParameters': {'limit': '20'}}
+    if name == 'put-image':
+        return {'httpMethod': 'POST', 'body': json.dumps({'userId': 'kiosk01', 'theme': 'ancient_rome', 'gender': 'male', 'skin': 'light'})}
+    if name == 'get-upload-status':
+        return {'httpMethod': 'GET', 'pathParameters': {'jobId': object_name}}
+    if name == 'get-job-status':
+        return {'httpMethod': 'GET', 'pathParameters': {'userId': 'kiosk01'}}
+    if name == 'user-agreement':
+        return {'httpMethod': 'POST', 'body': json.dumps({'id': f'{object_name}.jpeg', 'name': 'Kim', 'agree': 'Y', 'userId': 'kiosk01', 'savedAt': '2025-01-01T00:00:00Z'})}
+    if name == 'user-agreement-writer':
+        item = {'PK': 'USERID#kiosk01#NAME#Kim', 'savedAt': '2025-01-01T00:00:00Z', 'name': 'Kim', 'agree': 'Y', 'userId': 'kiosk01', 'imageId': f'{object_name}.jpeg'}
+        message = {'idempotencyKey': f"{item['PK']}#{item['savedAt']}", 'item': item}
+        return {'Records': [{'messageId': 'bench0001', 'eventSource': 'aws:sqs', 'body': json.dumps(message)}]}
+    if name == 'face-crop':
+        object_key = f"{context['s3_face_images_path']}{object_name}.jpeg"
+        image = local_aws.sample_image(1280, 960)
+        s3_client.put_object(Bucket=bucket_name, Key=object_key, Body=image, ContentType='image/jpeg')
+        return local_aws.s3_put_event(bucket_name, object_key, len(image))
+    if name == 'face-swap':
+        object_key = f"{context['s3_face_cropped_images_path']}{object_name}.jpeg"
+        image = local_aws.sample_image(512, 512)
+        s3_client.put_object(Bucket=bucket_name, Key=object_key, Body=image, ContentType='image/jpeg')
+        return local_aws.s3_put_event(bucket_name, object_key, len(image))
+    if name == 'face-swap-completion':
+        image = local_aws.sample_image(1024, 1024, image_format='PNG')
+        s3_client.put_object(Bucket=bucket_name, Key=result_object_key, Body=image, ContentType='image/png')
+        return local_aws.s3_put_event(bucket_name, result_object_key, len(image))
+    raise ValueError(f'Unknown handler: {name}')
+
+def run_worker(name: str, lambda_root: str, event: Dict[str, Any], iterations: int) -> Dict[str, Any]:
+    """Cold-start a handler in this (fresh) interpreter and time INIT, the first and warm invocations."""
+    local_aws.install_environment()
+    started = time.perf_counter()
+    module = local_aws.load_handler(name, lambda_root)
+    init_ms = (time.perf_counter() - started) * 1000
+
+    local_aws.install_clients({
+        'rekognition': local_aws.StubRekognitionClient(),
+        'sagemaker-runtime': local_aws.StubSageMakerRuntimeClient()
+    }, [module])
+    handler = getattr(module, 'lambda_handler', None) or getattr(module, 'handler')
+
+    latencies = []
+    for _ in range(iterations + 1):
+        started = time.perf_counter()
+        handler(json.loads(json.dumps(event)), None)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    return {'init_ms': init_ms, 'first_invoke_ms': latencies[0], 'warm_ms': latencies[1:]}
+
+def spawn_worker(name: str, lambda_root: str, event: Dict[str, Any], iterations: int, endpoint_url: str) -> Optional[Dict[str, Any]]:
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as event_file:
+        json.dump(event, event_file)
+    command = [sys.executable, '-m', 'tools.cold_start_benchmark', '--worker', '--handler', name,
+               '--lambda-root', lambda_root, '--event-file', event_file.name, '--iterations', str(iterations)]
+    try:
+        completed = subprocess.run(command, cwd=local_aws.BACKEND_ROOT, capture_output=True, text=True,
+                                   env=dict(os.environ, AWS_ENDPOINT_URL=endpoint_url))
+    finally:
+        os.remove(event_file.name)
+    if completed.returncode != 0:
+        print(f'[{name}] worker failed:\n{completed.stderr.strip()}', file=sys.stderr)
+        return None
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def measure(name: str, lambda_root: str, event: Dict[str, Any], cold_runs: int, iterations: int, endpoint_url: str) -> Optional[Dict[str, float]]:
+    if not os.path.exists(os.path.join(lambda_root, local_aws.HANDLERS[name], 'index.py')):
+        return None
+
+    # Warm iterations are only needed once; the remaining runs sample cold starts
+    results = [spawn_worker(name, lambda_root, event, iterations if run == 0 else 0, endpoint_url) for run in range(cold_runs)]
+    if None in results:
+        return None
+
+    warm = sorted(results[0]['warm_ms'])
+    return {
+        'init_ms': statistics.median(result['init_ms'] for result in results),
+        'first_invoke_ms': statistics.median(result['first_invoke_ms'] for result in results),
+        'cold_total_ms': statistics.median(result['init_ms'] + result['first_invoke_ms'] for result in results),
+        'warm_p50_ms': percentile(warm, 50),
+        'warm_p95_ms': percentile(warm, 95)
+    }
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return float('nan')
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def export_lambda_tree(ref: str, destination: str) -> str:
+    """Extract gallery-backend/lambda as of ref into destination and return its path."""
+    prefix = subprocess.run(['git', 'rev-parse', '--show-prefix'], cwd=local_aws.BACKEND_ROOT,
+                            capture_output=True, text=True, check=True).stdout.strip()
+    top_level = subprocess.run(['git', 'rev-parse', '--show-toplevel'], cwd=local_aws.BACKEND_ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    archive = subprocess.run(['git', 'archive', '--format=tar', f'{ref}:{prefix}lambda'], cwd=top_level,
+                             capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=BytesIO(archive)) as tar:
+        tar.extractall(destination)
+    return destination
+
+def format_row(name: str, current: Optional[Dict[str, float]], baseline: Optional[Dict[str, float]], compare: bool) -> str:
+    columns = ['init_ms', 'first_invoke_ms', 'cold_total_ms', 'warm_p50_ms', 'warm_p95_ms']
+    cells = [f'{name:<22}']
+    for column in columns:
+        value = f'{current[column]:8.1f}' if current else '     n/a'
+        if compare:
+            value = (f'{baseline[column]:8.1f} -> ' if baseline else '     n/a -> ') + value
+        cells.append(value)
+    return ' | '.join(cells)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--handlers', nargs='*', default=[name for name in local_aws.HANDLERS if name not in ('user-agreement', 's3-notifications-config')],
+                        choices=[name for name in local_aws.HANDLERS if name != 's3-notifications-config'], help='handlers to measure')
+    parser.add_argument('--cold-runs', type=int, default=5, help='fresh interpreters (cold starts) per handler')
+    parser.add_argument('--iterations', type=int, default=20, help='warm invocations per handler')
+    parser.add_argument('--baseline-ref', help='git revision whose handlers are measured for comparison')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--handler', help=argparse.SUPPRESS)
+    parser.add_argument('--lambda-root', default=local_aws.LAMBDA_ROOT, help=argparse.SUPPRESS)
+    parser.add_argument('--event-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        with open(args.event_file) as event_file:
+            event = json.load(event_file)
+        print(json.dumps(run_worker(args.handler, args.lambda_root, event, args.iterations)))
+        return
+
+    from moto.server import ThreadedMotoServer
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = ThreadedMotoServer(port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    endpoint_url = f'http://{host}:{port}'
+    local_aws.install_environment()
+    os.environ['AWS_ENDPOINT_URL'] = endpoint_url
+
+    baseline_root = None
+    if args.baseline_ref:
+        baseline_root = export_lambda_tree(args.baseline_ref, tempfile.mkdtemp(prefix='gallery-lambda-'))
+
+    try:
+        context = local_aws.load_context()
+        local_aws.create_resources(context)
+
+        header = ['handler'.ljust(22), 'init ms', 'first invoke ms', 'cold total ms', 'warm p50 ms', 'warm p95 ms']
+        if baseline_root:
+            print(f'baseline {args.baseline_ref} -> working tree')
+        print(' | '.join(header))
+        for name in args.handlers:
+            event = prepare_invocation(name, context)
+            current = measure(name, local_aws.LAMBDA_ROOT, event, args.cold_runs, args.iterations, endpoint_url)
+            baseline = measure(name, baseline_root, event, args.cold_runs, args.iterations, endpoint_url) if baseline_root else None
+            print(format_row(name, current, baseline, compare=bool(baseline_root)), flush=True)
+    finally:
+        server.stop()
+        if baseline_root:
+            shutil.rmtree(baseline_root, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
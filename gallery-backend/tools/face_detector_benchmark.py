@@ -0,0 +1,135 @@
+"""Compare the local OpenCV face detector with Rekognition on a set of sample photos.
+
+Both backends are the ones face-crop uses (lambda/image-processing/face-crop/detectors.py),
+fed the same upload bytes. Rekognition is called for real, so AWS credentials are needed,
+and the local detector needs opencv-python-headless and the YuNet model from the face
+detector layer (see lambda/layers/face-detector/build_and_publish.sh):
+
+    python -m tools.face_detector_benchmark samples/ --model face_detection_yunet_2023mar.onnx
+
+The report shows each detector's latency, how often the two agree on the face, and
+what the 'local-fallback' policy would do at --min-confidence.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+
+from tools import local_aws
+from tools.latency_report import percentile
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+def load_detectors() -> Any:
+    local_aws.load_handler('face-crop')
+    # index.py imports its sibling module, which stays loaded under its own name
+    return sys.modules['detectors']
+
+def sample_paths(paths: List[str]) -> List[str]:
+    samples = []
+    for path in paths:
+        if os.path.isdir(path):
+            samples.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            samples.append(path)
+    return samples
+
+def largest_box(face_details: List[Dict[str, Any]]) -> Optional[Tuple[float, float, float, float]]:
+    boxes = [face['BoundingBox'] for face in face_details]
+    if not boxes:
+        return None
+    box = max(boxes, key=lambda box: box['Width'] * box['Height'])
+    return box['Left'], box['Top'], box['Left'] + box['Width'], box['Top'] + box['Height']
+
+def iou(first: Optional[Tuple[float, ...]], second: Optional[Tuple[float, ...]]) -> float:
+    if first is None or second is None:
+        return 0.0
+    width = max(0.0, min(first[2], second[2]) - max(first[0], second[0]))
+    height = max(0.0, min(first[3], second[3]) - max(first[1], second[1]))
+    intersection = width * height
+    union = (first[2] - first[0]) * (first[3] - first[1]) + (second[2] - second[0]) * (second[3] - second[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+def timed_detect(detector: Any, image_content: bytes) -> Tuple[List[Dict[str, Any]], float]:
+    from PIL import Image
+
+    # A fresh, undecoded upload each time, as face-crop has it
+    upload = sys.modules['detectors'].UploadImage(Image.open(BytesIO(image_content)), image_content)
+    started = time.perf_counter()
+    face_details, _ = detector.detect(upload)
+    return face_details, (time.perf_counter() - started) * 1000
+
+def summarize(name: str, values: List[float]) -> str:
+    return f'{name:<20} p50 {percentile(values, 50):7.1f}ms  p95 {percentile(values, 95):7.1f}ms  mean {statistics.mean(values):7.1f}ms'
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help='sample images or directories of them')
+    parser.add_argument('--model', default='/opt/face-detector/face_detection_yunet_2023mar.onnx', help='YuNet ONNX model')
+    parser.add_argument('--min-confidence', type=float, default=90, help="confidence (percent) the 'local-fallback' policy trusts")
+    parser.add_argument('--region', default=os.environ.get('AWS_REGION', local_aws.LOCAL_REGION), help='Rekognition region')
+    parser.add_argument('--verbose', action='store_true', help='print a line per image')
+    args = parser.parse_args()
+
+    os.environ.setdefault('AWS_DEFAULT_REGION', args.region)
+    detectors = load_detectors()
+    local_detector = detectors.OpenCvFaceDetector(args.model)
+    rekognition_detector = detectors.RekognitionFaceDetector()
+
+    samples = sample_paths(args.paths)
+    if not samples:
+        parser.error('no sample images found')
+
+    # One warm-up call each, so model loading and client creation are not measured
+    with open(samples[0], 'rb') as file:
+        warm_up = file.read()
+    timed_detect(local_detector, warm_up)
+    timed_detect(rekognition_detector, warm_up)
+
+    local_ms, rekognition_ms, policy_ms, ious, policy_ious = [], [], [], [], []
+    found_agreement = count_agreement = served_locally = 0
+    for path in samples:
+        with open(path, 'rb') as file:
+            image_content = file.read()
+        local_faces, local_latency = timed_detect(local_detector, image_content)
+        rekognition_faces, rekognition_latency = timed_detect(rekognition_detector, image_content)
+        local_ms.append(local_latency)
+        rekognition_ms.append(rekognition_latency)
+
+        found_agreement += bool(local_faces) == bool(rekognition_faces)
+        count_agreement += len(local_faces) == len(rekognition_faces)
+        overlap = iou(largest_box(local_faces), largest_box(rekognition_faces))
+        if local_faces and rekognition_faces:
+            ious.append(overlap)
+
+        # What FallbackFaceDetector would answer, and how long it would take
+        confident = bool(local_faces) and max(face['Confidence'] for face in local_faces) >= args.min_confidence
+        served_locally += confident
+        policy_ms.append(local_latency if confident else local_latency + rekognition_latency)
+        if confident and rekognition_faces:
+            policy_ious.append(overlap)
+
+        if args.verbose:
+            print(f'{os.path.basename(path):<40} local {len(local_faces)} face(s) {local_latency:7.1f}ms  '
+                  f'rekognition {len(rekognition_faces)} face(s) {rekognition_latency:7.1f}ms  IoU {overlap:.2f}'
+                  f"{'  served locally' if confident else ''}")
+
+    total = len(samples)
+    print(f'{total} images')
+    print(summarize('opencv-yunet', local_ms))
+    print(summarize('rekognition', rekognition_ms))
+    print(summarize('local-fallback', policy_ms))
+    print(f'face found agreement {found_agreement / total * 100:.1f}%, face count agreement {count_agreement / total * 100:.1f}%')
+    if ious:
+        print(f'largest face IoU: mean {statistics.mean(ious):.2f}, >= 0.5 on {sum(value >= 0.5 for value in ious) / len(ious) * 100:.1f}% of images with a face in both')
+    print(f'local-fallback at {args.min_confidence:g}%: {served_locally / total * 100:.1f}% served locally', end='')
+    if policy_ious:
+        print(f', IoU >= 0.5 with Rekognition on {sum(value >= 0.5 for value in policy_ious) / len(policy_ious) * 100:.1f}% of those')
+    else:
+        print()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Reconstruct per-request pipeline timelines from stage records and report end-to-end latency.
+
+Every pipeline stage prints a 'pipeline_stage' record (CloudWatch Embedded Metric
+Format) keyed by the image object name as correlationId. This tool reads those
+records from log files, either raw log lines or the JSON written by
+`aws logs filter-log-events`, or fetches them straight from CloudWatch Logs, and
+joins them per request:
+
+    python -m tools.latency_report logs/*.log
+    python -m tools.latency_report --fetch --since-minutes 120 --timelines 10
+"""
+import argparse
+import json
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+STAGE_RECORD = 'pipeline_stage'
+STAGE_ORDER = ['upload_issued', 'facechain_template_prefetch', 'face_crop', 'face_swap', 'facechain_inference', 'face_swap_completion']
+FIRST_STAGE = STAGE_ORDER[0]
+LAST_STAGE = STAGE_ORDER[-1]
+DEFAULT_LOG_GROUPS = [
+    '/aws/lambda/AmazonBedrockGalleryUploadImage',
+    '/aws/lambda/AmazonBedrockGalleryFaceCropLambda',
+    '/aws/lambda/AmazonBedrockGalleryFaceSwapLambda',
+    '/aws/lambda/AmazonBedrockGalleryFaceSwapCompletionLambda',
+    '/aws/sagemaker/Endpoints/facechain-sagemaker-endpoint'
+]
+
+def parse_records(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Yield stage records from log lines that may carry a timestamp/request-id prefix."""
+    decoder = json.JSONDecoder()
+    for line in lines:
+        start = line.find('{')
+        if start < 0:
+            continue
+        try:
+            record, _ = decoder.raw_decode(line[start:])
+        except ValueError:
+            continue
+        if isinstance(record, dict) and record.get('record') == STAGE_RECORD and record.get('correlationId'):
+            yield record
+
+def read_files(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    for path in paths:
+        with (sys.stdin if path == '-' else open(path)) as file:
+            content = file.read()
+        try:
+            exported = json.loads(content)
+        except ValueError:
+            exported = None
+        if isinstance(exported, dict) and 'events' in exported:
+            yield from parse_records(event['message'] for event in exported['events'])
+        else:
+            yield from parse_records(content.splitlines())
+
+def fetch_records(log_groups: List[str], since_minutes: int) -> Iterator[Dict[str, Any]]:
+    import boto3
+
+    logs_client = boto3.client('logs')
+    paginator = logs_client.get_paginator('filter_log_events')
+    start_time = int((time.time() - since_minutes * 60) * 1000)
+    for log_group in log_groups:
+        try:
+            for page in paginator.paginate(logGroupName=log_group, startTime=start_time, filterPattern=f'"{STAGE_RECORD}"'):
+                yield from parse_records(event['message'] for event in page['events'])
+        except logs_client.exceptions.ResourceNotFoundException:
+            print(f'log group not found: {log_group}', file=sys.stderr)
+
+def build_timelines(records: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """correlationId -> stage -> record. Retried stages keep their latest record."""
+    timelines: Dict[str, Dict[str, Dict[str, Any]]] = defaultdict(dict)
+    for record in records:
+        stages = timelines[record['correlationId']]
+        previous = stages.get(record['Stage'])
+        if previous is None or record['finishedAt'] >= previous['finishedAt']:
+            stages[record['Stage']] = record
+    return timelines
+
+def end_to_end_ms(stages: Dict[str, Dict[str, Any]]) -> Optional[float]:
+    if FIRST_STAGE not in stages or LAST_STAGE not in stages:
+        return None
+    return (stages[LAST_STAGE]['finishedAt'] - stages[FIRST_STAGE]['startedAt']) * 1000
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def format_timeline(correlation_id: str, stages: Dict[str, Dict[str, Any]]) -> str:
+    origin = min(record.get('triggeredAt', record['startedAt']) for record in stages.values())
+    lines = [correlation_id]
+    for stage in sorted(stages, key=lambda name: (stages[name]['startedAt'], STAGE_ORDER.index(name) if name in STAGE_ORDER else len(STAGE_ORDER))):
+        record = stages[stage]
+        trigger = f" (+{record['TriggerDelay']:.0f}ms trigger delay)" if 'TriggerDelay' in record else ''
+        lines.append(f"  {stage:<22} start +{(record['startedAt'] - origin) * 1000:9.0f}ms  "
+                     f"duration {record['StageDuration']:8.0f}ms{trigger}")
+    total = end_to_end_ms(stages)
+    lines.append(f"  {'end-to-end':<22} {f'{total:.0f}ms' if total is not None else 'incomplete'}")
+    return '\n'.join(lines)
+
+def print_summary(timelines: Dict[str, Dict[str, Dict[str, Any]]], slowest: int = 5) -> None:
+    totals = {correlation_id: end_to_end_ms(stages) for correlation_id, stages in timelines.items()}
+    complete = {correlation_id: total for correlation_id, total in totals.items() if total is not None}
+
+    print(f'requests: {len(timelines)} ({len(complete)} complete, {len(timelines) - len(complete)} incomplete)')
+    if complete:
+        values = list(complete.values())
+        print(f'end-to-end: p50 {percentile(values, 50):.0f}ms  p95 {percentile(values, 95):.0f}ms  max {max(values):.0f}ms')
+
+    print('\nper stage (duration / trigger delay):')
+    for stage in STAGE_ORDER:
+        durations = [stages[stage]['StageDuration'] for stages in timelines.values() if stage in stages]
+        delays = [stages[stage]['TriggerDelay'] for stages in timelines.values() if 'TriggerDelay' in stages.get(stage, {})]
+        if not durations:
+            continue
+        line = f'  {stage:<22} n={len(durations):<5} p50 {percentile(durations, 50):8.0f}ms  p95 {percentile(durations, 95):8.0f}ms'
+        if delays:
+            line += f'  |  p50 {percentile(delays, 50):6.0f}ms  p95 {percentile(delays, 95):6.0f}ms'
+        print(line)
+
+    if slowest > 0:
+        print(f'\nslowest {min(slowest, len(complete))} complete requests:')
+        for correlation_id in sorted(complete, key=complete.get, reverse=True)[:slowest]:
+            print(format_timeline(correlation_id, timelines[correlation_id]))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help="log files to read ('-' for stdin)")
+    parser.add_argument('--fetch', action='store_true', help='read the records from CloudWatch Logs instead of files')
+    parser.add_argument('--log-groups', nargs='*', default=DEFAULT_LOG_GROUPS, help='log groups to fetch from')
+    parser.add_argument('--since-minutes', type=int, default=60, help='how far back to fetch')
+    parser.add_argument('--timelines', type=int, default=5, help='number of slowest request timelines to print')
+    args = parser.parse_args()
+
+    if not args.fetch and not args.files:
+        parser.error('pass log files or --fetch')
+
+    records = fetch_records(args.log_groups, args.since_minutes) if args.fetch else read_files(args.files)
+    timelines = build_timelines(records)
+    if not timelines:
+        print('no pipeline_stage records found')
+        return
+
+    print_summary(timelines, args.timelines)
+
+if __name__ == '__main__':
+    main()
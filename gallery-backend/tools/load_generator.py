@@ -0,0 +1,318 @@
+"""Replay event-day kiosk and display traffic against the upload, image and agreement APIs.
+
+Requests are sent open-loop on a fixed schedule, ramping through --rates (requests
+per second, --step-seconds each). Each request is drawn from a mix of upload
+requests from kiosks (sent in bursts of --upload-burst, like a group photo
+session), display polls of GET /apis/images/{userId} and agreement submissions.
+Latency is measured from the scheduled send time, so it includes any time a
+request waited for a free worker.
+
+By default the handlers run in this process against moto behind a local HTTP stand-in
+for API Gateway. --direct invokes them without HTTP, and --base-url targets a
+deployed stage instead. In the local modes the DynamoDB and S3 calls made by
+each request type are counted as well, and --handler-logs keeps the handlers'
+output (e.g. for tools.latency_report):
+
+    python -m tools.load_generator --rates 10 25 50 --step-seconds 15
+    python -m tools.load_generator --base-url https://abc123.execute-api.us-west-2.amazonaws.com/prod --rates 5 10
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+
+from tools import local_aws
+from tools.latency_report import percentile
+
+REQUEST_TYPES = ['upload', 'display', 'agree']
+# API Gateway resources and the handlers behind them, as in ApiGatewayApisStack/UserAgreementStack
+ROUTES = {
+    ('POST', 'apis/images/upload'): 'put-image',
+    ('GET', 'apis/images/{userId}'): 'get-image',
+    ('POST', 'agree'): 'user-agreement'
+}
+THEMES = ['ancient_rome', 'joseon', 'renaissance']
+
+class CallCounter:
+    """Counts AWS API calls per request type through a botocore before-call hook."""
+
+    def __init__(self):
+        self.current = threading.local()
+        self.lock = threading.Lock()
+        self.counts: Dict[str, Counter] = defaultdict(Counter)
+
+    def install(self, session: Any) -> None:
+        # Clients copy the session's event hooks when they are created, so this must run before the handlers load
+        session.events.register('before-call', self.on_call)
+
+    def on_call(self, event_name: str, **kwargs: Any) -> None:
+        request_type = getattr(self.current, 'request_type', None)
+        if request_type is None:
+            return
+        _, service_name, operation_name = event_name.split('.', 2)
+        with self.lock:
+            self.counts[request_type][f'{service_name}:{operation_name}'] += 1
+
+class LocalApi:
+    """Turns requests into API Gateway proxy events for the handlers loaded in this process."""
+
+    def __init__(self, call_counter: CallCounter):
+        self.call_counter = call_counter
+        self.handlers = {}
+        for name in set(ROUTES.values()):
+            module = local_aws.load_handler(name)
+            self.handlers[name] = getattr(module, 'lambda_handler', None) or getattr(module, 'handler')
+
+    def resolve(self, method: str, path: str) -> Tuple[Optional[str], Dict[str, str]]:
+        segments = path.strip('/').split('/')
+        for (route_method, route_path), name in ROUTES.items():
+            route_segments = route_path.split('/')
+            if route_method != method or len(route_segments) != len(segments):
+                continue
+            path_parameters = {}
+            for route_segment, segment in zip(route_segments, segments):
+                if route_segment.startswith('{'):
+                    path_parameters[route_segment[1:-1]] = segment
+                elif route_segment != segment:
+                    break
+            else:
+                return name, path_parameters
+        return None, {}
+
+    def invoke(self, request_type: str, method: str, path: str, body: Optional[str]) -> Tuple[int, str]:
+        name, path_parameters = self.resolve(method, path)
+        if name is None:
+            return 404, json.dumps({'message': 'Missing Authentication Token'})
+
+        self.call_counter.current.request_type = request_type
+        try:
+            response = self.handlers[name]({
+                'httpMethod': method,
+                'path': path,
+                'pathParameters': path_parameters or None,
+                'queryStringParameters': None,
+                'headers': {'Content-Type': 'application/json'},
+                'body': body
+            }, None)
+        except Exception as e:
+            # API Gateway answers an unhandled Lambda error with 502
+            return 502, json.dumps({'message': f'Internal server error: {e}'})
+        finally:
+            self.call_counter.current.request_type = None
+        return response['statusCode'], response.get('body') or ''
+
+def serve_local_api(api: LocalApi) -> ThreadingHTTPServer:
+    """Start a local HTTP stand-in for the API Gateway stage on an ephemeral port."""
+    class Handler(BaseHTTPRequestHandler):
+        def handle_request(self) -> None:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length).decode('utf-8') if length else None
+            status, response_body = api.invoke(self.headers.get('X-Request-Type', 'unknown'), self.command, self.path.split('?')[0], body)
+            payload = response_body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = handle_request
+        do_POST = handle_request
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def send_http(base_url: str, headers: Dict[str, str], request_type: str, method: str, path: str, body: Optional[str]) -> Tuple[int, str]:
+    request = urllib.request.Request(
+        f"{base_url.rstrip('/')}/{path.lstrip('/')}",
+        data=body.encode('utf-8') if body is not None else None,
+        method=method,
+        headers=dict(headers, **{'Content-Type': 'application/json', 'X-Request-Type': request_type})
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, response.read().decode('utf-8')
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode('utf-8', 'replace')
+
+def build_request(request_type: str, index: int, kiosks: int, displays: int) -> Tuple[str, str, Optional[str]]:
+    if request_type == 'upload':
+        return 'POST', '/apis/images/upload', json.dumps({
+            'userId': f'kiosk{index % kiosks:02d}',
+            'theme': THEMES[index % len(THEMES)],
+            'gender': random.choice(['male', 'female']),
+            'skin': 'light'
+        })
+    if request_type == 'display':
+        return 'GET', f'/apis/images/display{random.randrange(displays):02d}', None
+    return 'POST', '/agree', json.dumps({
+        'id': f'load-{index:06d}.jpeg',
+        'name': f'Visitor {index}',
+        'agree': 'Y',
+        'userId': f'kiosk{index % kiosks:02d}',
+        'savedAt': datetime.now(timezone.utc).isoformat()
+    })
+
+def schedule(rate: float, duration: float, weights: Dict[str, float], upload_burst: int) -> List[Tuple[float, str]]:
+    """Send offsets and request types for one step; a drawn upload expands into a burst."""
+    types = list(weights)
+    # Draw less often than rate so the bursts still add up to rate requests per second
+    requests_per_draw = sum(weights[name] * (upload_burst if name == 'upload' else 1) for name in types) / sum(weights.values())
+    offsets: List[Tuple[float, str]] = []
+    offset = 0.0
+    while True:
+        offset += random.expovariate(rate / requests_per_draw)
+        if offset >= duration:
+            return offsets
+        request_type = random.choices(types, weights=[weights[name] for name in types])[0]
+        offsets.extend([(offset, request_type)] * (upload_burst if request_type == 'upload' else 1))
+
+def seed(context: Dict[str, Any], displays: int) -> None:
+    """Base resources for put-image, and a result on every polled display."""
+    import boto3
+
+    ddb_client = boto3.client('dynamodb', region_name=local_aws.LOCAL_REGION)
+    for theme in THEMES:
+        for gender in ['male', 'female']:
+            local_aws.seed_base_resource(theme, gender, 'light', context)
+    for display in range(displays):
+        ddb_client.put_item(
+            TableName=context['ddb_amazon_bedrock_gallery_display_table_name'],
+            Item={
+                'PK': {'S': f'#USERID#display{display:02d}'},
+                'uuid': {'S': f'2025010100-display{display:02d}-ancient_rome-male-light-seed0000'},
+                'result_object_key': {'S': f"{context['s3_result_images_path']}seed-{display:02d}.jpeg"},
+                'base_story': {'S': 'A portrait from the ancient_rome era.'},
+                'theme': {'S': 'ancient_rome'},
+                'gender': {'S': 'male'},
+                'skin': {'S': 'light'}
+            }
+        )
+
+def run_step(send: Any, rate: float, args: argparse.Namespace, weights: Dict[str, float], counter: int) -> Tuple[Dict[str, List[float]], Dict[str, Counter], int]:
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Counter] = defaultdict(Counter)
+    lock = threading.Lock()
+
+    def fire(scheduled_at: float, request_type: str, index: int) -> None:
+        method, path, body = build_request(request_type, index, args.kiosks, args.displays)
+        try:
+            status, _ = send(request_type, method, path, body)
+        except Exception:
+            status = 0
+        elapsed_ms = (time.perf_counter() - scheduled_at) * 1000
+        with lock:
+            latencies[request_type].append(elapsed_ms)
+            statuses[request_type][status] += 1
+
+    plan = schedule(rate, args.step_seconds, weights, args.upload_burst)
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        started_at = time.perf_counter()
+        for offset, request_type in plan:
+            scheduled_at = started_at + offset
+            time.sleep(max(0.0, scheduled_at - time.perf_counter()))
+            executor.submit(fire, scheduled_at, request_type, counter)
+            counter += 1
+    return latencies, statuses, counter
+
+def print_step(rate: float, duration: float, latencies: Dict[str, List[float]], statuses: Dict[str, Counter],
+               calls: Optional[Dict[str, Counter]], out: TextIO) -> None:
+    sent = sum(len(values) for values in latencies.values())
+    print(f'\n== target {rate:g} req/s: {sent} requests, {sent / duration:.1f} req/s offered', file=out)
+    for request_type in REQUEST_TYPES:
+        values = latencies.get(request_type)
+        if not values:
+            continue
+        errors = sum(count for status, count in statuses[request_type].items() if status == 0 or status >= 400)
+        line = (f'  {request_type:<8} n={len(values):<6} p50 {percentile(values, 50):7.1f}ms  p95 {percentile(values, 95):7.1f}ms  '
+                f'p99 {percentile(values, 99):7.1f}ms  errors {errors / len(values) * 100:5.1f}%')
+        if errors:
+            line += '  ' + ' '.join(f'{status or "conn"}x{count}' for status, count in sorted(statuses[request_type].items()) if status == 0 or status >= 400)
+        print(line, file=out)
+        if calls is not None:
+            per_request = ', '.join(f'{operation} {count / len(values):.2f}' for operation, count in sorted(calls.get(request_type, {}).items()))
+            print(f'           AWS calls per request: {per_request or "none"}', file=out)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rates', type=float, nargs='+', default=[5, 10, 20], help='request rates to ramp through, requests per second')
+    parser.add_argument('--step-seconds', type=float, default=10, help='duration of each rate step')
+    parser.add_argument('--mix', default='upload=1,display=8,agree=1', help='relative weights of the request types')
+    parser.add_argument('--upload-burst', type=int, default=3, help='uploads sent together when an upload is drawn')
+    parser.add_argument('--kiosks', type=int, default=10, help='kiosk user ids that upload and agree')
+    parser.add_argument('--displays', type=int, default=20, help='display user ids that are polled')
+    parser.add_argument('--workers', type=int, default=64, help='concurrent requests in flight')
+    parser.add_argument('--direct', action='store_true', help='invoke the local handlers without the HTTP stand-in')
+    parser.add_argument('--base-url', help='API Gateway stage URL to load instead of the local handlers')
+    parser.add_argument('--header', action='append', default=[], help='extra request header for --base-url, NAME:VALUE')
+    parser.add_argument('--handler-logs', help='file for the local handlers\' log output (discarded by default)')
+    args = parser.parse_args()
+
+    weights = {name: float(weight) for name, weight in (item.split('=') for item in args.mix.split(','))}
+    unknown = set(weights) - set(REQUEST_TYPES)
+    if unknown:
+        parser.error(f"unknown request types in --mix: {', '.join(sorted(unknown))}")
+
+    call_counter = None
+    server = None
+    mock = None
+    out = sys.stdout
+    if args.base_url:
+        headers = dict(header.split(':', 1) for header in args.header)
+        send = lambda request_type, method, path, body: send_http(args.base_url, headers, request_type, method, path, body)
+    else:
+        import boto3
+        from moto import mock_aws
+
+        # The handlers print to stdout like they do on Lambda; keep that out of the report
+        sys.stdout = open(args.handler_logs or os.devnull, 'w')
+        local_aws.install_environment()
+        mock = mock_aws()
+        mock.start()
+        context = local_aws.load_context()
+        local_aws.create_resources(context)
+        seed(context, args.displays)
+
+        boto3.setup_default_session()
+        call_counter = CallCounter()
+        call_counter.install(boto3.DEFAULT_SESSION)
+        api = LocalApi(call_counter)
+        if args.direct:
+            send = api.invoke
+        else:
+            server = serve_local_api(api)
+            base_url = f'http://127.0.0.1:{server.server_address[1]}'
+            send = lambda request_type, method, path, body: send_http(base_url, {}, request_type, method, path, body)
+
+    try:
+        counter = 0
+        for rate in args.rates:
+            if call_counter:
+                call_counter.counts.clear()
+            latencies, statuses, counter = run_step(send, rate, args, weights, counter)
+            print_step(rate, args.step_seconds, latencies, statuses, call_counter.counts if call_counter else None, out)
+    finally:
+        if server:
+            server.shutdown()
+        if mock:
+            mock.stop()
+        if sys.stdout is not out:
+            sys.stdout.close()
+            sys.stdout = out
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+"""In-process AWS stand-ins for running the gallery Lambdas locally.
+
+S3 and DynamoDB are provided by moto. Rekognition and the FaceChain SageMaker
+endpoint have no useful moto backend, so they are replaced by small stub clients
+registered through gallery_runtime.clients. Resource names come from
+cdk.context.json, the same way the CDK stacks read them.
+"""
+import base64
+import importlib.util
+import json
+import os
+import sys
+import threading
+import uuid
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional
+
+BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_ROOT = os.path.join(BACKEND_ROOT, 'lambda')
+RUNTIME_LAYER_PATH = os.path.join('layers', 'gallery-runtime', 'python')
+LOCAL_BUCKET_NAME = 'amazon-bedrock-gallery-local'
+LOCAL_REGION = 'us-west-2'
+
+HANDLERS = {
+    'get-image': 'apis/get-image',
+    'batch-get-image': 'apis/batch-get-image',
+    'get-gallery': 'apis/get-gallery',
+    'put-image': 'apis/put-image',
+    'get-upload-status': 'apis/get-upload-status',
+    'get-job-status': 'apis/get-job-status',
+    'user-agreement': 'apis/user-agreement',
+    'user-agreement-writer': 'apis/user-agreement-writer',
+    'face-crop': 'image-processing/face-crop',
+    'face-swap': 'image-processing/face-swap',
+    'face-swap-completion': 'image-processing/face-swap-completion',
+    's3-notifications-config': 's3_notifications_config'
+}
+
+# Module-level client attributes used by handlers that predate gallery_runtime
+LEGACY_CLIENT_ATTRIBUTES = {
+    'rekognition': ['rekognition_client'],
+    'sagemaker-runtime': ['sagemaker_runtime']
+}
+
+def load_context() -> Dict[str, Any]:
+    with open(os.path.join(BACKEND_ROOT, 'cdk.context.json')) as file:
+        context = json.load(file)
+    context['s3_base_bucket_name'] = LOCAL_BUCKET_NAME
+    return context
+
+def handler_environment(context: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+    """Union of the environment variables the CDK stacks set on the gallery Lambdas."""
+    context = context or load_context()
+    return {
+        'AWS_DEFAULT_REGION': LOCAL_REGION,
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'BUCKET_NAME': context['s3_base_bucket_name'],
+        'OBJECT_PATH': context['s3_face_images_path'],
+        'FACE_CROPPED_OBJECT_PATH': context['s3_face_cropped_images_path'],
+        'RESULT_OBJECT_PATH': context['s3_result_images_path'],
+        'DISPLAY_OBJECT_PATH': context['s3_display_images_path'] if context.get('display_derivatives_enabled') else '',
+        'FACECHAIN_SAGEMAKER_ENDPOINT_NAME': context['facechain_sagemaker_endpoint_name'],
+        'FACECHAIN_TEMPLATE_PREFETCH': str(bool(context.get('facechain_template_prefetch')) and not context.get('facechain_async_inference')).lower(),
+        'DDB_AMAZON_BEDROCK_GALLERY_PROCESS_TABLE_NAME': context['ddb_amazon_bedrock_gallery_process_table_name'],
+        'DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_TABLE_NAME': context['ddb_amazon_bedrock_gallery_display_table_name'],
+        'DDB_AMAZON_BEDROCK_GALLERY_DISPLAY_HISTORY_TABLE_NAME': context['ddb_amazon_bedrock_gallery_display_history_table_name'],
+        'DDB_AMAZON_BEDROCK_GALLERY_BASE_RESOURCE_TABLE_NAME': context['ddb_amazon_bedrock_gallery_base_resource_table_name'],
+        'DDB_AMAZON_BEDROCK_USER_AGREEMENT_TABLE_NAME': context['ddb_amazon_bedrock_user_agreement_table_name'],
+        'DDB_AMAZON_BEDROCK_GALLERY_DEDUP_TABLE_NAME': context['ddb_amazon_bedrock_gallery_dedup_table_name'],
+        'DDB_AMAZON_BEDROCK_GALLERY_ENDPOINT_LOAD_TABLE_NAME': context['ddb_amazon_bedrock_gallery_endpoint_load_table_name'],
+        'JOB_STAGE_SECONDS': json.dumps(context.get('job_stage_estimate_seconds') or {}),
+        'GALLERY_FEED_SHARDS': str(context.get('gallery_feed_shards') or 4),
+        'THEME_FEED_ENABLED': str(bool(context.get('display_history_theme_index'))).lower()
+    }
+
+def install_environment(context: Optional[Dict[str, Any]] = None) -> None:
+    os.environ.update(handler_environment(context))
+
+def load_handler(name: str, lambda_root: str = LAMBDA_ROOT) -> Any:
+    """Import a handler's index.py as its own module, the way Lambda loads it from /var/task."""
+    handler_dir = os.path.join(lambda_root, HANDLERS[name])
+    runtime_layer_dir = os.path.join(lambda_root, RUNTIME_LAYER_PATH)
+    if os.path.isdir(runtime_layer_dir) and runtime_layer_dir not in sys.path:
+        sys.path.insert(0, runtime_layer_dir)
+
+    spec = importlib.util.spec_from_file_location(f"gallery_handler_{name.replace('-', '_')}", os.path.join(handler_dir, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    # Sibling modules of index.py must resolve from the handler's own directory
+    sys.path.insert(0, handler_dir)
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(handler_dir)
+    return module
+
+def install_clients(clients: Dict[str, Any], modules: List[Any] = ()) -> None:
+    """Register stub clients with gallery_runtime and patch handlers that create their own."""
+    if 'gallery_runtime.clients' in sys.modules:
+        for service_name, client in clients.items():
+            sys.modules['gallery_runtime.clients'].register_client(service_name, client)
+    for module in modules:
+        for service_name, client in clients.items():
+            for attribute in LEGACY_CLIENT_ATTRIBUTES.get(service_name, []):
+                if hasattr(module, attribute):
+                    setattr(module, attribute, client)
+
+def create_resources(context: Optional[Dict[str, Any]] = None) -> None:
+    """Create the bucket and tables from cdk.context.json in moto (mock_aws or a moto server)."""
+    import boto3
+
+    context = context or load_context()
+    boto3.client('s3', region_name=LOCAL_REGION).create_bucket(
+        Bucket=context['s3_base_bucket_name'],
+        CreateBucketConfiguration={'LocationConstraint': LOCAL_REGION}
+    )
+
+    ddb_client = boto3.client('dynamodb', region_name=LOCAL_REGION)
+    ddb_client.create_table(**_table_definition(
+        context['ddb_amazon_bedrock_gallery_process_table_name'],
+        [('PK', 'HASH')],
+        global_secondary_indexes={
+            'userId-created_at-index': [('userId', 'HASH'), ('created_at', 'RANGE')]
+        }
+    ))
+    ddb_client.create_table(**_table_definition(context['ddb_amazon_bedrock_gallery_display_table_name'], [('PK', 'HASH')]))
+
+    ddb_client.create_table(**_table_definition(
+        context['ddb_amazon_bedrock_gallery_display_history_table_name'],
+        [('PK', 'HASH')],
+        global_secondary_indexes={
+            'feed-created_at-index': [('feed', 'HASH'), ('created_at', 'RANGE')],
+            'theme-created_at-index': [('theme', 'HASH'), ('created_at', 'RANGE')]
+        }
+    ))
+    ddb_client.create_table(**_table_definition(context['ddb_amazon_bedrock_gallery_base_resource_table_name'], [('PK', 'HASH'), ('SK', 'RANGE')]))
+    ddb_client.create_table(**_table_definition(context['ddb_amazon_bedrock_user_agreement_table_name'], [('PK', 'HASH'), ('savedAt', 'RANGE')]))
+    ddb_client.create_table(**_table_definition(context['ddb_amazon_bedrock_gallery_dedup_table_name'], [('PK', 'HASH'), ('SK', 'RANGE')]))
+    ddb_client.create_table(**_table_definition(context['ddb_amazon_bedrock_gallery_endpoint_load_table_name'], [('PK', 'HASH')]))
+
+def seed_base_resource(theme: str, gender: str, skin: str, context: Optional[Dict[str, Any]] = None) -> str:
+    """Store a base (template) image and its base resource row; returns the object key."""
+    import boto3
+
+    context = context or load_context()
+    base_image_object_key = f"{context['s3_base_images_path']}{theme}-{gender}-{skin}-{uuid.uuid4().hex[:8]}.png"
+    boto3.client('s3', region_name=LOCAL_REGION).put_object(
+        Bucket=context['s3_base_bucket_name'],
+        Key=base_image_object_key,
+        Body=sample_image(1024, 1024, image_format='PNG')
+    )
+    boto3.client('dynamodb', region_name=LOCAL_REGION).put_item(
+        TableName=context['ddb_amazon_bedrock_gallery_base_resource_table_name'],
+        Item={
+            'PK': {'S': f'#THEME#{theme}#GENDER#{gender}#SKIN#{skin}'},
+            'SK': {'S': f'#UUID#{uuid.uuid4()}'},
+            'base_image_object_key': {'S': base_image_object_key},
+            'story': {'S': f'A portrait from the {theme} era.'}
+        }
+    )
+    return base_image_object_key
+
+def sample_image(width: int, height: int, image_format: str = 'JPEG', quality: int = 90) -> bytes:
+    """A synthetic camera frame: a gradient background with a skin-toned ellipse as the face."""
+    from PIL import Image, ImageDraw
+
+    image = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((width * 0.35, height * 0.25, width * 0.65, height * 0.7), fill=(224, 172, 105))
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **({'quality': quality} if image_format == 'JPEG' else {}))
+    return buffer.getvalue()
+
+def s3_put_event(bucket_name: str, object_key: str, size: int = 0, event_name: str = 'ObjectCreated:Put') -> Dict[str, Any]:
+    from datetime import datetime, timezone
+    from urllib.parse import quote_plus
+
+    return {
+        'Records': [{
+            'eventVersion': '2.1',
+            'eventSource': 'aws:s3',
+            'awsRegion': LOCAL_REGION,
+            'eventTime': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z',
+            'eventName': event_name,
+            's3': {
+                'bucket': {'name': bucket_name, 'arn': f'arn:aws:s3:::{bucket_name}'},
+                'object': {'key': quote_plus(object_key), 'size': size}
+            }
+        }]
+    }
+
+class StubRekognitionClient:
+    """Answers detect_faces with one face covering the middle of the frame."""
+
+    def __init__(self, bounding_box: Optional[Dict[str, float]] = None, confidence: float = 99.9):
+        self.bounding_box = bounding_box or {'Left': 0.35, 'Top': 0.25, 'Width': 0.3, 'Height': 0.45}
+        self.confidence = confidence
+        self.calls = 0
+
+    def detect_faces(self, Image: Dict[str, Any], Attributes: Optional[List[str]] = None) -> Dict[str, Any]:
+        self.calls += 1
+        box = self.bounding_box
+        return {
+            'FaceDetails': [{
+                'BoundingBox': dict(box),
+                'Confidence': self.confidence,
+                'Landmarks': [
+                    {'Type': 'eyeLeft', 'X': box['Left'] + box['Width'] * 0.3, 'Y': box['Top'] + box['Height'] * 0.4},
+                    {'Type': 'eyeRight', 'X': box['Left'] + box['Width'] * 0.7, 'Y': box['Top'] + box['Height'] * 0.4},
+                    {'Type': 'nose', 'X': box['Left'] + box['Width'] * 0.5, 'Y': box['Top'] + box['Height'] * 0.6},
+                    {'Type': 'mouthLeft', 'X': box['Left'] + box['Width'] * 0.35, 'Y': box['Top'] + box['Height'] * 0.8},
+                    {'Type': 'mouthRight', 'X': box['Left'] + box['Width'] * 0.65, 'Y': box['Top'] + box['Height'] * 0.8}
+                ],
+                'Pose': {'Roll': 0.0, 'Yaw': 0.0, 'Pitch': 0.0},
+                'Quality': {'Brightness': 80.0, 'Sharpness': 90.0}
+            }]
+        }
+
+class StubSageMakerRuntimeClient:
+    """Stands in for the FaceChain endpoint by copying the cropped face to the output key."""
+
+    def __init__(self, s3_client: Any = None):
+        self.s3_client = s3_client
+        self.calls = 0
+        self.prefetches = 0
+
+    def invoke_endpoint(self, EndpointName: str, Body: Any, ContentType: str = 'application/json', **kwargs: Any) -> Dict[str, Any]:
+        import boto3
+
+        request = json.loads(Body)
+        if request.get('action') == 'prefetch':
+            # The container only queues the template download and answers at once
+            self.prefetches += 1
+            return {'Body': BytesIO(json.dumps(request).encode('utf-8')), 'ContentType': 'application/json'}
+        self.calls += 1
+        s3_client = self.s3_client or boto3.client('s3', region_name=LOCAL_REGION)
+        if request.get('source_bytes'):
+            source = base64.b64decode(request['source_bytes'])
+        else:
+            source = s3_client.get_object(Bucket=request['bucket'], Key=request['source'])['Body'].read()
+        s3_client.put_object(Bucket=request['bucket'], Key=request['output'], Body=source, ContentType='image/png',
+                             Metadata=request.get('metadata', {}))
+        return {'Body': BytesIO(json.dumps(request).encode('utf-8')), 'ContentType': 'application/json'}
+
+    def invoke_endpoint_async(self, EndpointName: str, InputLocation: str, ContentType: str = 'application/json', **kwargs: Any) -> Dict[str, Any]:
+        """Queue the request like an async endpoint: read it from S3 and run it in the background."""
+        import boto3
+
+        bucket, _, key = InputLocation[len('s3://'):].partition('/')
+        s3_client = self.s3_client or boto3.client('s3', region_name=LOCAL_REGION)
+        body = s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+        inference_id = kwargs.get('InferenceId') or str(uuid.uuid4())
+        self.run_in_background(lambda: self.invoke_endpoint(EndpointName, body, ContentType))
+        return {'InferenceId': inference_id, 'OutputLocation': f's3://{bucket}/async-output/{inference_id}.out'}
+
+    def run_in_background(self, inference: Callable[[], Any]) -> None:
+        def run() -> None:
+            try:
+                inference()
+            except Exception as e:
+                # An async endpoint writes failures to its S3FailurePath; nothing is returned to the caller
+                print(f'async inference failed: {e}')
+
+        threading.Thread(target=run, daemon=True).start()
+
+def _table_definition(table_name: str, key_schema: List[Any], global_secondary_indexes: Optional[Dict[str, List[Any]]] = None) -> Dict[str, Any]:
+    attribute_names = {name for name, _ in key_schema}
+    for index_key_schema in (global_secondary_indexes or {}).values():
+        attribute_names.update(name for name, _ in index_key_schema)
+
+    definition = {
+        'TableName': table_name,
+        'KeySchema': [{'AttributeName': name, 'KeyType': key_type} for name, key_type in key_schema],
+        'AttributeDefinitions': [{'AttributeName': name, 'AttributeType': 'S'} for name in sorted(attribute_names)],
+        'BillingMode': 'PAY_PER_REQUEST'
+    }
+    if global_secondary_indexes:
+        definition['GlobalSecondaryIndexes'] = [
+            {
+                'IndexName': index_name,
+                'KeySchema': [{'AttributeName': name, 'KeyType': key_type} for name, key_type in index_key_schema],
+                'Projection': {'ProjectionType': 'ALL'}
+            }
+            for index_name, index_key_schema in global_secondary_indexes.items()
+        ]
+    return definition
@@ -0,0 +1,534 @@
+"""Run the S3 -> face-crop -> face-swap -> SageMaker -> face-swap-completion chain locally under load.
+
+The real handlers from lambda/ run against moto (S3 and DynamoDB) with a stub
+Rekognition client and a stub FaceChain endpoint whose service time and number of
+instances are configurable. Bucket notifications are installed by the same
+handler the S3NotificationsConfig custom resource deploys, read back from the
+bucket and dispatched to the matching handler, each with its own concurrency
+limit. Every kiosk upload first calls put-image and then uploads through the
+presigned POST, so the report shows end-to-end latency, throughput and where the
+requests queue:
+
+    python -m tools.pipeline_simulator --uploads 40 --rate 2 --instances 1 --service-time 4
+
+With --queue-mode the notifications go to local SQS queues instead, as with the
+pipeline_queue_mode context flag, and each function consumes its queue in batches
+with the batch size and maximum concurrency of the deployed event source mappings:
+
+    python -m tools.pipeline_simulator --uploads 40 --instances 1 --service-time 4 --queue-mode --face-swap-concurrency 2
+
+With --fused face-crop runs the face swap itself with the crop inline, as with the
+pipeline_fused_crop_swap context flag, and face-swap is never triggered.
+
+Every kiosk uploads the same photo, so deduplication (upload_dedup_enabled) is off unless
+--dedup is given; with it, a kiosk's repeated uploads reuse its first completed result.
+
+With --async-inference face swap only submits the inference (facechain_async_inference)
+and the endpoint works through its own backlog, so Lambda concurrency stays flat.
+
+With --variants N the endpoint has N variants of --instances instances each and face-swap
+(face-crop with --fused) routes by load with admission control (facechain_routing_enabled):
+a job that finds every variant full is deferred through a local retry queue with the
+deployed backoff:
+
+    python -m tools.pipeline_simulator --uploads 40 --instances 1 --service-time 4 --variants 2
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from tools import latency_report, local_aws
+
+LOCAL_ACCOUNT_ID = '123456789012'
+# Function names as deployed by LambdaImageProcessingStack
+FUNCTION_HANDLERS = {
+    'AmazonBedrockGalleryFaceCropLambda': 'face-crop',
+    'AmazonBedrockGalleryFaceSwapLambda': 'face-swap',
+    'AmazonBedrockGalleryFaceSwapCompletionLambda': 'face-swap-completion'
+}
+THEMES = ['ancient_rome', 'joseon', 'renaissance']
+# Queue mode event source mappings as deployed by LambdaImageProcessingStack:
+# (batch size, batching window in seconds, maximum concurrency or None for --face-swap-concurrency)
+QUEUE_SETTINGS = {
+    'AmazonBedrockGalleryFaceCropLambda': (10, 1.0, 10),
+    'AmazonBedrockGalleryFaceSwapLambda': (1, 0.0, None),
+    'AmazonBedrockGalleryFaceSwapCompletionLambda': (10, 1.0, 10)
+}
+
+class WorkTracker:
+    """Counts outstanding work so the simulation knows when the pipeline has drained."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.outstanding = 0
+
+    def started(self) -> None:
+        with self.condition:
+            self.outstanding += 1
+
+    def finished(self) -> None:
+        with self.condition:
+            self.outstanding -= 1
+            self.condition.notify_all()
+
+    def wait_idle(self) -> None:
+        with self.condition:
+            self.condition.wait_for(lambda: self.outstanding == 0)
+
+class LocalFunction:
+    """One Lambda function: the handler behind an executor sized to its concurrency limit."""
+
+    def __init__(self, name: str, handler: Callable[[Dict[str, Any], Any], Any], concurrency: int, tracker: WorkTracker):
+        self.name = name
+        self.handler = handler
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=name)
+        self.tracker = tracker
+        self.lock = threading.Lock()
+        self.invocations = 0
+        self.active = 0
+        self.peak_concurrency = 0
+        self.errors: List[str] = []
+
+    def invoke_async(self, event: Dict[str, Any], callback: Optional[Callable[[Any], None]] = None) -> None:
+        self.tracker.started()
+        self.executor.submit(self._run, event, callback)
+
+    def _run(self, event: Dict[str, Any], callback: Optional[Callable[[Any], None]]) -> None:
+        response = None
+        with self.lock:
+            self.active += 1
+            self.peak_concurrency = max(self.peak_concurrency, self.active)
+        try:
+            response = self.handler(event, None)
+            # Records that failed in a batch that otherwise succeeded are reported, not raised
+            if isinstance(response, dict) and 'batchItemFailures' in response:
+                failed = [f"message {item['itemIdentifier']} failed" for item in response['batchItemFailures']]
+            elif isinstance(response, dict):
+                failed = [f"{item['objectKey']}: {item['error']}" for item in json.loads(response['body']).get('failed', [])]
+            else:
+                failed = []
+            with self.lock:
+                self.errors.extend(failed)
+        except Exception as e:
+            with self.lock:
+                self.errors.append(f'{type(e).__name__}: {e}')
+        finally:
+            if callback:
+                callback(response)
+            with self.lock:
+                self.invocations += 1
+                self.active -= 1
+            self.tracker.finished()
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+
+class LocalQueue:
+    """An SQS queue stand-in and the event source mapping that polls it into the function.
+
+    Kept in process rather than in moto: moto delivers bucket notifications to its own
+    queues as well, which would duplicate every message the dispatcher sends.
+    """
+
+    def __init__(self, name: str, function: LocalFunction, batch_size: int, batching_window: float,
+                 max_concurrency: int, tracker: WorkTracker):
+        self.arn = f'arn:aws:sqs:{local_aws.LOCAL_REGION}:{LOCAL_ACCOUNT_ID}:{name}'
+        self.function = function
+        self.batch_size = batch_size
+        self.batching_window = batching_window
+        self.slots = threading.Semaphore(max_concurrency)
+        self.tracker = tracker
+        self.condition = threading.Condition()
+        self.messages: Deque[Dict[str, Any]] = deque()
+        self.max_depth = 0
+        self.batches: List[int] = []
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._poll, name=f'{name}-poller', daemon=True)
+
+    def send(self, body: Dict[str, Any], delay_seconds: float = 0) -> None:
+        self.tracker.started()
+        if delay_seconds > 0:
+            # A delayed message is outstanding work, but only visible once its delay has passed
+            timer = threading.Timer(delay_seconds, self._enqueue, args=(body,))
+            timer.daemon = True
+            timer.start()
+        else:
+            self._enqueue(body)
+
+    def _enqueue(self, body: Dict[str, Any]) -> None:
+        with self.condition:
+            self.messages.append({'messageId': str(uuid.uuid4()), 'body': json.dumps(body), 'sentAt': time.time()})
+            self.max_depth = max(self.max_depth, len(self.messages))
+            self.condition.notify_all()
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        with self.condition:
+            self.condition.notify_all()
+        self.thread.join()
+
+    def _receive_batch(self) -> List[Dict[str, Any]]:
+        # Like the Lambda poller: once a message is there, fill the batch until it is full
+        # or the batching window has passed
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.messages or self.stopped.is_set(), timeout=0.1) or not self.messages:
+                return []
+            deadline = time.perf_counter() + self.batching_window
+            while len(self.messages) < self.batch_size and not self.stopped.is_set():
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return [self.messages.popleft() for _ in range(min(self.batch_size, len(self.messages)))]
+
+    def _poll(self) -> None:
+        while not self.stopped.is_set():
+            # A free execution slot is taken before polling, so at most max_concurrency batches run
+            if not self.slots.acquire(timeout=0.1):
+                continue
+            messages = self._receive_batch()
+            if not messages:
+                self.slots.release()
+                continue
+            self.batches.append(len(messages))
+            event = {'Records': [{
+                'messageId': message['messageId'],
+                'receiptHandle': message['messageId'],
+                'body': message['body'],
+                'attributes': {'SentTimestamp': str(int(message['sentAt'] * 1000))},
+                'eventSource': 'aws:sqs',
+                'eventSourceARN': self.arn,
+                'awsRegion': local_aws.LOCAL_REGION
+            } for message in messages]}
+            self.function.invoke_async(event, lambda response, count=len(messages): self._complete(count))
+
+    def _complete(self, count: int) -> None:
+        # Failed messages are counted as function errors and dropped; there is no redrive here
+        self.slots.release()
+        for _ in range(count):
+            self.tracker.finished()
+
+class LocalSQSClient:
+    """The SQS client the handlers send their own messages with, delivering to local queues by URL."""
+
+    def __init__(self, queues: Dict[str, LocalQueue]):
+        self.queues = queues
+        self.sent = 0
+
+    def send_message(self, QueueUrl: str, MessageBody: str, DelaySeconds: int = 0, **kwargs: Any) -> Dict[str, Any]:
+        self.queues[QueueUrl].send(json.loads(MessageBody), DelaySeconds)
+        self.sent += 1
+        return {'MessageId': str(uuid.uuid4())}
+
+class NotificationDispatcher:
+    """Routes object-created events using the bucket's notification configuration."""
+
+    def __init__(self, bucket_name: str, functions: Dict[str, LocalFunction], queues: Optional[Dict[str, LocalQueue]] = None):
+        self.bucket_name = bucket_name
+        self.functions = functions
+        self.queues = {queue.arn: queue for queue in (queues or {}).values()}
+        self.rules: List[Dict[str, Any]] = []
+
+    def load(self, s3_client: Any) -> None:
+        configuration = s3_client.get_bucket_notification_configuration(Bucket=self.bucket_name)
+        self.rules = []
+        for rule in configuration.get('LambdaFunctionConfigurations', []) + configuration.get('QueueConfigurations', []):
+            filters = {item['Name'].lower(): item['Value'] for item in rule.get('Filter', {}).get('Key', {}).get('FilterRules', [])}
+            if 'QueueArn' in rule:
+                target = self.queues[rule['QueueArn']].send
+            else:
+                target = self.functions[rule['LambdaFunctionArn'].rsplit(':', 1)[-1]].invoke_async
+            self.rules.append({
+                'events': rule['Events'],
+                'prefix': filters.get('prefix', ''),
+                'suffix': filters.get('suffix', ''),
+                'target': target
+            })
+        # S3 sends a test message to every queue when the configuration is put
+        for queue in self.queues.values():
+            queue.send({'Service': 'Amazon S3', 'Event': 's3:TestEvent', 'Bucket': self.bucket_name})
+
+    def publish(self, object_key: str, size: int, event_name: str) -> None:
+        for rule in self.rules:
+            if not any(pattern in (f's3:{event_name}', 's3:ObjectCreated:*') for pattern in rule['events']):
+                continue
+            if object_key.startswith(rule['prefix']) and object_key.endswith(rule['suffix']):
+                rule['target'](local_aws.s3_put_event(self.bucket_name, object_key, size, event_name))
+
+class NotifyingS3Client:
+    """An S3 client that publishes bucket notifications for the objects written through it."""
+
+    def __init__(self, s3_client: Any, dispatcher: NotificationDispatcher):
+        self.s3_client = s3_client
+        self.dispatcher = dispatcher
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.s3_client, name)
+
+    def put_object(self, **kwargs: Any) -> Dict[str, Any]:
+        response = self.s3_client.put_object(**kwargs)
+        if kwargs.get('Bucket') == self.dispatcher.bucket_name:
+            self.dispatcher.publish(kwargs['Key'], len(kwargs.get('Body', b'')), 'ObjectCreated:Put')
+        return response
+
+    def copy_object(self, **kwargs: Any) -> Dict[str, Any]:
+        response = self.s3_client.copy_object(**kwargs)
+        if kwargs.get('Bucket') == self.dispatcher.bucket_name:
+            self.dispatcher.publish(kwargs['Key'], 0, 'ObjectCreated:Copy')
+        return response
+
+    def post_object(self, fields: Dict[str, str], body: bytes) -> None:
+        """What a browser upload of the presigned POST fields looks like to the bucket."""
+        metadata = {name[len('x-amz-meta-'):]: value for name, value in fields.items() if name.startswith('x-amz-meta-')}
+        self.s3_client.put_object(Bucket=self.dispatcher.bucket_name, Key=fields['key'], Body=body,
+                                  ContentType=fields.get('Content-Type', 'image/jpeg'), Metadata=metadata)
+        self.dispatcher.publish(fields['key'], len(body), 'ObjectCreated:Post')
+
+class QueueingSageMakerRuntimeClient(local_aws.StubSageMakerRuntimeClient):
+    """The FaceChain endpoint as a fixed number of instances per variant, each serving one request at a time.
+
+    Requests without a TargetVariant go to the first variant.
+    """
+
+    def __init__(self, s3_client: Any, instances: int, service_time: float, service_jitter: float, tracker: WorkTracker,
+                 variants: Optional[List[str]] = None):
+        super().__init__(s3_client)
+        self.tracker = tracker
+        self.variants = variants or ['FaceChainVariant']
+        self.instances = {variant: threading.Semaphore(instances) for variant in self.variants}
+        self.variant_invocations = {variant: 0 for variant in self.variants}
+        self.service_time = service_time
+        self.service_jitter = service_jitter
+        self.lock = threading.Lock()
+        self.queue_waits: List[float] = []
+        self.busy_seconds = 0.0
+
+    def invoke_endpoint(self, EndpointName: str, Body: Any, ContentType: str = 'application/json', **kwargs: Any) -> Dict[str, Any]:
+        if json.loads(Body).get('action') == 'prefetch':
+            return super().invoke_endpoint(EndpointName, Body, ContentType, **kwargs)
+        variant = kwargs.get('TargetVariant') or self.variants[0]
+        arrived_at = time.perf_counter()
+        with self.instances[variant]:
+            served_at = time.perf_counter()
+            time.sleep(max(0.0, random.gauss(self.service_time, self.service_time * self.service_jitter)))
+            response = super().invoke_endpoint(EndpointName, Body, ContentType, **kwargs)
+            finished_at = time.perf_counter()
+        with self.lock:
+            self.queue_waits.append((served_at - arrived_at) * 1000)
+            self.busy_seconds += finished_at - served_at
+            self.variant_invocations[variant] += 1
+        return response
+
+    def run_in_background(self, inference: Callable[[], Any]) -> None:
+        # A queued async inference is outstanding work until its result is written
+        self.tracker.started()
+
+        def run() -> None:
+            try:
+                inference()
+            finally:
+                self.tracker.finished()
+
+        super().run_in_background(run)
+
+def install_notifications(context: Dict[str, Any], queues: Optional[Dict[str, LocalQueue]] = None) -> None:
+    """Configure the bucket through the custom resource handler, with local function (and queue) ARNs."""
+    def function_arn(function_name: str) -> str:
+        return f'arn:aws:lambda:{local_aws.LOCAL_REGION}:{LOCAL_ACCOUNT_ID}:function:{function_name}'
+
+    properties = {
+        'BucketName': context['s3_base_bucket_name'],
+        'FaceCropLambdaArn': function_arn('AmazonBedrockGalleryFaceCropLambda'),
+        'FaceSwapLambdaArn': function_arn('AmazonBedrockGalleryFaceSwapLambda'),
+        'FaceSwapCompletionLambdaArn': function_arn('AmazonBedrockGalleryFaceSwapCompletionLambda'),
+        'FaceImagesPath': context['s3_face_images_path'],
+        'FaceCroppedImagesPath': context['s3_face_cropped_images_path'],
+        'ResultImagesPath': context['s3_result_images_path']
+    }
+    if queues:
+        properties['FaceCropQueueArn'] = queues['AmazonBedrockGalleryFaceCropLambda'].arn
+        properties['FaceSwapQueueArn'] = queues['AmazonBedrockGalleryFaceSwapLambda'].arn
+        properties['FaceSwapCompletionQueueArn'] = queues['AmazonBedrockGalleryFaceSwapCompletionLambda'].arn
+
+    custom_resource = local_aws.load_handler('s3-notifications-config')
+    custom_resource.handler({'RequestType': 'Create', 'ResourceProperties': properties}, None)
+
+def upload(put_image: Any, s3_client: NotifyingS3Client, user_id: str, theme: str, image: bytes, failures: List[str]) -> None:
+    """One kiosk capture: request the upload from put-image, then POST the photo to S3."""
+    response = put_image.lambda_handler({
+        'httpMethod': 'POST',
+        'body': json.dumps({'userId': user_id, 'theme': theme, 'gender': 'male', 'skin': 'light'})
+    }, None)
+    if response['statusCode'] != 200:
+        failures.append(f"put-image {response['statusCode']}: {response['body']}")
+        return
+    upload_fields = json.loads(response['body'])['uploadFields']
+    s3_client.post_object(upload_fields, image)
+
+def simulate(args: argparse.Namespace) -> None:
+    import boto3
+
+    context = local_aws.load_context()
+    local_aws.create_resources(context)
+    themes = THEMES[:args.themes]
+    for theme in themes:
+        local_aws.seed_base_resource(theme, 'male', 'light', context)
+
+    if args.async_inference:
+        # Read by gallery_runtime.facechain when the handlers are loaded
+        os.environ['FACECHAIN_ASYNC_INFERENCE'] = 'true'
+        os.environ['FACECHAIN_ASYNC_INPUT_PATH'] = f"{context['s3_async_inference_path']}input/"
+        # Async endpoints take no synchronous prefetch hints
+        os.environ['FACECHAIN_TEMPLATE_PREFETCH'] = 'false'
+    if not args.dedup:
+        # Read by gallery_runtime.dedup when the handlers are loaded
+        os.environ.pop('DDB_AMAZON_BEDROCK_GALLERY_DEDUP_TABLE_NAME', None)
+    variants = [f'FaceChainVariant{index + 1}' for index in range(args.variants)] if args.variants else None
+    retry_queue_url = f'https://sqs.{local_aws.LOCAL_REGION}.amazonaws.com/{LOCAL_ACCOUNT_ID}/FaceSwapRetryQueue'
+    if variants:
+        # Read by gallery_runtime.routing when the handlers are loaded, as LambdaImageProcessingStack sets them
+        os.environ['FACECHAIN_TARGETS'] = json.dumps([
+            {'endpoint': context['facechain_sagemaker_endpoint_name'], 'variant': variant, 'max_in_flight': args.instances}
+            for variant in variants
+        ])
+        os.environ['FACE_SWAP_RETRY_QUEUE_URL'] = retry_queue_url
+        # The deployed 5s base backoff, scaled to the simulated service time
+        os.environ['FACE_SWAP_RETRY_BASE_SECONDS'] = str(max(1.0, args.service_time))
+    if args.fused:
+        # Read by face-crop when it is loaded
+        os.environ['FUSED_FACE_SWAP'] = 'true'
+        os.environ['FACE_CROP_AUDIT_OBJECT_PATH'] = context['s3_face_crop_audit_path']
+
+    tracker = WorkTracker()
+    modules = {name: local_aws.load_handler(name) for name in ['put-image', *FUNCTION_HANDLERS.values()]}
+    functions = {
+        function_name: LocalFunction(function_name, modules[name].lambda_handler, args.lambda_concurrency, tracker)
+        for function_name, name in FUNCTION_HANDLERS.items()
+    }
+    queues: Dict[str, LocalQueue] = {}
+    if args.queue_mode:
+        queue_settings = dict(QUEUE_SETTINGS)
+        if args.async_inference:
+            # Submitting is quick, so face-swap takes batches like the other stages
+            queue_settings['AmazonBedrockGalleryFaceSwapLambda'] = QUEUE_SETTINGS['AmazonBedrockGalleryFaceCropLambda']
+        elif args.fused:
+            # The fused face-crop queue is throttled like the face-swap one
+            queue_settings['AmazonBedrockGalleryFaceCropLambda'] = QUEUE_SETTINGS['AmazonBedrockGalleryFaceSwapLambda']
+        for function_name, (batch_size, batching_window, max_concurrency) in queue_settings.items():
+            queues[function_name] = LocalQueue(f'{function_name}Queue', functions[function_name], batch_size,
+                                               batching_window, max_concurrency or args.face_swap_concurrency, tracker)
+    retry_queues: Dict[str, LocalQueue] = {}
+    if variants:
+        # The retry queue's event source mapping: one message per invocation, to the stage running the inference
+        retry_function = functions['AmazonBedrockGalleryFaceCropLambda' if args.fused else 'AmazonBedrockGalleryFaceSwapLambda']
+        retry_queues[retry_queue_url] = LocalQueue('FaceSwapRetryQueue', retry_function, 1, 0.0,
+                                                   args.face_swap_concurrency if args.queue_mode else args.lambda_concurrency, tracker)
+    install_notifications(context, queues)
+    dispatcher = NotificationDispatcher(context['s3_base_bucket_name'], functions, queues)
+    raw_s3_client = boto3.client('s3', region_name=local_aws.LOCAL_REGION)
+    dispatcher.load(raw_s3_client)
+    s3_client = NotifyingS3Client(raw_s3_client, dispatcher)
+    sagemaker_client = QueueingSageMakerRuntimeClient(s3_client, args.instances, args.service_time, args.service_jitter, tracker, variants)
+    sqs_client = LocalSQSClient(retry_queues)
+    local_aws.install_clients({
+        's3': s3_client,
+        'rekognition': local_aws.StubRekognitionClient(),
+        'sagemaker-runtime': sagemaker_client,
+        'sqs': sqs_client
+    }, list(modules.values()))
+
+    width, height = (int(value) for value in args.image_size.split('x'))
+    image = local_aws.sample_image(width, height)
+    upload_failures: List[str] = []
+    kiosks = ThreadPoolExecutor(max_workers=args.kiosks, thread_name_prefix='kiosk')
+
+    log = io.StringIO()
+    for queue in [*queues.values(), *retry_queues.values()]:
+        queue.start()
+    started_at = time.perf_counter()
+    with contextlib.redirect_stdout(log):
+        for index in range(args.uploads):
+            if args.rate > 0:
+                time.sleep(max(0.0, started_at + index / args.rate - time.perf_counter()))
+            tracker.started()
+            future = kiosks.submit(upload, modules['put-image'], s3_client, f'kiosk{index % args.kiosks:02d}',
+                                   themes[index % len(themes)], image, upload_failures)
+            future.add_done_callback(lambda _: tracker.finished())
+        tracker.wait_idle()
+    elapsed = time.perf_counter() - started_at
+
+    kiosks.shutdown()
+    for queue in [*queues.values(), *retry_queues.values()]:
+        queue.stop()
+    for function in functions.values():
+        function.shutdown()
+
+    timelines = latency_report.build_timelines(latency_report.parse_records(log.getvalue().splitlines()))
+    completed = sum(1 for stages in timelines.values() if latency_report.end_to_end_ms(stages) is not None)
+    print(f'uploads: {args.uploads} over {elapsed:.1f}s, {completed} completed '
+          f'({completed / elapsed * 60:.1f} per minute)')
+    instances = args.instances * len(sagemaker_client.variants)
+    print(f'sagemaker: {instances} instance(s), {len(sagemaker_client.queue_waits)} invocations, '
+          f'{sagemaker_client.prefetches} template prefetch hints, '
+          f'utilization {sagemaker_client.busy_seconds / (instances * elapsed) * 100:.0f}%', end='')
+    if sagemaker_client.queue_waits:
+        print(f', queue wait p50 {latency_report.percentile(sagemaker_client.queue_waits, 50):.0f}ms '
+              f'p95 {latency_report.percentile(sagemaker_client.queue_waits, 95):.0f}ms')
+    else:
+        print()
+    if variants:
+        print('variants: ' + ', '.join(f'{variant} {count} invocations' for variant, count in sagemaker_client.variant_invocations.items())
+              + f'; {sqs_client.sent} jobs deferred to the retry queue')
+    for function in functions.values():
+        print(f'{function.name}: {function.invocations} invocations, peak concurrency {function.peak_concurrency}, '
+              f'{len(function.errors)} errors'
+              + (f' (first: {function.errors[0]})' if function.errors else ''))
+    for function_name, queue in queues.items():
+        print(f'{function_name} queue: max depth {queue.max_depth}, {len(queue.batches)} batches, '
+              f'mean batch size {sum(queue.batches) / max(1, len(queue.batches)):.1f}')
+    if upload_failures:
+        print(f'put-image: {len(upload_failures)} failures (first: {upload_failures[0]})')
+    print()
+    if timelines:
+        latency_report.print_summary(timelines, args.timelines)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uploads', type=int, default=20, help='number of kiosk uploads')
+    parser.add_argument('--rate', type=float, default=0, help='uploads per second (0 sends them all at once)')
+    parser.add_argument('--kiosks', type=int, default=10, help='kiosks uploading concurrently')
+    parser.add_argument('--themes', type=int, default=1, choices=range(1, len(THEMES) + 1), help='number of themes to spread uploads over')
+    parser.add_argument('--image-size', default='1280x960', help='uploaded photo size, WIDTHxHEIGHT')
+    parser.add_argument('--lambda-concurrency', type=int, default=10, help='concurrent executions per image-processing function')
+    parser.add_argument('--instances', type=int, default=1, help='FaceChain endpoint instances')
+    parser.add_argument('--service-time', type=float, default=3.0, help='mean FaceChain inference time in seconds')
+    parser.add_argument('--service-jitter', type=float, default=0.1, help='standard deviation of the service time, as a fraction of it')
+    parser.add_argument('--queue-mode', action='store_true', help='buffer the notifications in SQS queues (pipeline_queue_mode)')
+    parser.add_argument('--face-swap-concurrency', type=int, default=2, help='maximum concurrency of the face-swap queue (face_swap_max_concurrency)')
+    parser.add_argument('--fused', action='store_true', help='run the face swap from face-crop with the crop inline (pipeline_fused_crop_swap)')
+    parser.add_argument('--async-inference', action='store_true', help='queue the inferences on the endpoint (facechain_async_inference)')
+    parser.add_argument('--variants', type=int, default=0, help='endpoint variants to route face swaps over with admission control (facechain_routing_enabled)')
+    parser.add_argument('--dedup', action='store_true', help='reuse the results of repeated uploads (upload_dedup_enabled)')
+    parser.add_argument('--timelines', type=int, default=3, help='number of slowest request timelines to print')
+    args = parser.parse_args()
+
+    from moto import mock_aws
+
+    local_aws.install_environment()
+    with mock_aws():
+        simulate(args)
+
+if __name__ == '__main__':
+    main()
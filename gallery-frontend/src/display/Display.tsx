@@ -35,7 +35,7 @@ const DisplayComponent = () => {
   const { data } = useQuery({
     queryKey: [id],
     queryFn: () =>
-      fetch(`${endpoint}/images/${id}`).then((res) =>
+      fetch(`${endpoint}/images/${id}?size=display`).then((res) =>
         res.json()
       ),
     refetchInterval: 5000,
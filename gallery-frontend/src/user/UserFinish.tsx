@@ -1,10 +1,17 @@
 import React, { useEffect, useState } from 'react';
-import { useNavigate } from 'react-router-dom';
+import { useNavigate, useLocation } from 'react-router-dom';
+import { getJobStatus } from './apiUtils';
 import './UserFinish.css';
 
+const JOB_STATUS_POLL_INTERVAL_MS = 2000;
+
 const UserFinish: React.FC = () => {
   const [timer, setTimer] = useState(15);
+  const [job, setJob] = useState(null);
   const navigate = useNavigate();
+  const location = useLocation();
+  // Set by UserPhoto; users without a selfie have no job to follow
+  const userId = location.state?.userId;
 
   useEffect(() => {
     const interval = setInterval(() => {
@@ -19,6 +26,33 @@ const UserFinish: React.FC = () => {
     return () => clearInterval(interval);
   }, [timer, navigate]);
 
+  // Follow the job until its result is on the display
+  useEffect(() => {
+    if (!userId) {
+      return;
+    }
+    let pollTimeout;
+    let active = true;
+    const poll = async () => {
+      const status = await getJobStatus(userId);
+      if (!active) {
+        return;
+      }
+      if (status) {
+        setJob(status);
+      }
+      if (!status || status.etaSeconds !== null) {
+        pollTimeout = setTimeout(poll, JOB_STATUS_POLL_INTERVAL_MS);
+      }
+    };
+    poll();
+
+    return () => {
+      active = false;
+      clearTimeout(pollTimeout);
+    };
+  }, [userId]);
+
   const handleClick = () => {
     navigate('/user/start');
   };
@@ -28,6 +62,12 @@ const UserFinish: React.FC = () => {
       <div className="user-finish-background"></div>
       <div className="user-finish-content">
         <h2 className="title">We are searching for your past life.<br/>Wait and see the display.</h2>
+        {job && job.stage === 'completed' && (
+          <p className="timer">Your portrait is on the display now.</p>
+        )}
+        {job && job.etaSeconds !== null && (
+          <p className="timer">Your portrait will be on the display in about <span className="timer-count">{Math.ceil(job.etaSeconds)}</span> seconds</p>
+        )}
         <p className="timer">Move to the start page in <span className="timer-count">{timer}</span> seconds</p>
         <button className="go-start-button" onClick={handleClick}>
           Click To Start
@@ -37,4 +77,4 @@ const UserFinish: React.FC = () => {
   );
 };
 
-export default UserFinish;
\ No newline at end of file
+export default UserFinish;
@@ -5,7 +5,7 @@ import { useTranslation, Trans } from 'react-i18next';
 import {Buffer} from 'buffer';
 import axios from 'axios';
 import './UserPhoto.css';
-import { sendGenerateImageCommand, sendUserAgreementCommand, uuidX } from './apiUtils';
+import { resizeImageToFit, sendGenerateImageCommand, sendUserAgreementCommand, uuidX, waitForUploadStatus } from './apiUtils';
 import PrivacyModal from './PrivacyModal';
 
 const historical_periods = [
@@ -30,6 +30,7 @@ const UserPhoto = ({ signOut, user }) => {
   const [showPrivacyModal, setShowPrivacyModal] = useState(true);
   const [agreementUserName, setAgreementUserName] = useState(null);
   const [agreementResult, setAgreementResult] = useState(false);
+  const [rejectedStatus, setRejectedStatus] = useState(null);
   const { t } = useTranslation();
 
   const location = useLocation();
@@ -63,6 +64,7 @@ const UserPhoto = ({ signOut, user }) => {
         const imageSrc = webcamRef.current.getScreenshot();
         console.log("img src= "+imageSrc);
         setCapturedImage(imageSrc);
+        setRejectedStatus(null);
     }
   };
 
@@ -84,61 +86,79 @@ const UserPhoto = ({ signOut, user }) => {
       body: JSON.stringify(requestBody)
     })
       .then(response => response.json())
-      .then(data => {
+      .then(async data => {
         console.log('Fetched presigned data:', data);
         console.log('Fetched presigned url:', data.uploadUrl); 
         console.log('uploading Image To S3');
-        uploadImageToS3(data.uploadUrl, capturedImage).then(() => setUploadProgress2(50));
+        await uploadImageToS3(data, capturedImage);
+        setUploadProgress2(50);
         console.log('call Agreement API');
         console.log(data)
-        sendUserAgreementCommand(data.uploadUrl, user.username, agreementUserName);
+        sendUserAgreementCommand(data.uploadFields?.key, user.username, agreementUserName);
+
+        // face-crop reports within about a second whether the photo can be used
+        const { status } = await waitForUploadStatus(data.jobId);
+        if (status && status.startsWith('REJECTED_')) {
+          showRejection(status);
+          return;
+        }
         setUploadProgress2(100);
-        navigate('/user/finish');
+        navigate('/user/finish', { state: { userId: user.username } });
     })
-    .catch(error => console.error('Error while uploading the image:', error));
+    .catch(error => {
+      // The photo did not reach S3 (or the upload URL could not be fetched): ask for a new one
+      console.error('Error while uploading the image:', error);
+      showRejection('UPLOAD_FAILED');
+    });
   }
 
-  const uploadImageToS3 = async (presignedUrl4Put: string, imageSrc: any) => {
-    if (presignedUrl4Put) {
-      try {
-        // Data URI 형식에서 Blob으로 변환
-        const response = await fetch(imageSrc);
-        const blob = await response.blob();
-        
-        const config = {
-          onUploadProgress: (progressEvent: any) => {
-            const percentCompleted = Math.round((progressEvent.loaded * 100) / progressEvent.total);
-            setUploadProgress1(percentCompleted);
-          },
-        };
-
-        // Content-Type 헤더 설정
-        const header = {
-          'Content-Type': 'image/jpeg',
-        };
-
-        console.log("Uploading to:", presignedUrl4Put);
-        // Blob 형식으로 업로드
-        const uploadResponse = await axios.put(presignedUrl4Put, blob, {
-          ...config,
-          headers: header
-        });
-
-        console.log("Upload response:", uploadResponse);
-        
-        if (uploadResponse.status === 200) {
-          setUploadProgress1(100);
-          console.log('Image uploaded successfully');
-        } else {
-          console.error('Error uploading image with status:', uploadResponse.status);
-        }
-      } catch (error) {
-        console.error('Error details:', error.response ? error.response.data : error.message);
-        console.error('Error uploading image:', error);
-      }
-    } else {
-      console.error('Presigned URL not available');
+  const showRejection = (status) => {
+    setRejectedStatus(status);
+    setCapturedImage(null);
+    setUploadProgress1(0);
+    setUploadProgress2(100);
+  };
+
+  const uploadImageToS3 = async (presignedPost: any, imageSrc: any) => {
+    if (!presignedPost || !presignedPost.uploadUrl) {
+      throw new Error('Presigned URL not available');
+    }
+
+    // Data URI 형식에서 Blob으로 변환 (권장 해상도 이하로 축소)
+    const blob = await resizeImageToFit(imageSrc, presignedPost.maxUploadWidth, presignedPost.maxUploadHeight);
+    if (blob.size > presignedPost.maxUploadSize) {
+      throw new Error(`Image exceeds the maximum upload size: ${blob.size}`);
+    }
+
+    const config = {
+      onUploadProgress: (progressEvent: any) => {
+        const percentCompleted = Math.round((progressEvent.loaded * 100) / progressEvent.total);
+        setUploadProgress1(percentCompleted);
+      },
+    };
+
+    // POST policy 필드 다음에 파일을 마지막으로 추가
+    const formData = new FormData();
+    Object.entries(presignedPost.uploadFields).forEach(([name, value]) => {
+      formData.append(name, value as string);
+    });
+    formData.append('file', blob);
+
+    console.log("Uploading to:", presignedPost.uploadUrl);
+    let uploadResponse;
+    try {
+      uploadResponse = await axios.post(presignedPost.uploadUrl, formData, config);
+    } catch (error) {
+      console.error('Error details:', error.response ? error.response.data : error.message);
+      throw error;
+    }
+
+    console.log("Upload response:", uploadResponse);
+    if (uploadResponse.status < 200 || uploadResponse.status >= 300) {
+      throw new Error(`Error uploading image with status: ${uploadResponse.status}`);
     }
+    setUploadProgress1(100);
+    console.log('Image uploaded successfully');
   };
 
   const navigateToStart = () => {
@@ -192,7 +212,12 @@ const UserPhoto = ({ signOut, user }) => {
       {(() => {
         if (!capturedImage) {
           return (
-            <div className="capture-button"><br/><button onClick={capture}>{t('takePhoto')}</button></div>
+            <div style={{ display: 'flex', flexDirection: 'column', alignItems: 'center' }}>
+              {rejectedStatus && (
+                <div className="upload-rejected-message" style={{ textAlign: 'center' }}>{t(`photoRejected.${rejectedStatus}`)}</div>
+              )}
+              <div className="capture-button"><br/><button onClick={capture}>{t('takePhoto')}</button></div>
+            </div>
           );
         } else {
           if (Math.min(uploadProgress1, uploadProgress2) === 100) {
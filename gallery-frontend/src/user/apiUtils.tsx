@@ -24,10 +24,58 @@ export const sendGenerateImageCommand = async (uuid, gender, skinTone, useSelfie
   }
 };
 
-export const sendUserAgreementCommand = async (presignedUrl4Put, username, agreementUserName) => {
+export const resizeImageToFit = (imageSrc, maxWidth, maxHeight) => {
+  return new Promise<Blob>((resolve, reject) => {
+    const image = new Image();
+    image.onload = () => {
+      const scale = Math.min(1, maxWidth / image.width, maxHeight / image.height);
+      const canvas = document.createElement('canvas');
+      canvas.width = Math.round(image.width * scale);
+      canvas.height = Math.round(image.height * scale);
+      canvas.getContext('2d').drawImage(image, 0, 0, canvas.width, canvas.height);
+      canvas.toBlob((blob) => blob ? resolve(blob) : reject(new Error('Failed to encode image.')), 'image/jpeg', 0.92);
+    };
+    image.onerror = reject;
+    image.src = imageSrc;
+  });
+};
+
+// Poll the face quality gate result of an upload. Resolves with the last status seen, which is
+// still PENDING if face-crop has not finished within the timeout.
+export const waitForUploadStatus = async (jobId, timeoutMs = 5000, intervalMs = 500) => {
+  const deadline = Date.now() + timeoutMs;
+  let status = 'PENDING';
+  while (Date.now() < deadline) {
+    try {
+      const response = await axios.get(`${process.env.REACT_APP_API_ENDPOINT}/images/upload/${jobId}`);
+      status = response.data.status;
+      if (status !== 'PENDING') {
+        return response.data;
+      }
+    } catch (error) {
+      console.error('Error in waitForUploadStatus:', error);
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+  return { jobId, status };
+};
+
+// Stage and ETA of the user's latest job; etaSeconds is null once it is completed or rejected.
+// Resolves with null when the status is not available yet.
+export const getJobStatus = async (userId) => {
+  try {
+    const response = await axios.get(`${process.env.REACT_APP_API_ENDPOINT}/jobs/${userId}`);
+    return response.data;
+  } catch (error) {
+    console.error('Error in getJobStatus:', error);
+    return null;
+  }
+};
+
+export const sendUserAgreementCommand = async (uploadObjectKey, username, agreementUserName) => {
   try {
-    const regex = /face-image\/(.+?)\?/;
-    const match = presignedUrl4Put.match(regex);
+    const regex = /face-image\/(.+)$/;
+    const match = uploadObjectKey ? uploadObjectKey.match(regex) : null;
 
     const requestedAt = new Date().toISOString();
     let id = `${requestedAt}-${username}`;